@@ -0,0 +1,8 @@
+import os
+from django.core.asgi import get_asgi_application
+
+# Apunta al archivo settings dentro del paquete asistencia_qr.
+# Servir con un servidor ASGI, p. ej.: uvicorn asistencia_qr.asgi:application
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'asistencia_qr.settings')
+
+application = get_asgi_application()
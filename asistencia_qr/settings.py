@@ -1,6 +1,10 @@
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
+from core import almacenamiento, qr
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # MEJORA DE SEGURIDAD: Uso de variables de entorno
@@ -23,6 +27,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero: mide la latencia de toda la cadena (core/middleware.py, /metrics)
+    'core.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,14 +57,42 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'asistencia_qr.wsgi.application'
+ASGI_APPLICATION = 'asistencia_qr.asgi.application'
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'data.sqlite',
+        # PRAGMAs (WAL, synchronous, mmap, caché) en core/almacenamiento.py,
+        # aplicados por core.signals en cada conexión nueva.
+        'OPTIONS': {
+            **almacenamiento.OPCIONES_CONEXION,
+            # BEGIN IMMEDIATE: las transacciones (p. ej. /api/procesar-qr/batch/) toman
+            # el lock de escritura al inicio en vez de fallar al pasar de lectura a escritura.
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Los tests usan un archivo (en WAL, como producción) y no la base en memoria
+        # con caché compartida: ahí los bloqueos entre hilos fallan con "database
+        # table is locked" sin respetar el busy timeout.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_data.sqlite',
+        },
     }
 }
 
+# Caché en memoria de los hashes que no existen en la BD (ver core/roster.py).
+# TTL_NEGATIVO en segundos (un asistente registrado desde otro proceso puede tardar
+# TTL_NEGATIVO en ser reconocido si su QR se escaneó antes de registrarse).
+ROSTER_CACHE = {
+    'TTL_NEGATIVO': 30,
+    'MAX_NEGATIVOS': 5000,
+}
+
+# Ventana (segundos) en la que escaneos repetidos del mismo QR devuelven el
+# resultado anterior sin tocar la base de datos (0 = desactivada).
+# El escáner de escritorio usa el mismo valor por defecto (DEDUPE_SECONDS en main.py).
+DEDUPE_SEGUNDOS = 5
+
 LANGUAGE_CODE = 'es-es'
 
 # MEJORA: Timezone configurado a zona local (ej. Perú)
@@ -68,4 +102,35 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Imágenes QR generadas (<hash>.png), p. ej. por `python manage.py importar_padron`
+QR_DIR = BASE_DIR / 'qr'
+
+# Procesos para dibujar pases al exportar desde el admin (None = núcleos disponibles)
+CREDENCIALES_PROCESOS = None
+
+# /api/eventos/ (Server-Sent Events): eventos pendientes por cliente antes de descartar
+# los más viejos, y dirección UDP local donde el escáner de escritorio envía sus
+# resultados (None = no escuchar). Debe coincidir con EVENTS_UDP en main.py.
+EVENTOS_BUFFER = 100
+EVENTOS_UDP = ('127.0.0.1', 8765)
+
+# /metrics (formato Prometheus): si se define, exige 'Authorization: Bearer <token>'
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN') or None
+
+# Pases QR: los nuevos llevan un contenido compacto firmado con la variable de entorno
+# QR_CLAVE (core/qr.py; la misma en el servidor, el escáner de escritorio y los
+# comandos). QR_LEGADO acepta además los pases con el hash completo (64 hex); con
+# False solo se aceptan pases firmados. Los QR ajenos se rechazan sin consultar la BD.
+QR_LEGADO = True
+
+# La clave de desarrollo de core/qr.py es pública: en producción no se arranca sin QR_CLAVE
+if not DEBUG and not qr.CLAVE_DEFINIDA:
+    raise ImproperlyConfigured(
+        "Defina la variable de entorno QR_CLAVE: con DJANGO_DEBUG=False no se firma con la clave de desarrollo"
+    )
+
+# Clave de 'data': False = hash hex (TEXT) con rowid; True = digest de 32 bytes (BLOB)
+# en una tabla WITHOUT ROWID (188 MB -> 77 MB con 1 millón de asistentes). Solo la
+# lee la migración 0006; para cambiar una base ya migrada: `python manage.py clave_hash`.
+HASH_BINARIO = False
@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import queue
+import threading
+import time
+import decoders
+import sources
+from core import qr
+from gating import DecodeGate
+from main import FRAME_QUEUE_SIZE, GATE, SCAN_QUEUE_SIZE, StageStats, capture_stage, decode_stage
+
+# headless benchmark of the scanner pipeline (capture -> decode gate -> scan queue) on
+# synthetic badges: frames/s per stage, decode latency, time until a badge is read and
+# scan success rate. the db stage is replaced by a sink that timestamps each code, the
+# server side is measured with `python manage.py carga_escaneos` / `bench_sqlite`
+
+class TimedGate:
+    # times every DecodeGate.process call (decode latency per frame, skipped frames included)
+    def __init__(self, gate):
+        self.gate = gate
+        self.latencies = []
+
+    def process(self, frame):
+        start = time.perf_counter()
+        codes = self.gate.process(frame)
+        if codes is not None:
+            self.latencies.append(time.perf_counter() - start)
+        return codes
+
+    def summary(self):
+        return self.gate.summary()
+
+
+def sink_stage(scans, stop, first_seen):
+    # stands in for db_stage: remembers when each code reached the scan queue
+    while not stop.is_set() or not scans.empty():
+        try:
+            dat = scans.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        first_seen.setdefault(dat, time.perf_counter())
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[max(1, -(-p * len(values) // 100)) - 1]
+
+
+def badge_codes(args, label="bench", count=None):
+    codes = [hashlib.sha256(f"{label}:{n}".encode()).hexdigest() for n in range(count or args.badges)]
+    if args.payload == "compact":
+        codes = [qr.contenido_compacto(code) for code in codes]
+    return codes
+
+
+def calibrate(args):
+    # decoders.choose on frames with the same size and distortions as the benchmark
+    samples = decoders.sample_frames(badge_codes(args, "calibration", decoders.CALIBRATION_FRAMES), size=args.size,
+                                     rotation=args.rotation, blur=args.blur, noise=args.noise, seed=args.seed + 1,
+                                     badge_px=args.badge_px)
+    return decoders.choose(samples, fallback=not args.no_fallback)
+
+
+def run(decoder, gated, args):
+    codes = badge_codes(args)
+    source = sources.SyntheticSource(
+        codes, size=args.size, fps=args.fps, hold=args.hold, gap=args.gap,
+        rotation=args.rotation, blur=args.blur, noise=args.noise, seed=args.seed, badge_px=args.badge_px,
+    )
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    scans = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    stop = threading.Event()
+    stats = {"capture": StageStats(), "decode": StageStats()}
+    gate = TimedGate(DecodeGate(decoder, **dict(GATE, enabled=gated)))
+    first_seen = {}
+
+    class Latest:
+        # capture_stage / decode_stage publish here for the ui, nobody reads it in the benchmark
+        lock = threading.Lock()
+
+    start = time.perf_counter()
+    workers = [
+        threading.Thread(target=capture_stage, args=(source, frames, Latest, stop, stats["capture"])),
+        threading.Thread(target=decode_stage, args=(frames, scans, Latest, stop, stats["decode"], gate)),
+        threading.Thread(target=sink_stage, args=(scans, stop, first_seen)),
+    ]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    read = [first_seen[code] - at for code, at in zip(source.shown, source.appeared) if code in first_seen]
+    captured = source.frames
+    decoded = gate.gate.frames
+    return {
+        "gate": "on" if gated else "off",
+        "capture_fps": captured / elapsed,
+        "decode_fps": decoded / elapsed,
+        "dropped": stats["capture"].dropped,
+        "skipped": gate.gate.skipped,
+        "decode_p50": percentile(gate.latencies, 50) * 1000,
+        "decode_p99": percentile(gate.latencies, 99) * 1000,
+        "read_p50": percentile(read, 50) * 1000,
+        "read_p99": percentile(read, 99) * 1000,
+        "success": len(set(source.shown) & set(first_seen)) / len(source.shown),
+        "false_reads": len(set(first_seen) - set(codes)),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark the scanner pipeline on synthetic badges (headless)")
+    parser.add_argument("--decoder", default="auto",
+                        help="auto: calibration picks the backend (decoders.py); 'all': every available backend "
+                             "one after another; or a name / fallback chain like zxing+opencv (default: auto)")
+    parser.add_argument("--no-fallback", action="store_true", help="auto: no second backend on empty reads")
+    parser.add_argument("--badges", type=int, default=40, help="badges shown, one after another (default: 40)")
+    parser.add_argument("--size", default="640x480", help="frame size (default: 640x480)")
+    parser.add_argument("--fps", type=float, default=30, help="camera rate; 0 = as fast as possible (default: 30)")
+    parser.add_argument("--hold", type=int, default=15, help="frames each badge stays in view (default: 15)")
+    parser.add_argument("--gap", type=int, default=10, help="empty frames between badges (default: 10)")
+    parser.add_argument("--rotation", type=float, default=15.0, help="max rotation in degrees (default: 15)")
+    parser.add_argument("--blur", type=float, default=1.0, help="gaussian blur sigma (default: 1.0)")
+    parser.add_argument("--noise", type=float, default=8.0, help="sensor noise sigma (default: 8)")
+    parser.add_argument("--badge-px", default=None,
+                        help="min,max side of the badge in pixels, whatever its qr version "
+                             "(default: 3 to 5 pixels per module, so bigger versions make bigger badges)")
+    parser.add_argument("--payload", choices=("compact", "hash"), default="compact",
+                        help="badge content: signed compact code or the legacy 64-hex hash (default: compact)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gate", choices=("both", "on", "off"), default="both", help="decode gate (default: both)")
+    args = parser.parse_args()
+    args.size = tuple(int(v) for v in args.size.lower().split("x"))
+    if args.badge_px:
+        args.badge_px = tuple(int(v) for v in args.badge_px.split(","))
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.decoder == "auto":
+        spec, ranking = calibrate(args)
+        print("calibration:\n  " + "\n  ".join(decoders.report(ranking)))
+        specs = [spec]
+    elif args.decoder == "all":
+        specs = decoders.available()
+    else:
+        specs = [args.decoder]
+    print(f"{args.badges} badges at {args.size[0]}x{args.size[1]}, "
+          f"{args.payload} payload, {args.fps or 'unpaced'} fps, hold {args.hold}, blur {args.blur}, noise {args.noise}, "
+          f"rotation +-{args.rotation}")
+    for spec in specs:
+        for gated in {"both": (True, False), "on": (True,), "off": (False,)}[args.gate]:
+            r = run(decoders.create(spec), gated, args)
+            print(f"{spec:12s} gate {r['gate']:3s}  capture {r['capture_fps']:6.1f} fps  decode {r['decode_fps']:6.1f} fps  "
+                  f"dropped {r['dropped']:4d}  skipped {r['skipped']:4d}  "
+                  f"decode p50 {r['decode_p50']:6.1f} ms p99 {r['decode_p99']:6.1f} ms  "
+                  f"read p50 {r['read_p50']:6.0f} ms p99 {r['read_p99']:6.0f} ms  "
+                  f"success {100 * r['success']:5.1f}%  false reads {r['false_reads']}")
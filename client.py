@@ -0,0 +1,233 @@
+import http.client
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+from core import escaneo
+from journal import JOURNAL_PATH, REJECTED, Journal
+
+# client mode of the desktop scanner (main.py --server): scans go to the server's
+# batch api (/api/procesar-qr/batch/) instead of data.sqlite, so gates can run on
+# other machines. the journal is the same one: scans are fsync'ed locally first and
+# a background thread sends them, so an unreachable server only delays the answers
+
+BATCH_PATH = "/api/procesar-qr/batch/"
+BATCH_MAX = 50          # scans per request (the server takes up to MAX_LOTE = 500)
+HTTP_TIMEOUT = 5.0      # seconds to connect and to wait for each answer
+
+# answers of the scan api -> result codes of core/escaneo.py
+CODES = {"entrada": escaneo.ENTRADA, "salida": escaneo.SALIDA, "completado": escaneo.COMPLETADO}
+
+
+class ServerError(Exception):
+    # non-2xx answer; 409 (database busy, batch in flight) and 5xx are sent again as they are.
+    # any other 4xx is permanent: 400 / 413 refuse that batch (it is parked, see
+    # ClientJournal.park), the rest (401, 403, 404...) every batch of this gate
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+    @property
+    def transient(self):
+        return self.status == 409 or self.status >= 500
+
+    @property
+    def permanent(self):
+        return 400 <= self.status < 500 and not self.transient
+
+    @property
+    def rejects_batch(self):
+        return self.status in (400, 413)
+
+
+class ApiSession:
+    # one keep-alive connection to the server, reused by every request and
+    # reopened after an error (the client has a single sender thread)
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.base = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.connection = None
+        self.connections = 0    # connections opened so far (1 while the server keeps it alive)
+
+    def post_json(self, path, body):
+        if self.connection is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.connection = cls(self.host, self.port, timeout=self.timeout)
+            self.connections += 1
+        try:
+            self.connection.request("POST", self.base + path, json.dumps(body),
+                                    {"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # timeout, refused, reset or a keep-alive connection closed by the server
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        try:
+            answer = json.loads(data or b"{}")
+        except ValueError:
+            raise ServerError(response.status, "invalid json") from None
+        if not 200 <= response.status < 300:
+            raise ServerError(response.status, answer.get("message", response.reason))
+        return answer
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ClientJournal(Journal):
+    # Journal drained into the server's batch api: everything that piled up while the
+    # previous request was in flight goes in the next one (up to BATCH_MAX), so bursts
+    # are coalesced and a quiet gate still sends each scan right away.
+    # there is no local roster copy: every scan is answered PENDING and the server's
+    # result replaces it through on_result. the scan_id makes retries idempotent
+    # (the server keeps the result of every scan_id it applied)
+    RETRY_ERRORS = (OSError, http.client.HTTPException, ServerError)
+
+    def __init__(self, url, path=JOURNAL_PATH, device_id="desktop", on_result=None,
+                 batch_max=BATCH_MAX, timeout=HTTP_TIMEOUT):
+        self.session = ApiSession(url, timeout)
+        self.batch_max = batch_max
+        self.batches = 0
+        super().__init__(None, path=path, device_id=device_id, on_result=on_result)
+        self.target = url
+
+    def refresh(self):
+        # the roster stays on the server
+        self._last_refresh = time.monotonic()
+        return True
+
+    def resolve(self, key):
+        # compact badges are resolved by the server
+        return key
+
+    def transient(self, error):
+        return isinstance(error, ServerError) and error.transient
+
+    def permanent(self, error):
+        return isinstance(error, ServerError) and error.permanent
+
+    def drain(self):
+        while True:
+            with self._lock:
+                batch = self.pending[:self.batch_max]
+            if not batch:
+                break
+
+            try:
+                answer = self.session.post_json(BATCH_PATH, {"scans": [
+                    {"hash_id": entry.get("payload", entry["hash"]), "scan_id": entry["scan_id"],
+                     "scanned_at": entry["t"], "device_id": self.device_id}
+                    for entry in batch
+                ]})
+            except ServerError as e:
+                if not e.rejects_batch:
+                    raise
+                self.park(batch, e)
+                continue
+            results = answer.get("results")
+            if not isinstance(results, list) or len(results) != len(batch):
+                raise ServerError(200, "unexpected answer from the batch api")
+
+            with self._lock:
+                del self.pending[:len(batch)]
+                self.applied += len(batch)
+                self.batches += 1
+
+            if self.on_result is not None:
+                for entry, result in zip(batch, results):
+                    self.on_result(entry["hash"], self.result_code(entry, result))
+
+            # the batch is on the server: if the ack fails it is only resent after a restart,
+            # and the scan_id keeps the server from applying it twice
+            self._ack(batch)
+
+    def park(self, batch, error):
+        # the server refused this batch itself: sending it again cannot help, so it goes to
+        # the .rejected file (with the error, for a look by hand) and its scans are answered
+        # REJECTED instead of blocking the ones behind it forever
+        with open(self.rejected_path, "a", encoding="utf-8") as f:
+            for entry in batch:
+                f.write(json.dumps(dict(entry, error=str(error))) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            del self.pending[:len(batch)]
+            self.rejected += len(batch)
+        print(f"journal: {self.target} rejected {len(batch)} scans ({error}), kept in {self.rejected_path}",
+              file=sys.stderr)
+        if self.on_result is not None:
+            for entry in batch:
+                self.on_result(entry["hash"], (REJECTED, 0))
+        self._ack(batch)
+
+    def _ack(self, batch):
+        with self._lock:
+            self._write_ack(batch[-1]["seq"])
+            if not self.pending:
+                open(self.path, "w").close()
+
+    @staticmethod
+    def result_code(entry, result):
+        # (code, t) as returned by Journal.record; an invalid or unknown code is "not found"
+        code = CODES.get(result.get("type"), escaneo.NO_ENCONTRADO)
+        return code, entry["t"] if code in (escaneo.ENTRADA, escaneo.SALIDA) else 0
+
+    def stop(self, timeout=5.0):
+        super().stop(timeout)
+        self.session.close()
+
+
+if __name__ == "__main__":
+    # throughput check against a server (or standin_server.py): scans of random hashes,
+    # answered through the journal like in main.py
+    import argparse
+    import hashlib
+    import tempfile
+    import threading
+
+    from core import qr
+
+    parser = argparse.ArgumentParser(description="send scans to the batch api and time the answers")
+    parser.add_argument("--server", default="http://127.0.0.1:8001")
+    parser.add_argument("--scans", type=int, default=2000)
+    parser.add_argument("--batch-max", type=int, default=BATCH_MAX, help="1 = one request per scan")
+    args = parser.parse_args()
+
+    sent = {}
+    latencies = []
+    done = threading.Event()
+
+    def on_result(hashed, r):
+        latencies.append(time.perf_counter() - sent[hashed])
+        if len(latencies) == args.scans:
+            done.set()
+
+    with tempfile.TemporaryDirectory() as folder:
+        journal = ClientJournal(args.server, path=os.path.join(folder, "scans.journal"), device_id="bench",
+                                on_result=on_result, batch_max=args.batch_max)
+        journal.start()
+        start = time.perf_counter()
+        for n in range(args.scans):
+            hashed = hashlib.sha256(f"client:{n}:{start}".encode()).hexdigest()
+            sent[hashed] = time.perf_counter()
+            journal.record(hashed, payload=qr.contenido_compacto(hashed))
+        done.wait(60)
+        elapsed = time.perf_counter() - start
+        journal.stop()
+
+    latencies.sort()
+    print(f"{len(latencies)} scans in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} scans/s), "
+          f"{journal.batches} batches, {journal.session.connections} connection(s), {journal.retries} retries, "
+          f"answer p50 {1000 * latencies[len(latencies) // 2]:.1f} ms "
+          f"p99 {1000 * latencies[int(len(latencies) * 0.99)]:.1f} ms")
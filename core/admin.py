@@ -1,20 +1,153 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection, OperationalError
+from django.db.models import F, OuterRef, Subquery
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 import pytz
 from django.conf import settings
-from .models import Asistencia
+from django.http import StreamingHttpResponse
+from .escaneo import ENTRADA, SALIDA
+from .models import Asistencia, registro_abierto
+from .credenciales import exportar_zip
+from .exportacion import ESTADOS, con_horas, entrada_entre
+
+# Zona horaria local, creada una sola vez (no por fila)
+TZ_LOCAL = pytz.timezone(settings.TIME_ZONE)
+
+
+class ConteoEstimadoPaginator(Paginator):
+    """
+    Sin filtros ni búsqueda, el total se estima con MAX(rowid) (una búsqueda en el
+    árbol, no un recorrido de la tabla). Es exacto mientras no se borren filas y
+    solo se usa para numerar páginas; con filtros se cuenta normalmente, ya que
+    esas consultas van por los índices de 'registro' de la sesión abierta.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT MAX(_rowid_) FROM {self.object_list.model._meta.db_table}")
+                    return cursor.fetchone()[0] or 0
+            except OperationalError:
+                pass  # tabla sin rowid: se cuenta
+        return super().count
+
+
+class EstadoFilter(admin.SimpleListFilter):
+    # Opciones fijas: no hace falta recorrer la tabla para construir el filtro
+    title = "Estado"
+    parameter_name = 'estado'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('presente', "Presente (entró y no salió)"),
+            ('salio', "Ya salió"),
+            ('sin_llegar', "No ha llegado"),
+        )
+
+    def queryset(self, request, queryset):
+        # Las condiciones viven en core/exportacion.py (también las usa la exportación)
+        if self.value() in ESTADOS:
+            return queryset.filter(ESTADOS[self.value()])
+        return queryset
+
+
+class DiaEntradaFilter(admin.SimpleListFilter):
+    # Día de entrada (sesión abierta) en la zona horaria local, como rango de timestamps
+    # sobre el índice (sesion, tipo, ts) de 'registro'.
+    # Además de las opciones, acepta cualquier fecha: ?dia_entrada=2026-01-31
+    title = "Día de entrada"
+    parameter_name = 'dia_entrada'
+
+    def lookups(self, request, model_admin):
+        hoy = datetime.now(TZ_LOCAL).date()
+        return (
+            (hoy.isoformat(), "Hoy"),
+            ((hoy - timedelta(days=1)).isoformat(), "Ayer"),
+            ('7dias', "Últimos 7 días"),
+        )
+
+    @staticmethod
+    def _inicio(dia):
+        return int(TZ_LOCAL.localize(datetime.combine(dia, time.min)).timestamp())
+
+    def queryset(self, request, queryset):
+        valor = self.value()
+        if not valor:
+            return queryset
+        hoy = datetime.now(TZ_LOCAL).date()
+        if valor == '7dias':
+            desde, hasta = hoy - timedelta(days=6), hoy + timedelta(days=1)
+        else:
+            try:
+                desde = date.fromisoformat(valor)
+            except ValueError:
+                return queryset.none()
+            hasta = desde + timedelta(days=1)
+        return queryset.filter(entrada_entre(self._inicio(desde), self._inicio(hasta)))
+
 
 @admin.register(Asistencia)
 class AsistenciaAdmin(admin.ModelAdmin):
     # Campos a mostrar en la lista
     list_display = ('get_nombre_completo', 'get_documento', 'get_hora_entrada', 'get_hora_salida', 'get_duracion')
-    
+
     # Campos por los que se puede buscar
     search_fields = ('nombre', 'apellido', 'documento', 'id_hash')
-    
-    # Filtros laterales
-    list_filter = ('time_entry', 'time_exit')
+
+    # Filtros laterales (opciones fijas, ver EstadoFilter / DiaEntradaFilter)
+    list_filter = (EstadoFilter, DiaEntradaFilter)
+
+    # Tablas grandes: total estimado y sin el segundo COUNT(*) de "mostrar todos"
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False
+
+    actions = ['exportar_pases_png', 'exportar_hojas']
+
+    def get_queryset(self, request):
+        # Horas de la sesión abierta y duración calculadas en SQL (también permiten ordenar).
+        # Duración: la salida menos la entrada del mismo asistente (NULL si no salió)
+        entrada = registro_abierto(ENTRADA, id_hash=OuterRef('id_hash')).values('ts')[:1]
+        salida = registro_abierto(SALIDA, id_hash=OuterRef('id_hash')).annotate(
+            duracion=F('ts') - Subquery(entrada),
+        )
+        return con_horas(super().get_queryset(request)).annotate(
+            duracion=Subquery(salida.values('duracion')[:1]),
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Un hash completo se busca por la clave primaria: usa el índice y también
+        # funciona con la clave binaria, donde icontains no encuentra nada
+        termino = search_term.strip().lower()
+        if len(termino) == 64 and all(c in '0123456789abcdef' for c in termino):
+            return queryset.filter(id_hash=termino), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def _exportar(self, queryset, formato):
+        # El ZIP se arma mientras se descarga: la consulta se lee por partes (iterator)
+        filas = queryset.order_by('apellido', 'nombre').values_list(
+            'id_hash', 'nombre', 'apellido', 'documento'
+        ).iterator(chunk_size=2000)
+        respuesta = StreamingHttpResponse(
+            exportar_zip(filas, formato, procesos=getattr(settings, 'CREDENCIALES_PROCESOS', None),
+                         directorio_qr=settings.QR_DIR),
+            content_type='application/zip',
+        )
+        respuesta['Content-Disposition'] = f'attachment; filename="pases-{formato}.zip"'
+        return respuesta
+
+    @admin.action(description="Exportar pases QR seleccionados (ZIP de PNG)")
+    def exportar_pases_png(self, request, queryset):
+        return self._exportar(queryset, 'png')
+
+    @admin.action(description="Exportar hojas imprimibles de los seleccionados (ZIP)")
+    def exportar_hojas(self, request, queryset):
+        return self._exportar(queryset, 'hojas')
 
     def get_nombre_completo(self, obj):
         if obj.nombre and obj.apellido:
@@ -30,38 +163,31 @@ class AsistenciaAdmin(admin.ModelAdmin):
     def _format_timestamp(self, timestamp):
         if not timestamp or timestamp == 0:
             return "-"
-        
+
         # Convertir timestamp a zona horaria local configurada en settings
-        tz_local = pytz.timezone(settings.TIME_ZONE)
-        dt_utc = datetime.utcfromtimestamp(timestamp).replace(tzinfo=pytz.utc)
-        dt_local = dt_utc.astimezone(tz_local)
-        
-        return dt_local.strftime("%d/%m/%Y %H:%M:%S")
+        return datetime.fromtimestamp(timestamp, TZ_LOCAL).strftime("%d/%m/%Y %H:%M:%S")
 
     def get_hora_entrada(self, obj):
-        return self._format_timestamp(obj.time_entry)
+        return self._format_timestamp(obj.hora_entrada)
     get_hora_entrada.short_description = "Entrada"
-    get_hora_entrada.admin_order_field = 'time_entry'
+    get_hora_entrada.admin_order_field = 'hora_entrada'
 
     def get_hora_salida(self, obj):
-        return self._format_timestamp(obj.time_exit)
+        return self._format_timestamp(obj.hora_salida)
     get_hora_salida.short_description = "Salida"
-    get_hora_salida.admin_order_field = 'time_exit'
+    get_hora_salida.admin_order_field = 'hora_salida'
 
     def get_duracion(self, obj):
-        if obj.time_entry > 0 and obj.time_exit > 0:
-            entrada = datetime.utcfromtimestamp(obj.time_entry)
-            salida = datetime.utcfromtimestamp(obj.time_exit)
-            duracion = salida - entrada
-            
+        duracion = getattr(obj, 'duracion', None)
+        if duracion is not None:
             # Formato bonito: H horas, M minutos
-            total_seconds = int(duracion.total_seconds())
-            hours, remainder = divmod(total_seconds, 3600)
+            hours, remainder = divmod(int(duracion), 3600)
             minutes, seconds = divmod(remainder, 60)
-            
+
             return f"{hours}h {minutes}m {seconds}s"
-            
-        elif obj.time_entry > 0:
+
+        elif obj.hora_entrada > 0:
             return format_html('<span style="color:green;">En curso...</span>')
         return "-"
-    get_duracion.short_description = "Duración Estancia"
\ No newline at end of file
+    get_duracion.short_description = "Duración Estancia"
+    get_duracion.admin_order_field = 'duracion'
@@ -0,0 +1,169 @@
+"""
+Configuración común de SQLite para el servidor Django y el escáner de escritorio.
+
+Ambos procesos escriben el mismo archivo data.sqlite, así que deben usar el
+mismo modo de journal y el mismo busy timeout; si no, uno de los dos recibe
+"database is locked" en cuanto el otro escribe.
+
+Este módulo NO depende de Django:
+- Django: settings.DATABASES usa OPCIONES_CONEXION y core.signals aplica
+  configurar() en cada conexión nueva (señal connection_created).
+- Escritorio: database.py abre su conexión con conectar().
+
+También define el formato opcional de la clave de 'data' (ver convertir_hash()).
+"""
+import re
+import sqlite3
+
+# Milisegundos que una conexión espera el lock de escritura antes de fallar
+BUSY_TIMEOUT_MS = 5000
+
+# Sentencias preparadas que sqlite3 mantiene en caché por conexión
+CACHED_STATEMENTS = 256
+
+PRAGMAS = (
+    # WAL: los lectores no bloquean al escritor ni viceversa (persistente en el archivo)
+    ('journal_mode', 'WAL'),
+    # En WAL, NORMAL solo sincroniza en los checkpoints: mucho más rápido y sin riesgo de corrupción
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    # 256 MiB de lectura por mmap y ~20 MiB de caché de páginas (valor negativo = KiB)
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -20000),
+    ('temp_store', 'MEMORY'),
+)
+
+# Argumentos para sqlite3.connect(), también usados en DATABASES['default']['OPTIONS']
+OPCIONES_CONEXION = {
+    'timeout': BUSY_TIMEOUT_MS / 1000,
+    'cached_statements': CACHED_STATEMENTS,
+}
+
+
+def configurar(conexion):
+    """
+    Aplica PRAGMAS a una conexión sqlite3 ya abierta y registra clave_hash().
+    Retorna True si 'data' usa la clave binaria.
+    """
+    for nombre, valor in PRAGMAS:
+        conexion.execute(f'PRAGMA {nombre} = {valor}')
+    return registrar_funciones(conexion)
+
+
+# -- Clave binaria ----------------------------------------------------------
+#
+# Por defecto data.id_hash es el SHA256 en hex (64 caracteres, TEXT) y la tabla
+# tiene rowid: cada hash se guarda dos veces (tabla + índice de la clave
+# primaria). Con la clave binaria, 'data' es una tabla WITHOUT ROWID cuya clave
+# primaria es el digest de 32 bytes (BLOB), y registro.id_hash también es BLOB
+# (el estado de la sesión se lee uniendo ambas columnas directamente).
+#
+# Quien llama sigue usando el hash en hex: el SQL compartido envuelve cada
+# parámetro en clave_hash(), que cada conexión registra según el formato de su
+# base, y los valores leídos pasan por a_texto(). El formato se detecta del
+# esquema (no de un setting), así el servidor y el escáner de escritorio nunca
+# discrepan.
+
+# Tablas convertidas: (tabla, WITHOUT ROWID)
+TABLAS_HASH = (('data', True), ('registro', False))
+
+
+def hash_binario(conexion):
+    """True si data.id_hash está declarada como BLOB."""
+    fila = conexion.execute(
+        "SELECT type FROM pragma_table_info('data') WHERE name = 'id_hash'"
+    ).fetchone()
+    return fila is not None and fila[0].upper() == 'BLOB'
+
+
+def a_binario(valor):
+    """Hash hex -> 32 bytes. Lo que no es hex se deja igual (no coincide con ninguna clave)."""
+    if isinstance(valor, str):
+        try:
+            return bytes.fromhex(valor)
+        except ValueError:
+            pass
+    return valor
+
+
+def a_texto(valor):
+    """Valor leído de id_hash -> hash hex, sea cual sea el formato."""
+    return valor.hex() if isinstance(valor, bytes) else valor
+
+
+def _identidad(valor):
+    return valor
+
+
+def registrar_funciones(conexion, binario=None):
+    """
+    Registra clave_hash(x) en la conexión: a_binario() con la clave binaria,
+    identidad con la clave de texto. Retorna el formato registrado.
+    """
+    if binario is None:
+        binario = hash_binario(conexion)
+    conexion.create_function('clave_hash', 1, a_binario if binario else _identidad, deterministic=True)
+    return binario
+
+
+def _reconstruir(conexion, tabla, sin_rowid, binario):
+    # Misma técnica que el schema editor de Django: tabla nueva, copia, DROP y RENAME
+    sql = conexion.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,)).fetchone()[0]
+    sql = re.sub(r'("?id_hash"?\s+)(varchar\(64\)|BLOB)', r'\1' + ('BLOB' if binario else 'varchar(64)'),
+                 sql, count=1, flags=re.IGNORECASE)
+    sql = re.sub(r'\s*WITHOUT ROWID\s*$', '', sql.rstrip(), flags=re.IGNORECASE)
+    if binario and sin_rowid:
+        sql += ' WITHOUT ROWID'
+    nueva = f'{tabla}__nueva'
+    sql = re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE "{nueva}"', sql, count=1, flags=re.IGNORECASE)
+
+    columnas = [fila[0] for fila in conexion.execute(f"SELECT name FROM pragma_table_info('{tabla}')")]
+    conversion = '_a_binario' if binario else '_a_texto'
+    origen = ', '.join(f'{conversion}(id_hash)' if c == 'id_hash' else f'"{c}"' for c in columnas)
+
+    indices = [fila[0] for fila in conexion.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (tabla,))]
+
+    conexion.execute(sql)
+    destino = ', '.join(f'"{c}"' for c in columnas)
+    conexion.execute(f'INSERT INTO "{nueva}" ({destino}) SELECT {origen} FROM "{tabla}"')
+    conexion.execute(f'DROP TABLE "{tabla}"')
+    conexion.execute(f'ALTER TABLE "{nueva}" RENAME TO "{tabla}"')
+    for indice in indices:
+        conexion.execute(indice)
+
+
+def convertir_hash(cursor, binario):
+    """
+    Convierte en el lugar 'data' (y registro.id_hash) a la clave binaria
+    (binario=True) o de vuelta a la de texto. Retorna el formato resultante.
+
+    Reconstruye las tablas: debe ejecutarse dentro de una transacción y con el
+    servidor y el escáner de escritorio detenidos (sus conexiones registraron
+    clave_hash() con el formato anterior). Los triggers se retiran durante la
+    copia y se vuelven a crear tal cual.
+    """
+    # Directo sobre la conexión sqlite3 (misma transacción): el cursor de Django
+    # con DEBUG formatea los parámetros '?' para su registro de consultas
+    conexion = cursor.connection
+    if hash_binario(conexion) == binario:
+        return binario
+    conexion.create_function('_a_binario', 1, a_binario, deterministic=True)
+    conexion.create_function('_a_texto', 1, a_texto, deterministic=True)
+
+    triggers = conexion.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for nombre, _ in triggers:
+        conexion.execute(f'DROP TRIGGER "{nombre}"')
+    for tabla, sin_rowid in TABLAS_HASH:
+        _reconstruir(conexion, tabla, sin_rowid, binario)
+    for _, sql in triggers:
+        conexion.execute(sql)
+    return registrar_funciones(conexion, binario)
+
+
+def conectar(ruta, **kwargs):
+    """Abre una conexión sqlite3 con las mismas opciones que usa Django."""
+    opciones = dict(OPCIONES_CONEXION, **kwargs)
+    conexion = sqlite3.connect(ruta, **opciones)
+    configurar(conexion)
+    return conexion
@@ -0,0 +1,130 @@
+"""
+Ocupación y ritmo de llegadas.
+
+- Asistentes: se leen de la tabla 'contadores', que los triggers sobre 'data'
+  (migración 0007) mantienen al día en cada alta o baja. Leerlo es O(1).
+- Entradas, salidas y ocupación: conteos sobre 'registro' de la sesión abierta
+  (índice (sesion, tipo, ts)), así que el escaneo no escribe nada más que su fila.
+- Llegadas/salidas por intervalo y percentiles de permanencia: agregaciones SQL
+  sobre rangos de ese mismo índice.
+"""
+from django.db import connection, transaction
+
+from .escaneo import ENTRADA, SALIDA
+
+CLAVES = ('asistentes',)
+
+SQL_RECALCULAR = """
+    INSERT OR REPLACE INTO contadores (clave, valor)
+    SELECT 'asistentes', COUNT(*) FROM data
+"""
+
+SESION_ABIERTA = "(SELECT MAX(id) FROM sesion WHERE fin IS NULL)"
+
+SQL_POR_TIPO = f"""
+    SELECT tipo, COUNT(*) FROM registro
+    WHERE sesion_id = {SESION_ABIERTA}
+    GROUP BY tipo
+"""
+
+SQL_CONTAR = f"""
+    SELECT COUNT(*) FROM registro
+    WHERE sesion_id = {SESION_ABIERTA} AND tipo = :tipo AND ts >= :desde AND ts < :hasta
+"""
+
+SQL_POR_INTERVALO = f"""
+    SELECT tipo, (ts / :intervalo) * :intervalo AS inicio, COUNT(*)
+    FROM registro
+    WHERE sesion_id = {SESION_ABIERTA} AND tipo IN (1, 2) AND ts >= :desde AND ts < :hasta
+    GROUP BY tipo, inicio
+"""
+
+# Cada salida con la entrada del mismo asistente y sesión (índice único del registro).
+# Un solo ordenamiento para todos los percentiles (ROW_NUMBER sobre la permanencia)
+SQL_PERMANENCIA = f"""
+    SELECT n, rn, duracion FROM (
+        SELECT s.ts - e.ts AS duracion,
+               ROW_NUMBER() OVER (ORDER BY s.ts - e.ts) AS rn,
+               COUNT(*) OVER () AS n
+        FROM registro s
+        JOIN registro e ON e.sesion_id = s.sesion_id AND e.id_hash = s.id_hash AND e.tipo = 1
+        WHERE s.sesion_id = {SESION_ABIERTA} AND s.tipo = 2 AND s.ts >= :desde AND s.ts < :hasta
+    )
+    WHERE rn IN ({{posiciones}})
+"""
+
+PERCENTILES = (50, 90, 99)
+
+
+def totales():
+    """
+    Asistentes desde 'contadores' (si falta, se recalcula una vez) y entradas/salidas
+    de la sesión abierta contadas en el índice de 'registro'.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT clave, valor FROM contadores")
+        valores = dict(cursor.fetchall())
+        if any(clave not in valores for clave in CLAVES):
+            recalcular()
+            cursor.execute("SELECT clave, valor FROM contadores")
+            valores = dict(cursor.fetchall())
+        cursor.execute(SQL_POR_TIPO)
+        por_tipo = dict(cursor.fetchall())
+
+    entradas, salidas = por_tipo.get(ENTRADA, 0), por_tipo.get(SALIDA, 0)
+    return {
+        'asistentes': valores['asistentes'],
+        'entradas': entradas,
+        'salidas': salidas,
+        'ocupacion': entradas - salidas,
+        'sin_llegar': valores['asistentes'] - entradas,
+    }
+
+
+def recalcular():
+    """Recalcula los contadores recorriendo 'data' (solo hace falta si se vació 'contadores')."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SQL_RECALCULAR)
+
+
+def contar(tipo, desde, hasta):
+    """Entradas (tipo ENTRADA) o salidas (SALIDA) de la sesión abierta en [desde, hasta), por rango del índice."""
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_CONTAR, {'tipo': tipo, 'desde': desde, 'hasta': hasta})
+        return cursor.fetchone()[0]
+
+
+def por_intervalo(desde, hasta, intervalo):
+    """
+    Llegadas y salidas por intervalo de `intervalo` segundos en [desde, hasta).
+    Los intervalos sin movimiento también se incluyen (con 0).
+    """
+    campos = {ENTRADA: 'llegadas', SALIDA: 'salidas'}
+    conteos = {}
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_POR_INTERVALO, {'desde': desde, 'hasta': hasta, 'intervalo': intervalo})
+        for tipo, inicio, n in cursor.fetchall():
+            conteos.setdefault(inicio, {'llegadas': 0, 'salidas': 0})[campos[tipo]] = n
+
+    primero = (desde // intervalo) * intervalo
+    return [
+        {'inicio': inicio, **conteos.get(inicio, {'llegadas': 0, 'salidas': 0})}
+        for inicio in range(primero, hasta, intervalo)
+    ]
+
+
+def permanencia(desde, hasta):
+    """Percentiles (segundos) de la permanencia de quienes salieron en [desde, hasta)."""
+    n = contar(SALIDA, desde, hasta)
+    if not n:
+        return {'salidas': 0, **{f'p{p}': None for p in PERCENTILES}}
+
+    # Percentil por rango más cercano
+    posiciones = {p: max(1, -(-p * n // 100)) for p in PERCENTILES}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SQL_PERMANENCIA.format(posiciones=', '.join(str(k) for k in sorted(set(posiciones.values())))),
+            {'desde': desde, 'hasta': hasta},
+        )
+        por_posicion = {rn: duracion for _, rn, duracion in cursor.fetchall()}
+    return {'salidas': n, **{f'p{p}': por_posicion.get(k) for p, k in posiciones.items()}}
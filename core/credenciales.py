@@ -0,0 +1,136 @@
+"""
+Exportación masiva de pases (credenciales) en un ZIP que se escribe por partes.
+
+- formato 'png': un PNG por asistente (el mismo de /qr/<hash>.png).
+- formato 'hojas': hojas A4 (PNG a 150 dpi) con POR_HOJA pases para imprimir.
+
+Los PNG se dibujan en un pool de procesos (core/paralelo.py) y usan la caché en
+disco de core/qr.py; el ZIP se entrega en trozos de bytes a medida que se
+escribe, así que la memoria no crece con el tamaño del padrón.
+Este módulo NO depende de Django.
+"""
+import io
+import os
+import re
+import tempfile
+import unicodedata
+import zipfile
+
+from PIL import Image, ImageDraw, ImageFont
+
+from . import qr
+from .paralelo import en_lotes, en_paralelo
+
+FORMATOS = ('png', 'hojas')
+
+# Pases por lote enviado a cada proceso en formato 'png'
+LOTE_PNG = 50
+
+# A4 a 150 dpi, 3 columnas x 4 filas
+HOJA = (1240, 1754)
+COLUMNAS = 3
+FILAS = 4
+POR_HOJA = COLUMNAS * FILAS
+LADO_QR = 330
+
+
+class _Salida(io.RawIOBase):
+    # Destino no seekable para ZipFile: acumula lo escrito hasta que se retira
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def retirar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _nombre_archivo(hash_id, nombre, apellido):
+    ascii_ = unicodedata.normalize('NFKD', f"{apellido or ''}_{nombre or ''}").encode('ascii', 'ignore').decode()
+    legible = re.sub(r'[^A-Za-z0-9]+', '_', ascii_).strip('_')
+    return f"{legible + '_' if legible else ''}{hash_id[:8]}.png"
+
+
+def _png(directorio_qr, hash_id):
+    qr.guardar_png(directorio_qr, hash_id)
+    with open(qr.ruta_png(directorio_qr, hash_id), 'rb') as f:
+        return f.read()
+
+
+def _fuente(tamano):
+    try:
+        return ImageFont.load_default(size=tamano)
+    except (TypeError, OSError):
+        # Pillow sin FreeType: fuente bitmap de tamaño fijo
+        return ImageFont.load_default()
+
+
+def _hoja(filas, directorio_qr):
+    hoja = Image.new('L', HOJA, 255)
+    dibujo = ImageDraw.Draw(hoja)
+    fuente = _fuente(26)
+    ancho, alto = HOJA[0] // COLUMNAS, HOJA[1] // FILAS
+    for n, (hash_id, nombre, apellido, documento) in enumerate(filas):
+        x, y = (n % COLUMNAS) * ancho, (n // COLUMNAS) * alto
+        imagen = Image.open(io.BytesIO(_png(directorio_qr, hash_id))).convert('L')
+        imagen = imagen.resize((LADO_QR, LADO_QR), Image.NEAREST)
+        hoja.paste(imagen, (x + (ancho - LADO_QR) // 2, y + 20))
+        texto = f"{nombre or ''} {apellido or ''}".strip() or hash_id[:8]
+        dibujo.text((x + ancho // 2, y + LADO_QR + 40), texto, fill=0, font=fuente, anchor='mt')
+        dibujo.text((x + ancho // 2, y + LADO_QR + 75), documento or '', fill=0, font=fuente, anchor='mt')
+        dibujo.rectangle((x + 5, y + 5, x + ancho - 5, y + alto - 5), outline=180)
+    buffer = io.BytesIO()
+    hoja.save(buffer, format='PNG', optimize=False)
+    return buffer.getvalue()
+
+
+def preparar_lote(lote, formato, directorio_qr):
+    """
+    Proceso hijo. lote = (numero, [(hash_id, nombre, apellido, documento)]).
+    Retorna [(nombre_en_el_zip, bytes_png)].
+    """
+    numero, filas = lote
+    if formato == 'hojas':
+        return [(f"hoja-{numero + 1:05d}.png", _hoja(filas, directorio_qr))]
+    return [(_nombre_archivo(hash_id, nombre, apellido), _png(directorio_qr, hash_id))
+            for hash_id, nombre, apellido, documento in filas]
+
+
+def exportar_zip(filas, formato='png', procesos=None, directorio_qr=None):
+    """
+    Generador con los bytes del ZIP, en trozos, listo para StreamingHttpResponse
+    o para escribir a un archivo.
+    filas: iterable de (hash_id, nombre, apellido, documento), se lee por partes.
+    Sin directorio_qr los PNG se dibujan en una carpeta temporal (sin caché).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato desconocido: {formato}")
+    procesos = procesos or os.cpu_count() or 1
+    temporal = None
+    if directorio_qr is None:
+        temporal = tempfile.TemporaryDirectory()
+        directorio_qr = temporal.name
+    else:
+        os.makedirs(directorio_qr, exist_ok=True)
+
+    salida = _Salida()
+    tamano = POR_HOJA if formato == 'hojas' else LOTE_PNG
+    lotes = enumerate(en_lotes(filas, tamano))
+    try:
+        # Los PNG ya están comprimidos: ZIP_STORED evita recomprimirlos
+        with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo:
+            for resultado in en_paralelo(preparar_lote, lotes, procesos, formato, directorio_qr):
+                for nombre, datos in resultado:
+                    archivo.writestr(nombre, datos)
+                yield salida.retirar()
+        yield salida.retirar()
+    finally:
+        if temporal is not None:
+            temporal.cleanup()
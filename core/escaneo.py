@@ -0,0 +1,211 @@
+"""
+Máquina de estados Entrada -> Salida compartida por la API web (core.views)
+y el escáner de escritorio (database.py).
+
+Este módulo NO depende de Django: recibe un cursor DB-API de sqlite3 (el
+cursor de Django para el backend sqlite3 también sirve) para que ambos
+procesos apliquen exactamente la misma transición (ver SQL_TRANSICION).
+
+El hash se pasa siempre en hex: el SQL lo envuelve en clave_hash(), que
+core/almacenamiento.py registra en cada conexión según el formato de la clave
+de 'data' (texto o binaria).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from . import almacenamiento
+
+# Códigos de resultado (los mismos que usaba database.entryAction)
+NO_ENCONTRADO = -1
+COMPLETADO = 0
+ENTRADA = 1
+SALIDA = 2
+
+# Nombre de cada resultado en las respuestas y eventos
+TIPOS = {NO_ENCONTRADO: 'no_encontrado', COMPLETADO: 'completado', ENTRADA: 'entrada', SALIDA: 'salida'}
+
+# Transición en UNA sola sentencia: un INSERT en el registro append-only ('registro')
+# de la sesión abierta. El estado se deriva del propio registro:
+# - 0 filas del hash en la sesión -> se inserta la entrada (tipo 1 = ENTRADA).
+# - 1 fila -> se inserta la salida (tipo 2 = SALIDA).
+# - 2 filas (ciclo completo) o hash inexistente en 'data' -> el SELECT no produce
+#   filas y no se escribe nada.
+# El INSERT ... SELECT se evalúa con el lock de escritura tomado, y el índice único
+# (sesion_id, id_hash, tipo) impide dos entradas aunque dos lectores coincidan.
+# Es la única escritura del escaneo: 'registro' no tiene triggers y nada se
+# actualiza en 'data' ni en 'contadores' (el estado y la ocupación se leen del
+# propio registro, ver SQL_ESTADO y core/analitica.py).
+SQL_TRANSICION = """
+    INSERT INTO registro (sesion_id, id_hash, tipo, ts)
+    SELECT s.id, clave_hash(:hash_id), COUNT(r.id) + 1, :ahora
+    FROM sesion s
+    LEFT JOIN registro r ON r.sesion_id = s.id AND r.id_hash = clave_hash(:hash_id)
+    WHERE s.id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL)
+      AND EXISTS (SELECT 1 FROM data WHERE id_hash = clave_hash(:hash_id))
+    GROUP BY s.id
+    HAVING COUNT(r.id) < 2
+    RETURNING tipo, (SELECT nombre FROM data WHERE id_hash = clave_hash(:hash_id))
+"""
+
+# Solo se usa cuando el INSERT no escribe nada: ciclo completado, hash inexistente
+# o ninguna sesión abierta (base recién creada o vaciada).
+SQL_CONSULTA = """
+    SELECT nombre, (SELECT MAX(id) FROM sesion WHERE fin IS NULL)
+    FROM data WHERE id_hash = clave_hash(:hash_id)
+"""
+
+
+def registrar_escaneo(cursor, hash_id, ahora=None):
+    """
+    Aplica la transición de asistencia para un hash en la sesión abierta.
+
+    Retorna una tupla (codigo, timestamp, nombre):
+    - (ENTRADA, ts, nombre) / (SALIDA, ts, nombre) si se registró algo.
+    - (COMPLETADO, 0, nombre) si ya tenía entrada y salida en esta sesión.
+    - (NO_ENCONTRADO, 0, None) si el hash no existe.
+
+    El commit queda a cargo de quien llama (autocommit en Django,
+    connection.commit() en el escáner de escritorio).
+    """
+    if ahora is None:
+        ahora = int(time.time())
+
+    parametros = {'hash_id': hash_id, 'ahora': ahora}
+    cursor.execute(SQL_TRANSICION, parametros)
+    # fetchall() agota el RETURNING: SQLite no da por terminada la sentencia
+    # (ni libera el lock de escritura) hasta leer todas sus filas.
+    filas = cursor.fetchall()
+    if filas:
+        tipo, nombre = filas[0]
+        return (tipo, ahora, nombre)
+
+    cursor.execute(SQL_CONSULTA, parametros)
+    fila = cursor.fetchone()
+    if fila is None:
+        return (NO_ENCONTRADO, 0, None)
+    nombre, sesion_abierta = fila
+    if sesion_abierta is None:
+        # Condicional: si otro escáner la abrió primero, se usa esa
+        cursor.execute(
+            "INSERT INTO sesion (nombre, inicio, fin) SELECT '', :ahora, NULL "
+            "WHERE NOT EXISTS (SELECT 1 FROM sesion WHERE fin IS NULL)",
+            parametros,
+        )
+        return registrar_escaneo(cursor, hash_id, ahora)
+    return (COMPLETADO, 0, nombre)
+
+
+# Hash completo a partir del prefijo de un pase compacto (core/qr.py): un rango
+# sobre el índice de la clave primaria, del prefijo completado con '0' al completado
+# con 'f' (vale igual para la clave de texto y para la binaria).
+SQL_PREFIJO = """
+    SELECT id_hash FROM data
+    WHERE id_hash BETWEEN clave_hash(:desde) AND clave_hash(:hasta)
+    LIMIT 1
+"""
+
+
+def resolver_prefijo(cursor, prefijo):
+    """Retorna el hash del asistente cuyo hash empieza con `prefijo`, o None."""
+    cursor.execute(SQL_PREFIJO, {'desde': prefijo.ljust(64, '0'), 'hasta': prefijo.ljust(64, 'f')})
+    fila = cursor.fetchone()
+    return almacenamiento.a_texto(fila[0]) if fila else None
+
+
+# Hora de entrada y de salida (0 = sin registrar) de cada asistente en la sesión
+# abierta: dos búsquedas por el índice único del registro. Quien la usa agrega su
+# WHERE / ORDER BY sobre d.id_hash.
+SQL_ESTADO = """
+    SELECT d.id_hash, COALESCE(e.ts, 0), COALESCE(s.ts, 0)
+    FROM data d
+    LEFT JOIN registro e ON e.sesion_id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL)
+        AND e.id_hash = d.id_hash AND e.tipo = 1
+    LEFT JOIN registro s ON s.sesion_id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL)
+        AND s.id_hash = d.id_hash AND s.tipo = 2
+"""
+
+
+def abrir_sesion(cursor, nombre='', ahora=None):
+    """Crea una sesión abierta y retorna su id (no cierra las anteriores)."""
+    cursor.execute(
+        "INSERT INTO sesion (nombre, inicio, fin) VALUES (:nombre, :ahora, NULL)",
+        {'nombre': nombre, 'ahora': int(time.time()) if ahora is None else ahora},
+    )
+    return cursor.lastrowid
+
+
+def rotar_sesion(cursor, nombre='', ahora=None):
+    """
+    Cierra la sesión abierta y abre otra. Retorna (id_cerrada, id_nueva);
+    id_cerrada es None si no había ninguna abierta.
+
+    Lo registrado en la sesión cerrada queda archivado en 'registro'. Como el estado
+    de los asistentes se deriva de las filas de la sesión abierta, la nueva empieza
+    vacía sin reescribir 'data': son dos sentencias sobre 'sesion', sin importar el
+    tamaño del padrón. Debe ejecutarse dentro de una transacción.
+    """
+    if ahora is None:
+        ahora = int(time.time())
+    cursor.execute("SELECT MAX(id) FROM sesion WHERE fin IS NULL")
+    cerrada = cursor.fetchone()[0]
+    cursor.execute("UPDATE sesion SET fin = :ahora WHERE fin IS NULL", {'ahora': ahora})
+    nueva = abrir_sesion(cursor, nombre, ahora)
+    return cerrada, nueva
+
+
+class VentanaDuplicados:
+    """
+    Recuerda el último resultado de cada hash durante `segundos`.
+
+    Un QR sostenido frente a la cámara (o el lector web enviando cada cuadro)
+    produce varios escaneos seguidos: dentro de la ventana se devuelve el
+    resultado anterior sin tocar la base de datos, en vez de convertir la
+    entrada recién registrada en una salida.
+
+    Las entradas se guardan en orden de llegada, así que las vencidas se
+    descartan desde el principio del diccionario; max_entradas acota la memoria.
+    Con segundos = 0 la ventana queda desactivada.
+    """
+
+    def __init__(self, segundos=5, max_entradas=10000):
+        self.segundos = segundos
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.repetidos = 0
+
+    def consultar(self, hash_id, ahora=None):
+        """Retorna el resultado guardado si el hash se escaneó hace menos de `segundos`, o None."""
+        if self.segundos <= 0:
+            return None
+        if ahora is None:
+            ahora = time.time()
+        with self._lock:
+            self._purgar(ahora)
+            item = self._datos.get(hash_id)
+            if item is None or abs(ahora - item[0]) >= self.segundos:
+                return None
+            self.repetidos += 1
+            return item[1]
+
+    def guardar(self, hash_id, resultado, ahora=None):
+        if self.segundos <= 0:
+            return
+        if ahora is None:
+            ahora = time.time()
+        with self._lock:
+            self._datos[hash_id] = (ahora, resultado)
+            self._datos.move_to_end(hash_id)
+            self._purgar(ahora)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def _purgar(self, ahora):
+        while self._datos:
+            instante, _ = next(iter(self._datos.values()))
+            if len(self._datos) <= self.max_entradas and ahora - instante < self.segundos:
+                break
+            self._datos.popitem(last=False)
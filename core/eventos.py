@@ -0,0 +1,195 @@
+"""
+Difusión en vivo de los resultados de escaneo (Server-Sent Events).
+
+- Difusor: fan-out en memoria, dentro del proceso. Cada suscriptor tiene un
+  buffer acotado; si un cliente lento lo llena se descartan sus eventos más
+  viejos (y se le avisa), nunca se bloquea al escaneo que publica.
+- Los escaneos del servidor se publican desde aplicar_escaneo (views.py) al
+  confirmarse la transacción. El escáner de escritorio es otro proceso: envía
+  cada resultado como un datagrama UDP a EVENTOS_UDP, que un hilo de este
+  proceso (ReceptorUDP) vuelve a publicar. Si el servidor no está, el datagrama
+  se pierde sin afectar al escáner.
+
+- /api/eventos/ espera con esperar() (un hilo por cliente) bajo WSGI y con
+  esperar_async() (en el event loop, sin ocupar un hilo) bajo ASGI.
+
+Límite conocido: el fan-out es por proceso. Con varios workers, cada /api/eventos/
+solo ve los escaneos atendidos por su propio proceso; para pantallas en vivo se
+usa un único proceso con hilos (p. ej. runserver o gunicorn --threads).
+Este módulo NO depende de Django.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from collections import deque
+
+# Eventos recientes que se reenvían a un cliente que se reconecta con Last-Event-ID
+HISTORIAL = 256
+
+# Eventos pendientes por suscriptor antes de descartar los más viejos
+BUFFER = 100
+
+# Caracteres del hash que se publican (el hash completo es la credencial)
+PREFIJO_HASH = 8
+
+
+class Suscripcion:
+
+    def __init__(self, buffer):
+        self._eventos = deque(maxlen=buffer)
+        self._cond = threading.Condition()
+        self._aviso = None      # (loop, asyncio.Event) de un esperar_async() en curso
+        self.perdidos = 0
+
+    def _entregar(self, evento):
+        with self._cond:
+            if len(self._eventos) == self._eventos.maxlen:
+                self.perdidos += 1
+            self._eventos.append(evento)
+            self._cond.notify()
+            aviso = self._aviso
+        if aviso is not None:
+            # Se publica desde cualquier hilo: el Event se marca dentro de su loop
+            loop, listo = aviso
+            try:
+                loop.call_soon_threadsafe(listo.set)
+            except RuntimeError:
+                pass    # loop cerrado: el cliente ya no espera
+
+    def _tomar(self):
+        eventos = list(self._eventos)
+        self._eventos.clear()
+        perdidos, self.perdidos = self.perdidos, 0
+        return eventos, perdidos
+
+    def esperar(self, timeout):
+        """Retorna (eventos, perdidos) pendientes; espera hasta `timeout` si no hay ninguno."""
+        with self._cond:
+            if not self._eventos:
+                self._cond.wait(timeout)
+            return self._tomar()
+
+    async def esperar_async(self, timeout):
+        """Como esperar(), pero espera en el event loop que la llama sin bloquear un hilo."""
+        with self._cond:
+            if self._eventos:
+                return self._tomar()
+            listo = asyncio.Event()
+            self._aviso = (asyncio.get_running_loop(), listo)
+        try:
+            await asyncio.wait_for(listo.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._aviso = None
+        with self._cond:
+            return self._tomar()
+
+
+class Difusor:
+
+    def __init__(self, buffer=BUFFER, historial=HISTORIAL):
+        self.buffer = buffer
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self._historial = deque(maxlen=historial)
+        self._ultimo_id = 0
+        self.publicados = 0
+
+    def suscribir(self, ultimo_id=None):
+        """
+        Registra un suscriptor. Con `ultimo_id` (Last-Event-ID) recibe primero los
+        eventos posteriores que sigan en el historial.
+        """
+        sus = Suscripcion(self.buffer)
+        with self._lock:
+            self._suscripciones.add(sus)
+            if ultimo_id is not None:
+                for evento in self._historial:
+                    if evento['id'] > ultimo_id:
+                        sus._entregar(evento)
+        return sus
+
+    def cancelar(self, sus):
+        with self._lock:
+            self._suscripciones.discard(sus)
+
+    def publicar(self, datos):
+        """Asigna id al evento y lo entrega a todos los suscriptores sin bloquear."""
+        with self._lock:
+            self._ultimo_id += 1
+            evento = {'id': self._ultimo_id, **datos}
+            self._historial.append(evento)
+            suscripciones = list(self._suscripciones)
+            self.publicados += 1
+        for sus in suscripciones:
+            sus._entregar(evento)
+        return evento
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'suscriptores': len(self._suscripciones),
+                'publicados': self.publicados,
+                'ultimo_id': self._ultimo_id,
+            }
+
+
+def evento_escaneo(hash_id, tipo, ts, nombre=None, origen='web'):
+    """Datos publicados por cada escaneo (sin el hash completo)."""
+    return {
+        'hash': hash_id[:PREFIJO_HASH],
+        'nombre': nombre,
+        'tipo': tipo,
+        'ts': ts or int(time.time()),
+        'origen': origen,
+    }
+
+
+def formatear_sse(evento):
+    return f"id: {evento['id']}\nevent: escaneo\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+class EmisorUDP:
+    # Lado del escáner de escritorio: un datagrama por resultado, sin esperar respuesta
+    def __init__(self, direccion):
+        self.direccion = tuple(direccion)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def enviar(self, hash_id, tipo, ts, origen='escritorio'):
+        datos = json.dumps({'hash_id': hash_id, 'tipo': tipo, 'ts': ts, 'origen': origen}).encode()
+        try:
+            self._socket.sendto(datos, self.direccion)
+        except OSError:
+            pass  # sin servidor escuchando: el evento se pierde, el escaneo no
+
+
+class ReceptorUDP(threading.Thread):
+    # Lado del servidor: publica en `difusor` los datagramas de EmisorUDP
+    def __init__(self, difusor, direccion, completar=None):
+        super().__init__(daemon=True)
+        self.difusor = difusor
+        self.direccion = tuple(direccion)
+        self.completar = completar      # completar(hash_id) -> nombre o None
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(self.direccion)
+
+    def run(self):
+        while True:
+            try:
+                datos, _ = self.socket.recvfrom(4096)
+                mensaje = json.loads(datos)
+                hash_id = str(mensaje['hash_id'])
+                nombre = self.completar(hash_id) if self.completar else None
+                self.difusor.publicar(evento_escaneo(
+                    hash_id, str(mensaje['tipo']), int(mensaje.get('ts') or 0), nombre,
+                    str(mensaje.get('origen', 'escritorio')),
+                ))
+            except (ValueError, KeyError, TypeError):
+                continue    # datagrama mal formado
+            except OSError:
+                break
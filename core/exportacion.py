@@ -0,0 +1,158 @@
+"""
+Exportación de la asistencia (CSV / JSONL) en streaming.
+
+Las filas se leen con .iterator(chunk_size) y se entregan en trozos de texto,
+así que la memoria no depende del tamaño de la tabla. La usan la vista
+exportar_asistencia y el comando `python manage.py exportar_asistencia`.
+"""
+import csv
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytz
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .escaneo import ENTRADA, SALIDA
+from .models import registro_abierto
+
+FORMATOS = ('csv', 'jsonl')
+
+# Mismos estados que el filtro del admin, según el registro de la sesión abierta
+# (subconsultas sobre el índice único de 'registro')
+ESTADOS = {
+    'presente': Q(id_hash__in=registro_abierto(ENTRADA).values('id_hash'))
+                & ~Q(id_hash__in=registro_abierto(SALIDA).values('id_hash')),
+    'salio': Q(id_hash__in=registro_abierto(SALIDA).values('id_hash')),
+    'sin_llegar': ~Q(id_hash__in=registro_abierto(ENTRADA).values('id_hash')),
+}
+
+COLUMNAS = ('id_hash', 'nombre', 'apellido', 'documento', 'hora_entrada', 'hora_salida')
+# time_entry / time_exit: timestamps Unix (0 = sin registrar), como en la tabla original
+ENCABEZADO = ('id_hash', 'nombre', 'apellido', 'documento', 'time_entry', 'time_exit',
+              'entrada', 'salida', 'duracion_segundos')
+
+# Filas por trozo entregado al cliente
+FILAS_POR_TROZO = 500
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class HoraLocal:
+    """
+    Formatea timestamps Unix como ISO 8601 en la zona horaria local.
+    La zona se crea una vez y el desfase UTC se calcula una vez por hora de
+    timestamps (los cambios de horario ocurren en horas exactas), no por fila.
+    """
+
+    def __init__(self, zona):
+        self.tz = pytz.timezone(zona) if isinstance(zona, str) else zona
+        self._desfases = {}
+
+    def __call__(self, ts):
+        if not ts:
+            return ''
+        hora = ts // 3600
+        desfase = self._desfases.get(hora)
+        if desfase is None:
+            desfase = self._desfases[hora] = self._calcular(hora * 3600)
+        segundos, sufijo = desfase
+        return (_EPOCH + timedelta(seconds=ts + segundos)).isoformat() + sufijo
+
+    def _calcular(self, ts):
+        if len(self._desfases) > 10000:
+            self._desfases.clear()
+        delta = datetime.fromtimestamp(ts, self.tz).utcoffset()
+        segundos = int(delta.total_seconds())
+        signo = '-' if segundos < 0 else '+'
+        horas, minutos = divmod(abs(segundos) // 60, 60)
+        return segundos, f"{signo}{horas:02d}:{minutos:02d}"
+
+
+def parsear_instante(valor, tz):
+    """
+    Acepta un timestamp Unix o una fecha/fecha-hora ISO (sin zona = hora local).
+    Retorna el timestamp Unix; ValueError si no se entiende.
+    """
+    valor = valor.strip()
+    if valor.lstrip('-').isdigit():
+        return int(valor)
+    try:
+        instante = datetime.fromisoformat(valor)
+    except ValueError:
+        instante = datetime.combine(date.fromisoformat(valor), datetime.min.time())
+    if instante.tzinfo is None:
+        instante = tz.localize(instante)
+    return int(instante.astimezone(timezone.utc).timestamp())
+
+
+def hora(tipo):
+    """Hora (Unix, 0 si no hay) de la entrada o salida de cada fila en la sesión abierta."""
+    return Coalesce(Subquery(registro_abierto(tipo, id_hash=OuterRef('id_hash')).values('ts')[:1]), 0)
+
+
+def con_horas(queryset):
+    """Anota hora_entrada y hora_salida (ver hora())."""
+    return queryset.annotate(hora_entrada=hora(ENTRADA), hora_salida=hora(SALIDA))
+
+
+def entrada_entre(desde=None, hasta=None):
+    """Q de quienes entraron en [desde, hasta) en la sesión abierta (rango del índice de 'registro')."""
+    filtros = {}
+    if desde is not None:
+        filtros['ts__gte'] = desde
+    if hasta is not None:
+        filtros['ts__lt'] = hasta
+    return Q(id_hash__in=registro_abierto(ENTRADA, **filtros).values('id_hash'))
+
+
+def filtrar(queryset, estado=None, desde=None, hasta=None):
+    """Filtra por estado (ESTADOS) y por rango [desde, hasta) de la hora de entrada."""
+    if estado:
+        queryset = queryset.filter(ESTADOS[estado])
+    if desde is not None or hasta is not None:
+        queryset = queryset.filter(entrada_entre(desde, hasta))
+    return queryset
+
+
+def _filas(queryset, hora_local, chunk_size):
+    for id_hash, nombre, apellido, documento, entrada, salida in (
+        con_horas(queryset.order_by()).values_list(*COLUMNAS).iterator(chunk_size=chunk_size)
+    ):
+        yield (
+            id_hash, nombre or '', apellido or '', documento or '', entrada, salida,
+            hora_local(entrada), hora_local(salida),
+            salida - entrada if entrada and salida else None,
+        )
+
+
+class _Linea:
+    # csv.writer escribe aquí; cada writerow retorna la línea formateada
+    def write(self, texto):
+        return texto
+
+
+def exportar(queryset, formato, zona, chunk_size=2000):
+    """Generador de trozos de texto con las filas de `queryset` en `formato`."""
+    if formato not in FORMATOS:
+        raise ValueError(f"formato desconocido: {formato}")
+    hora_local = HoraLocal(zona)
+    trozo = []
+
+    if formato == 'csv':
+        escritor = csv.writer(_Linea())
+        trozo.append(escritor.writerow(ENCABEZADO))
+        for fila in _filas(queryset, hora_local, chunk_size):
+            trozo.append(escritor.writerow(fila))
+            if len(trozo) >= FILAS_POR_TROZO:
+                yield ''.join(trozo)
+                trozo = []
+    else:
+        for fila in _filas(queryset, hora_local, chunk_size):
+            trozo.append(json.dumps(dict(zip(ENCABEZADO, fila)), ensure_ascii=False) + '\n')
+            if len(trozo) >= FILAS_POR_TROZO:
+                yield ''.join(trozo)
+                trozo = []
+
+    if trozo:
+        yield ''.join(trozo)
@@ -0,0 +1,82 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import almacenamiento, escaneo
+
+from .bench_sqlite import preparar
+
+
+def medir(funcion, argumentos):
+    """Latencias (µs) de funcion(x) para cada x de `argumentos`."""
+    latencias = []
+    for x in argumentos:
+        inicio = time.perf_counter()
+        funcion(x)
+        latencias.append((time.perf_counter() - inicio) * 1e6)
+    return sorted(latencias)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la clave de 'data' en texto (hash hex, tabla con rowid) y binaria (digest "
+        "de 32 bytes, WITHOUT ROWID): tamaño del archivo, tiempo de conversión y latencia de "
+        "búsqueda por hash, por prefijo de pase compacto y de un escaneo completo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asistentes', type=int, default=1_000_000, help='Filas en data (default: 1 millón)')
+        parser.add_argument('--consultas', type=int, default=20000, help='Búsquedas medidas por tipo')
+
+    def handle(self, *args, **options):
+        # Hashes aleatorios como los SHA256 reales (no en orden: las páginas del árbol se dividen igual)
+        hashes = [os.urandom(32).hex() for _ in range(options['asistentes'])]
+        muestra = random.sample(hashes, min(options['consultas'], len(hashes)))
+        desconocidos = [os.urandom(32).hex() for _ in muestra]
+
+        for formato in ('texto', 'binario'):
+            with tempfile.TemporaryDirectory() as carpeta:
+                # Archivo temporal: nunca se toca data.sqlite
+                ruta = os.path.join(carpeta, 'bench.sqlite')
+                preparar(ruta, hashes, datos_personales=True)
+                conexion = almacenamiento.conectar(ruta)
+                cursor = conexion.cursor()
+
+                conversion = ''
+                if formato == 'binario':
+                    inicio = time.perf_counter()
+                    cursor.execute('BEGIN')
+                    almacenamiento.convertir_hash(cursor, True)
+                    conexion.commit()
+                    conversion = f"  conversión {time.perf_counter() - inicio:5.1f} s"
+                # Mismo punto de partida para ambos: sin páginas libres y sin WAL pendiente
+                cursor.execute('VACUUM')
+                cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                tamano = os.path.getsize(ruta) / 1e6
+
+                def consultar(h):
+                    cursor.execute(escaneo.SQL_CONSULTA, {'hash_id': h})
+                    cursor.fetchone()
+
+                def escanear(h):
+                    escaneo.registrar_escaneo(cursor, h)
+                    conexion.commit()
+
+                resultados = {
+                    'hash': medir(consultar, muestra),
+                    'desconocido': medir(consultar, desconocidos),
+                    'prefijo': medir(lambda h: escaneo.resolver_prefijo(cursor, h[:20]), muestra),
+                    'escaneo': medir(escanear, muestra),
+                }
+                conexion.close()
+
+            self.stdout.write(f"{formato:8s} {len(hashes)} filas  archivo {tamano:7.1f} MB{conversion}")
+            for nombre, latencias in resultados.items():
+                self.stdout.write(
+                    f"    {nombre:12s} p50 {statistics.median(latencias):6.1f} µs  "
+                    f"p99 {latencias[int(len(latencias) * 0.99)]:6.1f} µs"
+                )
@@ -0,0 +1,45 @@
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.credenciales import FORMATOS, exportar_zip
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la exportación de pases (core/credenciales.py) con un padrón sintético: "
+        "pases/s con la caché de PNG vacía y llena, tamaño del ZIP y memoria máxima del proceso."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cantidad', type=int, default=10000, help='Pases a exportar (default: 10000)')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--formato', choices=FORMATOS, default='png')
+
+    def handle(self, *args, **options):
+        cantidad = options['cantidad']
+
+        def filas():
+            for n in range(cantidad):
+                yield (f'{n:064x}', f'Nombre{n}', f'Apellido{n}', f'{10000000 + n}')
+
+        # Carpetas temporales: nunca se toca QR_DIR ni la base de datos
+        with tempfile.TemporaryDirectory() as carpeta:
+            cache = os.path.join(carpeta, 'qr')
+            destino = os.path.join(carpeta, 'pases.zip')
+            for caso in ('caché vacía', 'caché llena'):
+                inicio = time.perf_counter()
+                with open(destino, 'wb') as f:
+                    for trozo in exportar_zip(filas(), options['formato'], options['procesos'], cache):
+                        f.write(trozo)
+                transcurrido = time.perf_counter() - inicio
+                # ru_maxrss: KiB en Linux
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                self.stdout.write(
+                    f"{caso:12s} {cantidad} pases ({options['formato']}, {options['procesos']} procesos): "
+                    f"{cantidad / transcurrido:8.0f} pases/s  ZIP {os.path.getsize(destino) / 1e6:6.1f} MB  "
+                    f"RSS máx. {rss:6.1f} MB"
+                )
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import almacenamiento, escaneo
+
+
+def escritor(ruta, modo, hashes, segundos, resultados):
+    """
+    Proceso escritor: aplica escaneos (un commit por escaneo) durante `segundos`.
+    modo 'default' = sqlite3.connect() sin ajustes (como antes), 'tuned' = core/almacenamiento.py
+    """
+    if modo == 'tuned':
+        conexion = almacenamiento.conectar(ruta)
+    else:
+        conexion = sqlite3.connect(ruta)
+        almacenamiento.registrar_funciones(conexion)  # clave_hash() del SQL compartido, sin PRAGMAs
+    cursor = conexion.cursor()
+
+    ok = bloqueos = 0
+    latencias = []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            escaneo.registrar_escaneo(cursor, random.choice(hashes))
+            conexion.commit()
+            ok += 1
+            latencias.append(time.perf_counter() - inicio)
+        except sqlite3.OperationalError:
+            conexion.rollback()
+            bloqueos += 1
+    conexion.close()
+    resultados.put((ok, bloqueos, latencias))
+
+
+def preparar(ruta, hashes, datos_personales=False):
+    """Crea en `ruta` data, sesion y registro (como tras la migración 0007) con una sesión abierta."""
+    conexion = sqlite3.connect(ruta)
+    conexion.execute(
+        "CREATE TABLE data (id_hash VARCHAR(64) PRIMARY KEY, nombre VARCHAR(100) NULL, "
+        "apellido VARCHAR(100) NULL, documento VARCHAR(20) NULL)"
+    )
+    # Registro append-only por sesión, sin triggers: el escaneo es un único INSERT
+    conexion.executescript("""
+        CREATE TABLE sesion (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre VARCHAR(100) NOT NULL,
+                             inicio BIGINT NOT NULL, fin BIGINT NULL);
+        CREATE TABLE registro (id INTEGER PRIMARY KEY AUTOINCREMENT, sesion_id BIGINT NOT NULL,
+                               id_hash VARCHAR(64) NOT NULL, tipo SMALLINT NOT NULL, ts BIGINT NOT NULL);
+        CREATE UNIQUE INDEX registro_sesion_hash_tipo_uniq ON registro (sesion_id, id_hash, tipo);
+        CREATE INDEX registro_sesion_tipo_ts_idx ON registro (sesion_id, tipo, ts);
+        INSERT INTO sesion (nombre, inicio) VALUES ('bench', 0);
+    """)
+    conexion.executemany(
+        "INSERT INTO data (id_hash, nombre, apellido, documento) VALUES (?, ?, ?, ?)",
+        ((h, f'Nombre{n}', f'Apellido{n}', f'{n:08d}') if datos_personales else (h, None, None, None)
+         for n, h in enumerate(hashes)),
+    )
+    conexion.commit()
+    conexion.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide escaneos/s con varios procesos escribiendo a la vez el mismo archivo SQLite "
+        "(servidor + escáner de escritorio), con la conexión por defecto y con core/almacenamiento.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=4, help='Escritores concurrentes (default: 4)')
+        parser.add_argument('--segundos', type=float, default=5.0, help='Duración de cada modo (default: 5)')
+        parser.add_argument('--asistentes', type=int, default=50000, help='Filas en la tabla de prueba')
+
+    def handle(self, *args, **options):
+        procesos = options['procesos']
+        for modo in ('default', 'tuned'):
+            with tempfile.TemporaryDirectory() as carpeta:
+                # Archivo temporal: nunca se toca data.sqlite
+                ruta = os.path.join(carpeta, 'bench.sqlite')
+                hashes = [f'{n:064x}' for n in range(options['asistentes'])]
+                preparar(ruta, hashes)
+
+                resultados = multiprocessing.Queue()
+                trabajadores = [
+                    multiprocessing.Process(target=escritor, args=(ruta, modo, hashes, options['segundos'], resultados))
+                    for _ in range(procesos)
+                ]
+                for t in trabajadores:
+                    t.start()
+                datos = [resultados.get() for _ in trabajadores]
+                for t in trabajadores:
+                    t.join()
+
+            ok = sum(d[0] for d in datos)
+            bloqueos = sum(d[1] for d in datos)
+            latencias = sorted(l for d in datos for l in d[2])
+            p99 = latencias[int(len(latencias) * 0.99)] * 1000 if latencias else 0.0
+            self.stdout.write(
+                f"{modo:8s} {procesos} escritores: {ok / options['segundos']:8.0f} escaneos/s  "
+                f"p99 {p99:6.2f} ms  'database is locked': {bloqueos}"
+            )
@@ -0,0 +1,289 @@
+import hashlib
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from core.models import Asistencia, RegistroEscaneo
+
+RUTA = '/api/procesar-qr/'
+
+# Mezcla por defecto: acción -> peso
+MEZCLA = {'entrada': 50, 'salida': 30, 'repetido': 15, 'desconocido': 5}
+
+# Resultado esperado por acción (los repetidos dependen de la ventana de duplicados)
+ESPERADO = {
+    'entrada': (200, 'entrada'),
+    'salida': (200, 'salida'),
+    'completado': (200, 'completado'),
+    'desconocido': (404, 'not_found'),
+}
+
+
+def hash_sembrado(nivel, n):
+    # Determinista: limpiar() borra exactamente estos hashes, nunca un asistente real
+    return hashlib.sha256(f"carga:{nivel}:{n}".encode()).hexdigest()
+
+
+# Hashes por DELETE ... IN (por debajo del límite de parámetros de SQLite)
+LOTE_BORRADO = 2000
+
+
+def percentil(ordenadas, p):
+    # Rango más cercano, como core/analitica.py
+    if not ordenadas:
+        return None
+    return ordenadas[max(1, -(-p * len(ordenadas) // 100)) - 1]
+
+
+class Puerta:
+    """
+    Transporte de un escáner simulado: HTTP con keep-alive contra un servidor
+    (runserver, gunicorn, ...) o el test client de Django dentro del proceso.
+    Retorna (status HTTP, cuerpo JSON) o lanza OSError / HTTPException.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self._conexion = None
+        self._cliente = None if url else Client()
+
+    def enviar(self, hash_id):
+        cuerpo = json.dumps({'hash_id': hash_id})
+        if self._cliente is not None:
+            respuesta = self._cliente.post(RUTA, cuerpo, content_type='application/json')
+            return respuesta.status_code, respuesta.json()
+
+        if self._conexion is None:
+            partes = urlsplit(self.url)
+            self._conexion = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+        try:
+            self._conexion.request('POST', urlsplit(self.url).path.rstrip('/') + RUTA, cuerpo,
+                                   {'Content-Type': 'application/json'})
+            respuesta = self._conexion.getresponse()
+            return respuesta.status, json.loads(respuesta.read() or b'{}')
+        except (OSError, http.client.HTTPException):
+            self.cerrar()
+            raise
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+
+class Nivel:
+    """Estado compartido por los escáneres de una corrida: qué hash le toca a cada acción."""
+
+    def __init__(self, hashes, mezcla, ventana):
+        self.sin_llegar = deque(hashes)
+        self.dentro = deque()           # (hash, instante de la entrada)
+        self.ventana = ventana          # DEDUPE_SEGUNDOS del servidor
+        self.completos = []             # (hash, instante de la salida)
+        self.acciones = list(mezcla)
+        self.pesos = [mezcla[a] for a in self.acciones]
+        self.lock = threading.Lock()
+        self.latencias = []
+        self.resultados = Counter()
+        self.inesperados = Counter()
+
+    def elegir(self, azar, ultimo):
+        ahora = time.monotonic()
+        accion = azar.choices(self.acciones, self.pesos)[0]
+        if accion == 'repetido':
+            # Solo es un repetido (la ventana responde sin tocar la BD) si sigue dentro de la ventana
+            if ultimo is not None and ahora - ultimo[1] < self.ventana:
+                return accion, ultimo[0]
+            accion = 'entrada'
+        if accion == 'desconocido':
+            return accion, f"{azar.getrandbits(256):064x}"
+        with self.lock:
+            # Cada hash lo tiene un solo escáner a la vez, y una salida solo se intenta
+            # pasada la ventana de su entrada: así el resultado esperado es seguro
+            puede_salir = self.dentro and ahora - self.dentro[0][1] >= self.ventana
+            if accion == 'salida' and puede_salir:
+                return accion, self.dentro.popleft()[0]
+            if self.sin_llegar:
+                return 'entrada', self.sin_llegar.popleft()
+            if puede_salir:
+                return 'salida', self.dentro.popleft()[0]
+            if self.completos and ahora - self.completos[0][1] >= self.ventana:
+                hash_id, salida = azar.choice(self.completos)
+                return 'completado', hash_id if ahora - salida >= self.ventana else self.completos[0][0]
+            return 'desconocido', f"{azar.getrandbits(256):064x}"
+
+    def anotar(self, accion, hash_id, status, tipo, latencia):
+        with self.lock:
+            self.latencias.append(latencia)
+            self.resultados[f"{status} {tipo}"] += 1
+            esperado = ESPERADO.get(accion)
+            if esperado is not None and esperado != (status, tipo):
+                self.inesperados[f"{accion} -> {status} {tipo}"] += 1
+            if (status, tipo) == (200, 'entrada') and accion == 'entrada':
+                self.dentro.append((hash_id, time.monotonic()))
+            elif (status, tipo) == (200, 'salida') and accion == 'salida':
+                self.completos.append((hash_id, time.monotonic()))
+
+
+def escaner(nivel, url, fin, pausa, semilla):
+    azar = random.Random(semilla)
+    puerta = Puerta(url)
+    ultimo = None
+    try:
+        while time.perf_counter() < fin:
+            accion, hash_id = nivel.elegir(azar, ultimo)
+            enviado = time.monotonic()
+            inicio = time.perf_counter()
+            try:
+                status, cuerpo = puerta.enviar(hash_id)
+                tipo = cuerpo.get('type') or cuerpo.get('status')
+                if status >= 500 and 'locked' in str(cuerpo.get('message', '')):
+                    tipo = 'database is locked'
+            except (OSError, http.client.HTTPException, ValueError):
+                status, tipo = 0, 'conexión'
+            nivel.anotar(accion, hash_id, status, tipo, time.perf_counter() - inicio)
+            if accion != 'desconocido':
+                ultimo = (hash_id, enviado if accion != 'repetido' else ultimo[1])
+            if pausa:
+                time.sleep(azar.uniform(0, 2 * pausa))
+    finally:
+        puerta.cerrar()
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de /api/procesar-qr/: siembra asistentes, simula escáneres concurrentes "
+        "(entradas, salidas, repetidos y QR desconocidos) y reporta escaneos/s, p50/p95/p99 "
+        "y resultados por status. Sin --url usa el test client de Django dentro del proceso, "
+        "sobre una base SQLite temporal salvo que se indique --base-configurada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Servidor a probar, p. ej. http://127.0.0.1:8000 (debe usar esta misma '
+                                          'base de datos; requiere --base-configurada)')
+        parser.add_argument('--base-configurada', action='store_true',
+                            help='Siembra y borra en la base de datos de settings.DATABASES en lugar de una temporal')
+        parser.add_argument('--escaneres', default='1,4,16', help='Escáneres concurrentes; varios niveles separados por coma (default: 1,4,16)')
+        parser.add_argument('--segundos', type=float, default=10.0, help='Duración de cada nivel (default: 10)')
+        parser.add_argument('--asistentes', type=int, default=20000, help='Asistentes sembrados por nivel (default: 20000)')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Pausa media entre escaneos de un escáner, en segundos (default: 0)')
+        parser.add_argument('--mezcla', default=','.join(f'{a}={p}' for a, p in MEZCLA.items()),
+                            help='Pesos de cada acción (default: %(default)s)')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Una línea JSON por nivel')
+
+    def handle(self, *args, **options):
+        try:
+            niveles = [int(n) for n in options['escaneres'].split(',')]
+            mezcla = {a: float(p) for a, p in (par.split('=') for par in options['mezcla'].split(','))}
+        except ValueError:
+            raise CommandError("--escaneres o --mezcla inválidos")
+        if set(mezcla) - set(MEZCLA) or min(niveles) < 1:
+            raise CommandError(f"acciones válidas: {', '.join(MEZCLA)}; al menos 1 escáner")
+        if options['url'] and not options['base_configurada']:
+            raise CommandError(
+                "--url siembra en la base de datos del servidor: agregue --base-configurada "
+                f"(escribe y borra asistentes de prueba en {connection.settings_dict['NAME']})"
+            )
+
+        with self.base(options['base_configurada']):
+            for numero, escaneres in enumerate(niveles):
+                hashes = [hash_sembrado(numero, n) for n in range(options['asistentes'])]
+                self.sembrar(hashes)
+                try:
+                    reporte = self.correr(hashes, mezcla, escaneres, options, numero)
+                finally:
+                    self.limpiar(hashes)
+                self.informar(reporte, options['json'])
+
+    @contextmanager
+    def base(self, configurada):
+        """
+        Sin `configurada`, una base SQLite vacía y migrada en un directorio temporal
+        (la técnica del test runner de Django: los hilos de los escáneres la heredan)
+        que se elimina al terminar. Con `configurada`, la de settings.DATABASES.
+        """
+        if configurada:
+            yield
+            return
+        prueba = connection.settings_dict.setdefault('TEST', {})
+        nombre_prueba = prueba.get('NAME')
+        original = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as carpeta:
+            prueba['NAME'] = os.path.join(carpeta, 'carga.sqlite')
+            try:
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    yield
+                finally:
+                    connection.creation.destroy_test_db(original, verbosity=0)
+            finally:
+                prueba['NAME'] = nombre_prueba
+
+    def sembrar(self, hashes):
+        # Restos de una corrida interrumpida con los mismos hashes
+        self.limpiar(hashes)
+        Asistencia.objects.bulk_create(
+            (Asistencia(id_hash=h, nombre=f'N{n}', apellido='Carga') for n, h in enumerate(hashes)),
+            batch_size=2000,
+        )
+
+    def limpiar(self, hashes):
+        # Solo los hashes sembrados (hash_sembrado), con sus escaneos de cualquier sesión
+        for inicio in range(0, len(hashes), LOTE_BORRADO):
+            lote = hashes[inicio:inicio + LOTE_BORRADO]
+            RegistroEscaneo.objects.filter(id_hash__in=lote).delete()
+            Asistencia.objects.filter(id_hash__in=lote).delete()
+
+    def correr(self, hashes, mezcla, escaneres, options, numero):
+        nivel = Nivel(hashes, mezcla, getattr(settings, 'DEDUPE_SEGUNDOS', 5))
+        inicio = time.perf_counter()
+        fin = inicio + options['segundos']
+        hilos = [
+            threading.Thread(target=escaner, args=(nivel, options['url'], fin, options['pausa'],
+                                                   f"{options['semilla']}:{numero}:{n}"))
+            for n in range(escaneres)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        transcurrido = time.perf_counter() - inicio
+
+        latencias = sorted(nivel.latencias)
+        return {
+            'escaneres': escaneres,
+            'escaneos': len(latencias),
+            'segundos': round(transcurrido, 2),
+            'escaneos_por_segundo': round(len(latencias) / transcurrido, 1),
+            **{f'p{p}_ms': round(percentil(latencias, p) * 1000, 2) if latencias else None for p in (50, 95, 99)},
+            'resultados': dict(nivel.resultados.most_common()),
+            'inesperados': dict(nivel.inesperados),
+        }
+
+    def informar(self, reporte, en_json):
+        if en_json:
+            self.stdout.write(json.dumps(reporte, ensure_ascii=False))
+            return
+        self.stdout.write(
+            f"{reporte['escaneres']:4d} escáneres: {reporte['escaneos']:7d} escaneos en {reporte['segundos']:.1f} s  "
+            f"{reporte['escaneos_por_segundo']:8.1f} esc/s  p50 {reporte['p50_ms']} ms  "
+            f"p95 {reporte['p95_ms']} ms  p99 {reporte['p99_ms']} ms"
+        )
+        self.stdout.write("      " + ', '.join(f"{clave}: {n}" for clave, n in reporte['resultados'].items()))
+        if reporte['inesperados']:
+            self.stdout.write(self.style.ERROR(
+                "      inesperados: " + ', '.join(f"{clave}: {n}" for clave, n in reporte['inesperados'].items())
+            ))
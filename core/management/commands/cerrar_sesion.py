@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import escaneo
+from core.models import RegistroEscaneo
+
+
+class Command(BaseCommand):
+    help = (
+        "Cierra la sesión (jornada) abierta y abre una nueva: lo registrado queda archivado "
+        "en 'registro' y todos los asistentes empiezan la nueva sin entrada ni salida."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nombre', default='', help='Nombre de la sesión nueva (p. ej. "Día 2")')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cerrada, nueva = escaneo.rotar_sesion(cursor, options['nombre'])
+
+        if cerrada is not None:
+            escaneos = RegistroEscaneo.objects.filter(sesion_id=cerrada).count()
+            self.stdout.write(f"Sesión {cerrada} cerrada ({escaneos} escaneos archivados).")
+        self.stdout.write(f"Sesión {nueva} abierta en {time.perf_counter() - inicio:.2f} s.")
@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import almacenamiento
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte en el lugar la clave de 'data' entre el hash hex (texto) y el digest de "
+        "32 bytes en una tabla WITHOUT ROWID (binario). Detén antes el servidor y el escáner."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('formato', choices=('texto', 'binario'))
+        parser.add_argument('--sin-vacuum', action='store_true',
+                            help='No compactar el archivo después (VACUUM reescribe toda la base)')
+
+    def handle(self, *args, **options):
+        binario = options['formato'] == 'binario'
+        ruta = connection.settings_dict['NAME']
+        antes = os.path.getsize(ruta)
+
+        inicio = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            if almacenamiento.hash_binario(cursor.connection) == binario:
+                self.stdout.write(f"'data' ya usa la clave {options['formato']}.")
+                return
+            connection.hash_binario = almacenamiento.convertir_hash(cursor, binario)
+        if not options['sin_vacuum']:
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+                cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')  # en WAL el archivo cambia al hacer checkpoint
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Clave {options['formato']} en {time.perf_counter() - inicio:.2f} s; "
+            f"{ruta}: {antes / 1e6:.1f} MB -> {os.path.getsize(ruta) / 1e6:.1f} MB"
+        ))
@@ -0,0 +1,46 @@
+import sys
+import time
+
+import pytz
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exportacion
+from core.models import Asistencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta la asistencia a CSV o JSONL leyendo la tabla por partes "
+        "(memoria constante aunque tenga millones de filas)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', default='-', help="Archivo de destino ('-' = salida estándar)")
+        parser.add_argument('--formato', choices=exportacion.FORMATOS, default='csv')
+        parser.add_argument('--estado', choices=tuple(exportacion.ESTADOS))
+        parser.add_argument('--desde', help='Entrada desde (timestamp Unix o fecha ISO, hora local)')
+        parser.add_argument('--hasta', help='Entrada antes de (timestamp Unix o fecha ISO, hora local)')
+
+    def handle(self, *args, **options):
+        tz_local = pytz.timezone(settings.TIME_ZONE)
+        rango = {}
+        for campo in ('desde', 'hasta'):
+            if options[campo]:
+                try:
+                    rango[campo] = exportacion.parsear_instante(options[campo], tz_local)
+                except ValueError:
+                    raise CommandError(f"--{campo} inválido: {options[campo]}")
+
+        queryset = exportacion.filtrar(Asistencia.objects.all(), options['estado'], **rango)
+        inicio = time.perf_counter()
+        destino = sys.stdout if options['salida'] == '-' else open(options['salida'], 'w', encoding='utf-8', newline='')
+        try:
+            for trozo in exportacion.exportar(queryset, options['formato'], tz_local):
+                destino.write(trozo)
+        finally:
+            if destino is not sys.stdout:
+                destino.close()
+
+        if destino is not sys.stdout:
+            self.stderr.write(f"Exportado en {time.perf_counter() - inicio:.2f} s -> {options['salida']}")
@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.credenciales import FORMATOS, exportar_zip
+from core.exportacion import ESTADOS
+from core.models import Asistencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta los pases QR del padrón a un ZIP (un PNG por asistente, u hojas A4 "
+        "imprimibles con --formato hojas). El archivo se escribe por partes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Archivo ZIP de destino')
+        parser.add_argument('--formato', choices=FORMATOS, default='png')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help='Procesos para dibujar los pases (default: núcleos disponibles)')
+        parser.add_argument('--sin-entrada', action='store_true',
+                            help='Solo asistentes que todavía no registraron su entrada')
+
+    def handle(self, *args, **options):
+        queryset = Asistencia.objects.all()
+        if options['sin_entrada']:
+            queryset = queryset.filter(ESTADOS['sin_llegar'])
+        total = queryset.count()
+        filas = queryset.order_by('apellido', 'nombre').values_list(
+            'id_hash', 'nombre', 'apellido', 'documento'
+        ).iterator(chunk_size=2000)
+
+        inicio = time.perf_counter()
+        tmp = options['salida'] + '.tmp'
+        with open(tmp, 'wb') as f:
+            for trozo in exportar_zip(filas, options['formato'], options['procesos'], settings.QR_DIR):
+                f.write(trozo)
+        os.replace(tmp, options['salida'])
+
+        transcurrido = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} pases en {transcurrido:.2f} s ({total / transcurrido if transcurrido else 0:.0f} pases/s) "
+            f"-> {options['salida']} ({os.path.getsize(options['salida']) / 1e6:.1f} MB)"
+        ))
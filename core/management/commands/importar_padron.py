@@ -0,0 +1,141 @@
+import csv
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import qr
+from core.paralelo import en_lotes, en_paralelo
+from core.models import Asistencia
+
+COLUMNAS = ('nombre', 'apellido', 'documento')
+
+# Mismos límites que RegistroPersonaForm
+MAX_NOMBRE = 100
+MAX_APELLIDO = 100
+LARGO_DOCUMENTO = 8
+
+
+def validar(nombre, apellido, documento):
+    """Retorna el motivo por el que la fila no es válida, o None."""
+    if not nombre or not apellido or not documento:
+        return "faltan datos"
+    if len(nombre) > MAX_NOMBRE or len(apellido) > MAX_APELLIDO:
+        return "nombre o apellido demasiado largo"
+    if not documento.isdigit() or len(documento) != LARGO_DOCUMENTO:
+        return f"el DNI debe tener {LARGO_DOCUMENTO} dígitos"
+    return None
+
+
+def preparar_lote(filas, directorio_qr):
+    """
+    Proceso hijo: calcula el hash de cada fila y genera su PNG (si no existe ya).
+    filas = [(linea, nombre, apellido, documento)]
+    Retorna (validas, errores, qr_generados).
+    """
+    validas = []
+    errores = []
+    generados = 0
+    for linea, nombre, apellido, documento in filas:
+        motivo = validar(nombre, apellido, documento)
+        if motivo:
+            errores.append((linea, motivo))
+            continue
+        hash_id = qr.generar_hash(nombre, apellido, documento)
+        if directorio_qr and qr.guardar_png(directorio_qr, hash_id):
+            generados += 1
+        validas.append((hash_id, nombre, apellido, documento))
+    return validas, errores, generados
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa el padrón de asistentes desde un CSV (columnas nombre, apellido, documento). "
+        "Se puede volver a ejecutar: los asistentes existentes se actualizan sin duplicarse "
+        "ni perder su entrada/salida."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv', help='Archivo CSV con encabezado (nombre, apellido, documento)')
+        parser.add_argument('--delimitador', default=',', help="Separador de columnas (default: ',')")
+        parser.add_argument('--lote', type=int, default=2000, help='Filas por transacción (default: 2000)')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help='Procesos para hashes y QR (default: núcleos disponibles)')
+        parser.add_argument('--qr-dir', default=str(settings.QR_DIR), help='Carpeta de las imágenes QR')
+        parser.add_argument('--sin-qr', action='store_true', help='No generar imágenes QR')
+
+    def leer_filas(self, ruta, delimitador):
+        """Lee el CSV en streaming: (linea, nombre, apellido, documento)."""
+        with open(ruta, newline='', encoding='utf-8-sig') as f:
+            lector = csv.reader(f, delimiter=delimitador)
+            encabezado = [c.strip().lower() for c in next(lector, [])]
+            faltantes = [c for c in COLUMNAS if c not in encabezado]
+            if faltantes:
+                raise CommandError(f"Faltan columnas en el CSV: {', '.join(faltantes)}")
+            indices = [encabezado.index(c) for c in COLUMNAS]
+
+            for fila in lector:
+                if not any(fila):
+                    continue
+                valores = [fila[i].strip() if i < len(fila) else '' for i in indices]
+                yield (lector.line_num, *valores)
+
+    def guardar(self, validas):
+        """
+        Upsert de un lote en una transacción. Retorna (nuevas, actualizadas).
+        Los asistentes existentes solo actualizan sus datos personales: su registro de
+        entradas y salidas no se toca, así que reimportar durante el evento es seguro.
+        """
+        # Un mismo asistente repetido en el lote cuenta una sola vez
+        por_hash = {hash_id: fila for hash_id, *fila in validas}
+        with transaction.atomic():
+            existentes = set(
+                Asistencia.objects.filter(id_hash__in=list(por_hash)).values_list('id_hash', flat=True)
+            )
+            Asistencia.objects.bulk_create(
+                [
+                    Asistencia(id_hash=hash_id, nombre=nombre, apellido=apellido, documento=documento)
+                    for hash_id, (nombre, apellido, documento) in por_hash.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['id_hash'],
+                update_fields=['nombre', 'apellido', 'documento'],
+            )
+        return len(por_hash) - len(existentes), len(existentes)
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['csv']):
+            raise CommandError(f"No existe el archivo {options['csv']}")
+        directorio_qr = None if options['sin_qr'] else options['qr_dir']
+        if directorio_qr:
+            os.makedirs(directorio_qr, exist_ok=True)
+
+        filas = nuevas = actualizadas = generados = 0
+        errores = []
+        inicio = time.perf_counter()
+
+        # Pocos lotes en vuelo por proceso (core/paralelo.py): el CSV no se carga entero en memoria
+        lotes = en_lotes(self.leer_filas(options['csv'], options['delimitador']), max(1, options['lote']))
+        for validas, errores_lote, generados_lote in en_paralelo(preparar_lote, lotes, options['procesos'], directorio_qr):
+            n, a = self.guardar(validas) if validas else (0, 0)
+            filas += len(validas) + len(errores_lote)
+            nuevas += n
+            actualizadas += a
+            generados += generados_lote
+            errores.extend(errores_lote)
+            transcurrido = time.perf_counter() - inicio
+            self.stdout.write(f"  {filas} filas  {filas / transcurrido:8.0f} filas/s")
+
+        transcurrido = time.perf_counter() - inicio
+        for linea, motivo in errores[:20]:
+            self.stderr.write(f"línea {linea}: {motivo}")
+        if len(errores) > 20:
+            self.stderr.write(f"... y {len(errores) - 20} filas inválidas más")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{filas} filas en {transcurrido:.2f} s ({filas / transcurrido if transcurrido else 0:.0f} filas/s): "
+            f"{nuevas} nuevas, {actualizadas} actualizadas, {len(errores)} inválidas; "
+            f"{generados} QR generados"
+        ))
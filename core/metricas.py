@@ -0,0 +1,178 @@
+"""
+Métricas en memoria (contadores e histogramas) con salida en el formato de texto
+de Prometheus.
+
+Las usan el servidor (core/middleware.py y las vistas de escaneo, expuestas en
+/metrics) y el escáner de escritorio (main.py, que las resume periódicamente en
+una línea de log). Este módulo NO depende de Django.
+
+Límite conocido: los valores son por proceso. Con varios workers cada /metrics
+muestra solo los de su proceso; Prometheus los suma si cada worker se raspa por
+separado (o con un único proceso con hilos, como en /api/eventos/).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Límites (segundos) de los histogramas de latencia
+LIMITES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)] + list(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Registro:
+    """Conjunto de métricas que se exportan juntas."""
+
+    def __init__(self):
+        self._metricas = []
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica):
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self):
+        with self._lock:
+            metricas = list(self._metricas)
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.muestras())
+        return '\n'.join(lineas) + '\n'
+
+
+# Registro por defecto del proceso
+REGISTRO = Registro()
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=(), registro=REGISTRO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = threading.Lock()
+        if registro is not None:
+            registro.registrar(self)
+
+    def _clave(self, etiquetas):
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre}: se esperaban las etiquetas {self.etiquetas}")
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def valor(self, **etiquetas):
+        with self._lock:
+            return self._series.get(self._clave(etiquetas), 0)
+
+    def muestras(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}" for clave, valor in series]
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES, registro=REGISTRO):
+        super().__init__(nombre, ayuda, etiquetas, registro)
+        self.limites = tuple(limites)
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # [conteo por intervalo (el último es +Inf), suma, total]
+                serie = self._series[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][bisect_left(self.limites, valor)] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def instantanea(self, **etiquetas):
+        """(conteos por intervalo, suma, total) de una serie, para calcular diferencias."""
+        with self._lock:
+            serie = self._series.get(self._clave(etiquetas))
+            if serie is None:
+                return ((0,) * (len(self.limites) + 1), 0.0, 0)
+            return (tuple(serie[0]), serie[1], serie[2])
+
+    def cuantil(self, q, anterior, actual):
+        """
+        Cota superior del cuantil `q` de las observaciones entre dos instantáneas
+        (el límite del intervalo que lo contiene); None si no hubo observaciones.
+        """
+        conteos = [b - a for a, b in zip(anterior[0], actual[0])]
+        total = actual[2] - anterior[2]
+        if not total:
+            return None
+        objetivo, acumulado = q * total, 0
+        for limite, n in zip(self.limites + (float('inf'),), conteos):
+            acumulado += n
+            if acumulado >= objetivo:
+                return limite
+        return float('inf')
+
+    def muestras(self):
+        with self._lock:
+            series = sorted((clave, (list(s[0]), s[1], s[2])) for clave, s in self._series.items())
+        lineas = []
+        for clave, (conteos, suma, total) in series:
+            acumulado = 0
+            for limite, n in zip(self.limites + (float('inf'),), conteos):
+                acumulado += n
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, (le,))} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}")
+        return lineas
+
+
+class Medidor(_Metrica):
+    """Valor instantáneo calculado al exportar: funcion() -> número o {(valores de etiquetas): número}."""
+    tipo = 'gauge'
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=(), registro=REGISTRO):
+        super().__init__(nombre, ayuda, etiquetas, registro)
+        self.funcion = funcion
+
+    def muestras(self):
+        valores = self.funcion()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+                for clave, valor in sorted(valores.items())]
@@ -0,0 +1,104 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from . import metricas
+
+PETICIONES = metricas.Histograma(
+    'asistencia_http_request_duration_seconds',
+    'Tiempo hasta que la vista retorna su respuesta, por vista, método y status.',
+    ('view', 'method', 'status'),
+)
+CONSULTAS = metricas.Histograma(
+    'asistencia_db_query_duration_seconds',
+    'Tiempo de cada consulta SQL ejecutada durante una petición, por vista.',
+    ('view',),
+)
+
+
+# Tiempos de las consultas de la petición en curso (None fuera de una petición). Es una
+# ContextVar porque con ASGI la vista síncrona corre en otro hilo (sync_to_async), que
+# hereda una copia del contexto: la lista es la misma y ahí se anotan sus consultas
+_consultas = ContextVar('consultas', default=None)
+
+
+def _medir(execute, sql, params, many, context):
+    consultas = _consultas.get()
+    if consultas is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        consultas.append(time.perf_counter() - inicio)
+
+
+def _instalar(connection, **kwargs):
+    """Deja _medir fijo en la conexión (cada hilo tiene la suya); no hace nada si ya está."""
+    if _medir not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir)
+
+
+connection_created.connect(_instalar)
+
+
+def _vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    return coincidencia.view_name if coincidencia is not None else 'sin_ruta'
+
+
+class MetricasMiddleware:
+    """
+    Latencia de cada petición y de cada consulta SQL que hace, en core/metricas.py
+    (expuestas en /metrics). Va primero en MIDDLEWARE para medir toda la cadena.
+
+    Admite vistas síncronas y asíncronas: con ASGI no obliga a Django a pasar las
+    vistas async (procesar_qr_async) a un hilo. Las consultas se miden con un
+    execute_wrapper fijo en cada conexión (se instala al abrirla) que anota en la
+    lista de la petición en curso, así que también cuentan las de una vista síncrona
+    servida con ASGI, que corre en otro hilo con su propia conexión. No se atribuyen
+    las de hilos que no heredan el contexto de la petición, como el escritor de
+    procesar_qr_async (core.views._escritor_bd).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        _instalar(connection)   # la conexión de este hilo pudo abrirse antes de cargar el middleware
+        consultas = []
+        token = _consultas.set(consultas)
+        inicio = time.perf_counter()
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            _consultas.reset(token)
+        self._anotar(request, respuesta, time.perf_counter() - inicio, consultas)
+        return respuesta
+
+    async def __acall__(self, request):
+        consultas = []
+        token = _consultas.set(consultas)
+        inicio = time.perf_counter()
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            _consultas.reset(token)
+        self._anotar(request, respuesta, time.perf_counter() - inicio, consultas)
+        return respuesta
+
+    def _anotar(self, request, respuesta, duracion, consultas):
+        vista = _vista(request)
+        PETICIONES.observar(duracion, view=vista, method=request.method, status=respuesta.status_code)
+        for segundos in consultas:
+            CONSULTAS.observar(segundos, view=vista)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscaneoProcesado',
+            fields=[
+                ('scan_id', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='ID de Escaneo')),
+                ('device_id', models.CharField(blank=True, default='', max_length=64, verbose_name='Dispositivo')),
+                ('id_hash', models.CharField(max_length=64, verbose_name='Hash ID')),
+                ('scanned_at', models.BigIntegerField(verbose_name='Hora de Escaneo (Unix)')),
+                ('resultado', models.JSONField(verbose_name='Resultado')),
+            ],
+            options={
+                'verbose_name': 'Escaneo Procesado',
+                'verbose_name_plural': 'Escaneos Procesados',
+                'db_table': 'escaneo_procesado',
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+# Triggers que mantienen 'contadores' al día con cualquier escritura sobre 'data'.
+# Las comparaciones (x > 0) valen 0 o 1 en SQLite.
+TRIGGERS = [
+    """
+    CREATE TRIGGER data_contadores_insert AFTER INSERT ON data
+    BEGIN
+        UPDATE contadores SET valor = valor + CASE clave
+            WHEN 'asistentes' THEN 1
+            WHEN 'entradas' THEN (NEW.time_entry > 0)
+            WHEN 'salidas' THEN (NEW.time_exit > 0)
+        END WHERE clave IN ('asistentes', 'entradas', 'salidas');
+    END
+    """,
+    """
+    CREATE TRIGGER data_contadores_delete AFTER DELETE ON data
+    BEGIN
+        UPDATE contadores SET valor = valor - CASE clave
+            WHEN 'asistentes' THEN 1
+            WHEN 'entradas' THEN (OLD.time_entry > 0)
+            WHEN 'salidas' THEN (OLD.time_exit > 0)
+        END WHERE clave IN ('asistentes', 'entradas', 'salidas');
+    END
+    """,
+    """
+    CREATE TRIGGER data_contadores_update AFTER UPDATE OF time_entry, time_exit ON data
+    WHEN (NEW.time_entry > 0) != (OLD.time_entry > 0) OR (NEW.time_exit > 0) != (OLD.time_exit > 0)
+    BEGIN
+        UPDATE contadores SET valor = valor + CASE clave
+            WHEN 'entradas' THEN (NEW.time_entry > 0) - (OLD.time_entry > 0)
+            WHEN 'salidas' THEN (NEW.time_exit > 0) - (OLD.time_exit > 0)
+        END WHERE clave IN ('entradas', 'salidas');
+    END
+    """,
+]
+
+INICIALIZAR = """
+    INSERT INTO contadores (clave, valor)
+    SELECT 'asistentes', COUNT(*) FROM data
+    UNION ALL SELECT 'entradas', COUNT(*) FROM data WHERE time_entry > 0
+    UNION ALL SELECT 'salidas', COUNT(*) FROM data WHERE time_exit > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_indices_tiempo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contador',
+            fields=[
+                ('clave', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador',
+                'verbose_name_plural': 'Contadores',
+                'db_table': 'contadores',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(condition=models.Q(('time_exit', 0)), fields=['time_entry'], name='data_presentes_idx'),
+        ),
+        migrations.RunSQL(
+            [INICIALIZAR, *TRIGGERS],
+            reverse_sql=[
+                "DROP TRIGGER IF EXISTS data_contadores_insert",
+                "DROP TRIGGER IF EXISTS data_contadores_delete",
+                "DROP TRIGGER IF EXISTS data_contadores_update",
+                "DELETE FROM contadores",
+            ],
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# data.time_entry / time_exit pasan a ser la vista de la sesión abierta: cada fila
+# insertada en 'registro' copia su hora al asistente. Los triggers de contadores
+# (0004) siguen funcionando sobre esa actualización.
+PROYECCION = """
+    CREATE TRIGGER registro_proyeccion AFTER INSERT ON registro
+    WHEN NEW.sesion_id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL)
+    BEGIN
+        UPDATE data SET
+            time_entry = CASE WHEN NEW.tipo = 1 THEN NEW.ts ELSE time_entry END,
+            time_exit = CASE WHEN NEW.tipo = 2 THEN NEW.ts ELSE time_exit END
+        WHERE id_hash = NEW.id_hash;
+    END
+"""
+
+# Primera sesión (abierta) con el estado actual de 'data' como su registro
+SESION_INICIAL = """
+    INSERT INTO sesion (nombre, inicio, fin)
+    SELECT 'Sesión inicial', COALESCE(MIN(NULLIF(time_entry, 0)), CAST(strftime('%s', 'now') AS INTEGER)), NULL
+    FROM data
+"""
+
+REGISTRO_INICIAL = """
+    INSERT INTO registro (sesion_id, id_hash, tipo, ts)
+    SELECT (SELECT MAX(id) FROM sesion), id_hash, 1, time_entry FROM data WHERE time_entry > 0
+    UNION ALL
+    SELECT (SELECT MAX(id) FROM sesion), id_hash, 2, time_exit FROM data WHERE time_exit > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_contadores_ocupacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sesion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(blank=True, default='', max_length=100, verbose_name='Nombre')),
+                ('inicio', models.BigIntegerField(verbose_name='Inicio (Unix)')),
+                ('fin', models.BigIntegerField(blank=True, null=True, verbose_name='Fin (Unix)')),
+            ],
+            options={
+                'verbose_name': 'Sesión',
+                'verbose_name_plural': 'Sesiones',
+                'db_table': 'sesion',
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistroEscaneo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_hash', models.CharField(max_length=64, verbose_name='Hash ID')),
+                ('tipo', models.SmallIntegerField(choices=[(1, 'Entrada'), (2, 'Salida')], verbose_name='Tipo')),
+                ('ts', models.BigIntegerField(verbose_name='Hora (Unix)')),
+                ('sesion', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='core.sesion', verbose_name='Sesión')),
+            ],
+            options={
+                'verbose_name': 'Registro de Escaneo',
+                'verbose_name_plural': 'Registro de Escaneos',
+                'db_table': 'registro',
+                'indexes': [models.Index(fields=['sesion', 'ts'], name='registro_sesion_ts_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sesion', 'id_hash', 'tipo'), name='registro_sesion_hash_tipo_uniq')],
+            },
+        ),
+        # El registro inicial se copia antes de crear el trigger (no reescribe 'data')
+        migrations.RunSQL(
+            [SESION_INICIAL, REGISTRO_INICIAL, PROYECCION],
+            reverse_sql=["DROP TRIGGER IF EXISTS registro_proyeccion"],
+        ),
+    ]
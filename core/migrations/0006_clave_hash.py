@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+
+import core.models
+from core import almacenamiento
+
+
+def convertir(apps, schema_editor):
+    # Opcional: solo con HASH_BINARIO = True (las bases existentes se convierten en el lugar)
+    if getattr(settings, 'HASH_BINARIO', False):
+        with schema_editor.connection.cursor() as cursor:
+            schema_editor.connection.hash_binario = almacenamiento.convertir_hash(cursor, True)
+
+
+def revertir(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        schema_editor.connection.hash_binario = almacenamiento.convertir_hash(cursor, False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_registro_sesiones'),
+    ]
+
+    # El estado de Django solo cambia la clase del campo; la tabla la reconstruye
+    # convertir_hash() (un AlterField recrearía 'data' sin WITHOUT ROWID)
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='asistencia',
+                    name='id_hash',
+                    field=core.models.HashField(max_length=64, primary_key=True, serialize=False, verbose_name='Hash ID'),
+                ),
+                migrations.AlterField(
+                    model_name='registroescaneo',
+                    name='id_hash',
+                    field=core.models.HashField(max_length=64, verbose_name='Hash ID'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(convertir, revertir),
+            ],
+        ),
+    ]
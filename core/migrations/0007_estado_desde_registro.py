@@ -0,0 +1,111 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# El estado de cada asistente se deriva de 'registro' (sesión abierta): el escaneo
+# es un único INSERT, sin trigger de proyección sobre 'data' ni contadores de
+# entradas/salidas, y cerrar una sesión ya no reescribe 'data'.
+contadores_0004 = import_module('core.migrations.0004_contadores_ocupacion')
+registro_0005 = import_module('core.migrations.0005_registro_sesiones')
+
+# 'contadores' solo lleva el total de asistentes (altas y bajas de 'data')
+TRIGGERS = [
+    """
+    CREATE TRIGGER data_contadores_insert AFTER INSERT ON data
+    BEGIN
+        UPDATE contadores SET valor = valor + 1 WHERE clave = 'asistentes';
+    END
+    """,
+    """
+    CREATE TRIGGER data_contadores_delete AFTER DELETE ON data
+    BEGIN
+        UPDATE contadores SET valor = valor - 1 WHERE clave = 'asistentes';
+    END
+    """,
+    # Un asistente dado de baja deja de contar en la sesión abierta (antes se iba con su
+    # fila de 'data'); lo de las sesiones cerradas queda archivado
+    """
+    CREATE TRIGGER data_registro_delete AFTER DELETE ON data
+    BEGIN
+        DELETE FROM registro
+        WHERE sesion_id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL) AND id_hash = OLD.id_hash;
+    END
+    """,
+]
+
+RETIRAR_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS registro_proyeccion",
+    "DROP TRIGGER IF EXISTS data_contadores_insert",
+    "DROP TRIGGER IF EXISTS data_contadores_delete",
+    "DROP TRIGGER IF EXISTS data_contadores_update",
+    "DROP TRIGGER IF EXISTS data_registro_delete",
+]
+
+# Reversa: la vista de la sesión abierta vuelve a 'data' antes de recrear los triggers
+PROYECTAR = """
+    UPDATE data SET
+        time_entry = COALESCE((SELECT ts FROM registro WHERE tipo = 1 AND id_hash = data.id_hash
+                               AND sesion_id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL)), 0),
+        time_exit = COALESCE((SELECT ts FROM registro WHERE tipo = 2 AND id_hash = data.id_hash
+                              AND sesion_id = (SELECT MAX(id) FROM sesion WHERE fin IS NULL)), 0)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_clave_hash'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [*RETIRAR_TRIGGERS, "DELETE FROM contadores WHERE clave IN ('entradas', 'salidas')", *TRIGGERS],
+            reverse_sql=[
+                *RETIRAR_TRIGGERS,
+                "DELETE FROM contadores",
+                contadores_0004.INICIALIZAR,
+                *contadores_0004.TRIGGERS,
+                registro_0005.PROYECCION,
+            ],
+        ),
+        # Columnas fuera con ALTER TABLE ... DROP COLUMN (conserva WITHOUT ROWID con la
+        # clave binaria); la reversa las agrega con DEFAULT 0 por la misma razón
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(model_name='asistencia', name='data_time_entry_idx'),
+                migrations.RemoveIndex(model_name='asistencia', name='data_time_exit_idx'),
+                migrations.RemoveIndex(model_name='asistencia', name='data_presentes_idx'),
+                migrations.RemoveField(model_name='asistencia', name='time_entry'),
+                migrations.RemoveField(model_name='asistencia', name='time_exit'),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    [
+                        'DROP INDEX "data_time_entry_idx"',
+                        'DROP INDEX "data_time_exit_idx"',
+                        'DROP INDEX "data_presentes_idx"',
+                        'ALTER TABLE "data" DROP COLUMN "time_entry"',
+                        'ALTER TABLE "data" DROP COLUMN "time_exit"',
+                    ],
+                    reverse_sql=[
+                        'ALTER TABLE "data" ADD COLUMN "time_entry" bigint NOT NULL DEFAULT 0',
+                        'ALTER TABLE "data" ADD COLUMN "time_exit" bigint NOT NULL DEFAULT 0',
+                        PROYECTAR,
+                        'CREATE INDEX "data_time_entry_idx" ON "data" ("time_entry")',
+                        'CREATE INDEX "data_time_exit_idx" ON "data" ("time_exit")',
+                        'CREATE INDEX "data_presentes_idx" ON "data" ("time_entry") WHERE "time_exit" = 0',
+                    ],
+                ),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='registroescaneo',
+            name='registro_sesion_ts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='registroescaneo',
+            index=models.Index(fields=['sesion', 'tipo', 'ts'], name='registro_sesion_tipo_ts_idx'),
+        ),
+    ]
@@ -1,9 +1,31 @@
 from django.db import models
 
+from . import almacenamiento
+
+
+class HashField(models.CharField):
+    """
+    Hash SHA256 en hex, guardado como texto o como digest de 32 bytes según el
+    formato de la base (core/almacenamiento.py). El modelo siempre ve el hex.
+
+    Con la clave binaria, la búsqueda por fragmento (icontains) no coincide con
+    nada; la igualdad y __in sí se convierten.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        return almacenamiento.a_texto(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if getattr(connection, 'hash_binario', False):
+            return almacenamiento.a_binario(value)
+        return value
+
+
 class Asistencia(models.Model):
     # Mapeo de la tabla 'data'
-    # id_hash VARCHAR(64) PRIMARY KEY
-    id_hash = models.CharField(max_length=64, primary_key=True, verbose_name="Hash ID")
+    # id_hash VARCHAR(64) PRIMARY KEY (o BLOB en una tabla WITHOUT ROWID, ver HashField)
+    id_hash = HashField(max_length=64, primary_key=True, verbose_name="Hash ID")
     
     # MEJORA: Persistencia de datos personales
     # Se agregan campos para almacenar la información legible para reportes.
@@ -12,11 +34,8 @@ class Asistencia(models.Model):
     apellido = models.CharField(max_length=100, verbose_name="Apellido", blank=True, null=True)
     documento = models.CharField(max_length=20, verbose_name="Documento", blank=True, null=True)
     
-    # time_entry BIGINT NOT NULL
-    time_entry = models.BigIntegerField(default=0, verbose_name="Hora de Entrada (Unix)")
-    
-    # time_exit BIGINT NOT NULL
-    time_exit = models.BigIntegerField(default=0, verbose_name="Hora de Salida (Unix)")
+    # La entrada y la salida no se guardan aquí: se derivan de 'registro' en la sesión
+    # abierta (ver registro_abierto() y core/exportacion.py)
 
     class Meta:
         # Esto le dice a Django que use la tabla 'data'
@@ -27,4 +46,95 @@ class Asistencia(models.Model):
     def __str__(self):
         if self.nombre and self.apellido:
             return f"{self.nombre} {self.apellido} ({self.id_hash[:8]}...)"
-        return self.id_hash
\ No newline at end of file
+        return self.id_hash
+
+class EscaneoProcesado(models.Model):
+    # Registro de idempotencia para /api/procesar-qr/batch/.
+    # Cada escaneo enviado por un lector trae un 'scan_id' único; si el lote se
+    # reenvía (p. ej. tras un timeout) se devuelve el resultado guardado en lugar
+    # de volver a aplicar la transición Entrada -> Salida.
+    scan_id = models.CharField(max_length=64, primary_key=True, verbose_name="ID de Escaneo")
+    device_id = models.CharField(max_length=64, blank=True, default='', verbose_name="Dispositivo")
+    id_hash = models.CharField(max_length=64, verbose_name="Hash ID")
+    scanned_at = models.BigIntegerField(verbose_name="Hora de Escaneo (Unix)")
+
+    # Respuesta JSON entregada al lector la primera vez
+    resultado = models.JSONField(verbose_name="Resultado")
+
+    class Meta:
+        db_table = 'escaneo_procesado'
+        verbose_name = "Escaneo Procesado"
+        verbose_name_plural = "Escaneos Procesados"
+
+    def __str__(self):
+        return f"{self.scan_id} ({self.id_hash[:8]}...)"
+
+class Contador(models.Model):
+    # Total de 'asistentes' mantenido por triggers sobre 'data' (migraciones 0004 y
+    # 0007): se actualiza en la misma transacción que cualquier alta o baja (admin,
+    # import, bulk_create), así que se lee sin recorrer la tabla. Los escaneos no lo
+    # tocan: entradas y salidas se cuentan en 'registro' (core/analitica.py).
+    clave = models.CharField(max_length=32, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'contadores'
+        verbose_name = "Contador"
+        verbose_name_plural = "Contadores"
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+class Sesion(models.Model):
+    # Una jornada / evento. La sesión abierta (fin NULL, la de mayor id) es la que
+    # reciben los escaneos; `python manage.py cerrar_sesion` la cierra y abre otra.
+    nombre = models.CharField(max_length=100, blank=True, default='', verbose_name="Nombre")
+    inicio = models.BigIntegerField(verbose_name="Inicio (Unix)")
+    fin = models.BigIntegerField(blank=True, null=True, verbose_name="Fin (Unix)")
+
+    class Meta:
+        db_table = 'sesion'
+        verbose_name = "Sesión"
+        verbose_name_plural = "Sesiones"
+
+    def __str__(self):
+        return self.nombre or f"Sesión {self.pk}"
+
+class RegistroEscaneo(models.Model):
+    # Registro append-only de escaneos: una fila por entrada (tipo 1) o salida
+    # (tipo 2) de cada asistente en cada sesión. Un escaneo es UN INSERT aquí y nada
+    # más; el estado de cada asistente (presente, salió, no llegó) se lee de las filas
+    # de la sesión abierta y las sesiones cerradas quedan archivadas en esta tabla.
+    TIPOS = ((1, "Entrada"), (2, "Salida"))
+
+    # Sin índice propio: lo cubre el índice único (sesion, id_hash, tipo)
+    sesion = models.ForeignKey(Sesion, on_delete=models.PROTECT, db_index=False, verbose_name="Sesión")
+    id_hash = HashField(max_length=64, verbose_name="Hash ID")
+    tipo = models.SmallIntegerField(choices=TIPOS, verbose_name="Tipo")
+    ts = models.BigIntegerField(verbose_name="Hora (Unix)")
+
+    class Meta:
+        db_table = 'registro'
+        constraints = [
+            # Como mucho una entrada y una salida por asistente y sesión
+            models.UniqueConstraint(fields=['sesion', 'id_hash', 'tipo'], name='registro_sesion_hash_tipo_uniq'),
+        ]
+        indexes = [
+            # Entradas o salidas de una sesión por rango de hora: conteos, series y filtros
+            models.Index(fields=['sesion', 'tipo', 'ts'], name='registro_sesion_tipo_ts_idx'),
+        ]
+        verbose_name = "Registro de Escaneo"
+        verbose_name_plural = "Registro de Escaneos"
+
+    def __str__(self):
+        return f"{self.id_hash[:8]}... {self.get_tipo_display()} ({self.sesion_id})"
+
+
+def sesion_abierta():
+    """Subconsulta con el id de la sesión abierta (la de mayor id sin fin), como en core/escaneo.py."""
+    return models.Subquery(Sesion.objects.filter(fin__isnull=True).order_by('-id').values('id')[:1])
+
+
+def registro_abierto(tipo, **filtros):
+    """Filas de `tipo` (1 = entrada, 2 = salida) de la sesión abierta, con filtros opcionales."""
+    return RegistroEscaneo.objects.filter(sesion_id=sesion_abierta(), tipo=tipo, **filtros)
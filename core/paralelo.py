@@ -0,0 +1,41 @@
+"""
+Procesamiento por lotes en un pool de procesos con memoria acotada.
+
+Pool.imap() encola toda la entrada de una vez y acumula los resultados si el
+consumidor es más lento (p. ej. una descarga HTTP lenta). Aquí cada proceso
+tiene como mucho EN_VUELO_POR_PROCESO lotes pendientes: la entrada se lee a
+medida que se consumen los resultados.
+"""
+import multiprocessing
+from collections import deque
+
+EN_VUELO_POR_PROCESO = 2
+
+
+def en_paralelo(funcion, lotes, procesos, *args):
+    """
+    Aplica funcion(lote, *args) a cada lote en `procesos` procesos y entrega
+    los resultados en el mismo orden que los lotes.
+    `funcion` debe estar definida a nivel de módulo (se envía por pickle).
+    """
+    procesos = max(1, procesos)
+    with multiprocessing.Pool(procesos) as pool:
+        en_vuelo = deque()
+        for lote in lotes:
+            en_vuelo.append(pool.apply_async(funcion, (lote, *args)))
+            if len(en_vuelo) >= EN_VUELO_POR_PROCESO * procesos:
+                yield en_vuelo.popleft().get()
+        while en_vuelo:
+            yield en_vuelo.popleft().get()
+
+
+def en_lotes(iterable, tamano):
+    """Agrupa un iterable en listas de `tamano` elementos sin leerlo entero."""
+    lote = []
+    for item in iterable:
+        lote.append(item)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
@@ -0,0 +1,158 @@
+"""
+Hash, contenido firmado e imagen QR de un asistente.
+
+Este módulo NO depende de Django: lo usan las vistas, el escáner de escritorio
+y también los procesos hijos del import masivo (importar_padron), que no
+necesitan cargar settings. La clave de firma sale de la variable de entorno
+QR_CLAVE, la misma para todos esos procesos.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import io
+import os
+import re
+
+import qrcode
+
+
+def generar_hash(nombre, apellido, documento):
+    """
+    Genera un hash SHA256 único basado en los datos del usuario.
+    """
+    to_hash = f"{nombre}{apellido}{documento}"
+    return hashlib.sha256(to_hash.encode()).hexdigest()
+
+
+# -------------------------------------------------------------------------
+# Contenido del QR
+# -------------------------------------------------------------------------
+# Compacto: VERSION_COMPACTO + base32(primeros BYTES_PREFIJO bytes del hash +
+# BYTES_FIRMA bytes de HMAC-SHA256 del prefijo). Son 25 caracteres del modo
+# alfanumérico del QR (versión 1, 21x21 módulos) contra los 64 hex del hash
+# (versión 4, 33x33), y se verifica sin la base de datos: un QR ajeno o
+# falsificado se rechaza antes de consultarla. El prefijo identifica al
+# asistente (80 bits: sin colisiones en la práctica) y se resuelve contra la
+# tabla con core.escaneo.resolver_prefijo.
+# Legado: el hash completo (64 hex en minúsculas), el de los pases ya impresos.
+
+# Sin QR_CLAVE se firma con CLAVE_DESARROLLO, que es pública: cualquiera podría fabricar
+# pases válidos. Fuera de desarrollo (DJANGO_DEBUG distinto de 'True') ni el servidor
+# (asistencia_qr/settings.py) ni el escáner de escritorio (main.py) arrancan sin ella
+CLAVE_DESARROLLO = 'asistencia-qr-dev-cambiar-en-produccion'
+CLAVE_DEFINIDA = bool(os.environ.get('QR_CLAVE'))
+CLAVE = (os.environ.get('QR_CLAVE') or CLAVE_DESARROLLO).encode()
+
+VERSION_COMPACTO = '1'
+BYTES_PREFIJO = 10
+BYTES_FIRMA = 5
+LARGO_COMPACTO = len(VERSION_COMPACTO) + (BYTES_PREFIJO + BYTES_FIRMA) * 8 // 5
+
+_HASH = re.compile(r'[0-9a-f]{64}')
+
+
+def _firma(prefijo, clave):
+    return hmac.digest(clave, b'asistencia-qr:' + VERSION_COMPACTO.encode() + prefijo, 'sha256')[:BYTES_FIRMA]
+
+
+def contenido_compacto(hash_id, clave=CLAVE):
+    """Contenido firmado del QR de `hash_id` (ver arriba)."""
+    prefijo = bytes.fromhex(hash_id[:2 * BYTES_PREFIJO])
+    return VERSION_COMPACTO + base64.b32encode(prefijo + _firma(prefijo, clave)).decode()
+
+
+def leer_contenido(texto, clave=CLAVE, legado=True):
+    """
+    Verifica el texto leído de un QR sin tocar la base de datos.
+    Retorna el hash (64 hex) de un pase legado, el prefijo (hex, 2 * BYTES_PREFIJO
+    caracteres) de un pase compacto con firma válida, o None si el código es ajeno,
+    está falsificado o es legado y `legado` es False.
+    """
+    if len(texto) == LARGO_COMPACTO and texto.startswith(VERSION_COMPACTO):
+        try:
+            datos = base64.b32decode(texto[len(VERSION_COMPACTO):])
+        except (binascii.Error, ValueError):
+            return None
+        prefijo, firma = datos[:BYTES_PREFIJO], datos[BYTES_PREFIJO:]
+        return prefijo.hex() if hmac.compare_digest(firma, _firma(prefijo, clave)) else None
+    if legado and _HASH.fullmatch(texto):
+        return texto
+    return None
+
+
+def es_prefijo(identificador):
+    """True si leer_contenido devolvió un prefijo (hay que resolverlo) y no un hash completo."""
+    return len(identificador) == 2 * BYTES_PREFIJO
+
+
+# Parámetros de dibujo. Forman parte del nombre de cada PNG en caché: si cambian,
+# las imágenes viejas simplemente dejan de usarse (no hay que invalidar nada).
+# 'contenido': 'compacto' (firmado) o 'hash' (legado).
+PARAMETROS = {
+    'version': 1,
+    'error_correction': 'L',
+    'box_size': 10,
+    'border': 4,
+    'contenido': 'compacto',
+}
+# Incluye la clave (por su firma de un valor fijo): si cambia, los PNG se vuelven a dibujar
+CLAVE_RENDER = hashlib.sha256(
+    repr(sorted(PARAMETROS.items())).encode() + _firma(bytes(BYTES_PREFIJO), CLAVE)
+).hexdigest()[:8]
+
+_CORRECCION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,  # type: ignore
+    'M': qrcode.constants.ERROR_CORRECT_M,  # type: ignore
+    'Q': qrcode.constants.ERROR_CORRECT_Q,  # type: ignore
+    'H': qrcode.constants.ERROR_CORRECT_H,  # type: ignore
+}
+
+
+def contenido(hash_id):
+    """Texto que se codifica en el QR de `hash_id`, según PARAMETROS['contenido']."""
+    return contenido_compacto(hash_id) if PARAMETROS['contenido'] == 'compacto' else hash_id
+
+
+def renderizar_png(hash_id):
+    """Retorna los bytes PNG del código QR de `hash_id`."""
+    qr = qrcode.QRCode(
+        version=PARAMETROS['version'],
+        error_correction=_CORRECCION[PARAMETROS['error_correction']],
+        box_size=PARAMETROS['box_size'],
+        border=PARAMETROS['border'],
+    )
+    qr.add_data(contenido(hash_id))
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")  # type: ignore
+    return buffer.getvalue()
+
+
+def etag(hash_id):
+    """ETag del PNG: depende solo del contenido (hash + parámetros de dibujo y clave)."""
+    return f"{hash_id}-{CLAVE_RENDER}"
+
+
+def ruta_png(directorio, hash_id):
+    return os.path.join(directorio, f"{etag(hash_id)}.png")
+
+
+def guardar_png(directorio, hash_id):
+    """
+    Escribe el PNG de `hash_id` en la caché de `directorio` si todavía no existe.
+    El nombre depende solo del hash y de PARAMETROS, así que un archivo
+    existente ya es el correcto.
+    Retorna True si se generó la imagen.
+    """
+    ruta = ruta_png(directorio, hash_id)
+    if os.path.exists(ruta):
+        return False
+    # Archivo temporal + rename: otro proceso nunca ve un PNG a medio escribir
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(renderizar_png(hash_id))
+    os.replace(tmp, ruta)
+    return True
@@ -0,0 +1,88 @@
+"""
+Caché negativa en memoria (por proceso) del padrón de asistentes, indexada por hash.
+
+Evita ir a SQLite en los escaneos de hashes desconocidos (QR ajenos o basura):
+cada hash que la base de datos no encontró se recuerda TTL_NEGATIVO segundos,
+en un LRU acotado (MAX_NEGATIVOS) para que una avalancha de códigos ajenos no
+crezca sin límite.
+
+Los asistentes conocidos NO se cachean: su transición siempre se decide en la
+base de datos (un cambio de sesión, otro worker o el escáner de escritorio no
+pasan por este proceso), así que guardarlos solo ocuparía memoria.
+
+Límite conocido: un asistente registrado por OTRO proceso (otro worker, el
+escáner de escritorio, un import masivo) puede seguir respondiendo "no
+encontrado" en este proceso hasta TTL_NEGATIVO segundos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Marcador para hashes que no existen en la base de datos
+NO_EXISTE = object()
+
+
+class RosterCache:
+    """LRU acotado con expiración por entrada: hash -> instante en que vence."""
+
+    def __init__(self, ttl_negativo=30, max_negativos=5000):
+        self.max_negativos = max_negativos
+        self.ttl_negativo = ttl_negativo
+        self._negativos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos_negativos = 0
+        self.fallos = 0
+        self.expulsiones_negativas = 0
+
+    def obtener(self, hash_id):
+        """Retorna NO_EXISTE si el hash se sabe inexistente, o None si no está o expiró."""
+        ahora = time.monotonic()
+        with self._lock:
+            expira = self._negativos.get(hash_id)
+            if expira is not None and expira < ahora:
+                del self._negativos[hash_id]
+                expira = None
+            if expira is None:
+                self.fallos += 1
+                return None
+            self._negativos.move_to_end(hash_id)
+            self.aciertos_negativos += 1
+            return NO_EXISTE
+
+    def guardar_inexistente(self, hash_id):
+        with self._lock:
+            self._negativos[hash_id] = time.monotonic() + self.ttl_negativo
+            self._negativos.move_to_end(hash_id)
+            while len(self._negativos) > self.max_negativos:
+                self._negativos.popitem(last=False)
+                self.expulsiones_negativas += 1
+
+    def invalidar(self, hash_id):
+        with self._lock:
+            self._negativos.pop(hash_id, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._negativos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos_negativos + self.fallos
+            return {
+                'negativos': len(self._negativos),
+                'max_negativos': self.max_negativos,
+                'aciertos_negativos': self.aciertos_negativos,
+                'fallos': self.fallos,
+                'expulsiones_negativas': self.expulsiones_negativas,
+                'tasa_aciertos': round(self.aciertos_negativos / consultas, 4) if consultas else 0.0,
+            }
+
+
+_config = getattr(settings, 'ROSTER_CACHE', {})
+
+roster = RosterCache(
+    ttl_negativo=_config.get('TTL_NEGATIVO', 30),
+    max_negativos=_config.get('MAX_NEGATIVOS', 5000),
+)
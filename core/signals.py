@@ -0,0 +1,27 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import almacenamiento
+from .models import Asistencia
+from .roster import roster
+
+
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    """
+    Aplica los mismos PRAGMAs que usa el escáner de escritorio (core/almacenamiento.py).
+    hash_binario indica a HashField (core/models.py) el formato de la clave de 'data'.
+    """
+    if connection.vendor == 'sqlite':
+        connection.hash_binario = almacenamiento.configurar(connection.connection)
+
+
+@receiver(post_save, sender=Asistencia)
+@receiver(post_delete, sender=Asistencia)
+def invalidar_roster(sender, instance, **kwargs):
+    """
+    Cualquier alta, edición (p. ej. desde el admin) o borrado de un asistente
+    descarta su entrada en la caché; el siguiente escaneo la vuelve a leer.
+    """
+    roster.invalidar(instance.pk)
@@ -0,0 +1,1346 @@
+import asyncio
+import functools
+import io
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from unittest import mock, skipIf
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.test import Client, LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from .models import Asistencia, RegistroEscaneo, Sesion
+from . import analitica
+from . import eventos, metricas, views
+from .middleware import CONSULTAS, MetricasMiddleware
+from .roster import NO_EXISTE, RosterCache, roster
+from . import almacenamiento, escaneo
+from .escaneo import VentanaDuplicados
+from .views import ventana
+from . import qr
+from .qr import generar_hash
+from .credenciales import exportar_zip
+from .exportacion import ESTADOS, HoraLocal, con_horas, entrada_entre
+
+# Módulos del escáner de escritorio (raíz del proyecto): necesitan OpenCV y numpy,
+# que un servidor sin escáner puede no tener instalados
+try:
+    import cv2
+    import numpy as np
+    import decoders
+    import client
+    import journal
+    import main
+    import sources
+    import standin_server
+    from gating import DecodeGate
+except ImportError:
+    DecodeGate = None
+SIN_ESCRITORIO = DecodeGate is None
+
+# Hashes de pases legados: las APIs rechazan cualquier otro código sin consultar la BD
+H1 = '1' * 64
+DESCONOCIDO = 'f' * 64
+
+
+def registrar(filas):
+    """Carga (hash, entrada, salida) en el registro de la sesión abierta (0 = sin esa fila)."""
+    sesion = Sesion.objects.filter(fin__isnull=True).order_by('-id').first() or Sesion.objects.create(inicio=0)
+    RegistroEscaneo.objects.bulk_create(
+        (
+            RegistroEscaneo(sesion=sesion, id_hash=hash_id, tipo=tipo, ts=ts)
+            for hash_id, entrada, salida in filas
+            for tipo, ts in ((escaneo.ENTRADA, entrada), (escaneo.SALIDA, salida)) if ts
+        ),
+        batch_size=5000,
+    )
+
+
+def horas(hash_id):
+    """(entrada, salida) de `hash_id` en la sesión abierta, como las ve el admin."""
+    return con_horas(Asistencia.objects.filter(id_hash=hash_id)).values_list('hora_entrada', 'hora_salida').get()
+
+
+class ProcesarQrConcurrenciaTests(TransactionTestCase):
+    """
+    Varios lectores escaneando el mismo QR a la vez: la transición atómica
+    (core/escaneo.py) debe registrar exactamente una entrada y una salida.
+    """
+
+    HILOS = 20
+    ESCANEOS_POR_HILO = 5
+
+    def setUp(self):
+        # La caché del padrón es global al proceso: no arrastrar estado entre tests
+        roster.limpiar()
+        # Sin ventana de duplicados: cada escaneo debe llegar a la base de datos
+        parche = mock.patch.object(ventana, 'segundos', 0)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_mismo_hash_desde_muchos_hilos(self):
+        hash_id = 'a' * 64
+        Asistencia.objects.create(id_hash=hash_id, nombre='Ana')
+
+        resultados = []
+        errores = []
+        lock = threading.Lock()
+        inicio = threading.Barrier(self.HILOS)
+
+        def lector():
+            client = Client()
+            try:
+                inicio.wait()
+                for _ in range(self.ESCANEOS_POR_HILO):
+                    respuesta = client.post(
+                        '/api/procesar-qr/',
+                        json.dumps({'hash_id': hash_id}),
+                        content_type='application/json',
+                    )
+                    with lock:
+                        resultados.append((respuesta.status_code, respuesta.json().get('type')))
+            except Exception as e:
+                with lock:
+                    errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=lector) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        conteo = Counter(resultados)
+        self.assertEqual(conteo[(200, 'entrada')], 1)
+        self.assertEqual(conteo[(200, 'salida')], 1)
+        self.assertEqual(conteo[(200, 'completado')], self.HILOS * self.ESCANEOS_POR_HILO - 2)
+
+        self.assertEqual(sorted(RegistroEscaneo.objects.filter(id_hash=hash_id).values_list('tipo', flat=True)),
+                         [escaneo.ENTRADA, escaneo.SALIDA])
+
+
+    async def test_mismo_hash_en_la_api_async(self):
+        # Escaneos simultáneos en el event loop: todos pasan por el único hilo escritor
+        # (que conserva su conexión: se cierra al final para no dejar el -wal de la base de prueba)
+        self.addCleanup(lambda: views._escritor_bd.submit(lambda: connection.close()).result())
+        hash_id = 'b' * 64
+        await Asistencia.objects.acreate(id_hash=hash_id, nombre='Ana')
+
+        respuestas = await asyncio.gather(*(
+            self.async_client.post('/api/procesar-qr/async/', {'hash_id': hash_id}, content_type='application/json')
+            for _ in range(50)
+        ))
+        conteo = Counter((r.status_code, r.json().get('type')) for r in respuestas)
+        self.assertEqual(conteo, {(200, 'entrada'): 1, (200, 'salida'): 1, (200, 'completado'): 48})
+
+        # Un hash que la caché negativa conoce se responde sin pasar por el hilo escritor
+        roster.guardar_inexistente('c' * 64)
+        with mock.patch.object(views._escritor_bd, 'submit') as submit:
+            respuesta = await self.async_client.post(
+                '/api/procesar-qr/async/', {'hash_id': 'c' * 64}, content_type='application/json'
+            )
+        self.assertEqual(respuesta.status_code, 404)
+        submit.assert_not_called()
+
+
+class CargaEscaneosTests(TransactionTestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+
+    def test_reporte_por_nivel_sin_resultados_inesperados(self):
+        # Un asistente real con el apellido de los sembrados no se toca
+        Asistencia.objects.create(id_hash='h1', nombre='Ana', apellido='Carga')
+        registrar([('h1', 100, 0)])
+        salida = io.StringIO()
+        call_command('carga_escaneos', escaneres='1,4', segundos=0.5, asistentes=300, json=True,
+                     base_configurada=True, stdout=salida)
+
+        reportes = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        self.assertEqual([r['escaneres'] for r in reportes], [1, 4])
+        for reporte in reportes:
+            self.assertGreater(reporte['escaneos'], 0)
+            self.assertIn('200 entrada', reporte['resultados'])
+            self.assertLessEqual(reporte['p50_ms'], reporte['p99_ms'])
+            self.assertEqual(reporte['inesperados'], {})
+
+        # Los asistentes sembrados (y sus escaneos) se borran; el resto no se toca
+        self.assertEqual(list(Asistencia.objects.values_list('id_hash', flat=True)), ['h1'])
+        self.assertEqual(list(RegistroEscaneo.objects.values_list('id_hash', flat=True)), ['h1'])
+
+    def test_por_defecto_usa_una_base_temporal(self):
+        Asistencia.objects.create(id_hash='h1', nombre='Ana')
+        nombre = connection.settings_dict['NAME']
+        salida = io.StringIO()
+        call_command('carga_escaneos', escaneres='2', segundos=0.3, asistentes=50, json=True, stdout=salida)
+
+        self.assertGreater(json.loads(salida.getvalue())['escaneos'], 0)
+        self.assertEqual(connection.settings_dict['NAME'], nombre)
+        self.assertEqual(list(Asistencia.objects.values_list('id_hash', flat=True)), ['h1'])
+        self.assertEqual(RegistroEscaneo.objects.count(), 0)
+
+        # Contra un servidor siembra en su base: solo con el flag explícito
+        with self.assertRaisesMessage(CommandError, '--base-configurada'):
+            call_command('carga_escaneos', url='http://127.0.0.1:9', stdout=salida)
+
+
+class ProcesarQrLoteTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+
+    def enviar(self, scans):
+        return self.client.post(
+            '/api/procesar-qr/batch/',
+            json.dumps({'scans': scans}),
+            content_type='application/json',
+        )
+
+    def test_orden_cronologico_e_idempotencia(self):
+        scans = [
+            {'hash_id': H1, 'scanned_at': 1700000100, 'scan_id': 's2', 'device_id': 'puerta-1'},
+            {'hash_id': H1, 'scanned_at': 1700000000, 'scan_id': 's1'},
+        ]
+        primera = self.enviar(scans).json()['results']
+        self.assertEqual([r['type'] for r in primera], ['salida', 'entrada'])
+        self.assertEqual([r['duplicado'] for r in primera], [False, False])
+
+        # Reenvío tras un timeout: mismos resultados, sin aplicar de nuevo
+        segunda = self.enviar(scans).json()['results']
+        self.assertEqual([r['type'] for r in segunda], ['salida', 'entrada'])
+        self.assertEqual([r['duplicado'] for r in segunda], [True, True])
+
+        self.assertEqual(horas(H1), (1700000000, 1700000100))
+
+    def test_items_invalidos_no_abortan_el_lote(self):
+        respuesta = self.enviar([
+            {'hash_id': {'x': 1}, 'scan_id': 'a'},
+            {'hash_id': H1, 'scan_id': ['b']},
+            {'hash_id': H1, 'scan_id': 'c', 'scanned_at': 'ayer'},
+            {'hash_id': H1, 'scan_id': 'd'},
+        ])
+        self.assertEqual(respuesta.status_code, 200)
+        estados = [r['status'] for r in respuesta.json()['results']]
+        self.assertEqual(estados, ['error', 'error', 'error', 'success'])
+
+    def test_scanned_at_no_finito_o_fuera_de_rango(self):
+        # json.dumps escribe NaN / Infinity tal cual y json.loads los acepta
+        valores = (float('nan'), float('inf'), -float('inf'), 1e300, -5, 0, True)
+        respuesta = self.enviar([
+            {'hash_id': H1, 'scan_id': f'x{n}', 'scanned_at': valor} for n, valor in enumerate(valores)
+        ])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            {r['message'] for r in respuesta.json()['results']},
+            {'scanned_at debe ser un timestamp Unix'},
+        )
+
+    def test_procesar_qr_rechaza_cuerpos_invalidos(self):
+        for cuerpo in ([1, 2], {'hash_id': ['h1']}, {'hash_id': 5}):
+            respuesta = self.client.post('/api/procesar-qr/', json.dumps(cuerpo), content_type='application/json')
+            self.assertEqual(respuesta.status_code, 400)
+
+
+class RosterCacheTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+
+    def escanear(self, hash_id):
+        respuesta = self.client.post('/api/procesar-qr/', json.dumps({'hash_id': hash_id}), content_type='application/json')
+        return respuesta.json().get('type', respuesta.json()['status'])
+
+    def test_reinicio_masivo_no_queda_oculto_por_la_cache(self):
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+        for esperado in ('entrada', 'salida', 'completado'):
+            ventana.limpiar()
+            self.assertEqual(self.escanear(H1), esperado)
+
+        # El cambio de sesión no pasa por el ORM (sin señales): la caché no debe responder 'completado'
+        call_command('cerrar_sesion', stdout=io.StringIO())
+        ventana.limpiar()
+        self.assertEqual(self.escanear(H1), 'entrada')
+
+    def test_hash_desconocido_no_consulta_la_bd(self):
+        # El write-through se aplica en on_commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.escanear(DESCONOCIDO), 'not_found')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.escanear(DESCONOCIDO), 'not_found')
+
+    def test_asistentes_sin_precarga_ni_cache(self):
+        # El primer escaneo no carga el padrón: un solo INSERT ... RETURNING
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.escanear(H1), 'entrada')
+        self.assertEqual(roster.estadisticas()['negativos'], 0)
+
+    def test_negativos_acotados_y_con_ttl(self):
+        cache = RosterCache(ttl_negativo=30, max_negativos=5)
+        for n in range(100):
+            cache.guardar_inexistente(f'basura-{n}')
+        self.assertEqual(cache.estadisticas()['negativos'], 5)
+        self.assertIs(cache.obtener('basura-99'), NO_EXISTE)
+        self.assertIsNone(cache.obtener('basura-0'))
+        with mock.patch('core.roster.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertIsNone(cache.obtener('basura-99'))
+
+
+class SesionesTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+        Asistencia.objects.create(id_hash='h1', nombre='Ana')
+        Asistencia.objects.create(id_hash='h2', nombre='Luis')
+
+    def escanear(self, hash_id, ahora):
+        return escaneo.TIPOS[views.aplicar_escaneo(hash_id, ahora)[0]]
+
+    def test_escaneo_solo_inserta_en_el_registro(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.escanear('h1', 1000), 'entrada')
+            self.assertEqual(self.escanear('h1', 2000), 'salida')
+        escrituras = [q['sql'].split()[:3] for q in consultas if not q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(escrituras, [['INSERT', 'INTO', 'registro']] * 2)
+        # ... y ningún trigger escribe por detrás
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'registro'")
+            self.assertEqual(cursor.fetchall(), [])
+
+        registro = RegistroEscaneo.objects.filter(id_hash='h1').order_by('ts')
+        self.assertEqual([(r.tipo, r.ts) for r in registro], [(1, 1000), (2, 2000)])
+        # El estado de la sesión abierta se deriva del registro (admin, exportación, analítica)
+        self.assertEqual(horas('h1'), (1000, 2000))
+        self.assertEqual(list(Asistencia.objects.filter(ESTADOS['salio']).values_list('nombre', flat=True)), ['Ana'])
+
+    def test_cerrar_sesion_archiva_y_reinicia(self):
+        self.escanear('h1', 1000)
+        self.escanear('h1', 2000)
+        self.escanear('h2', 1500)
+        self.assertEqual(self.escanear('h1', 3000), 'completado')
+        cerrada = Sesion.objects.get(fin__isnull=True)
+
+        # Cerrar la sesión no reescribe 'data': solo toca 'sesion'
+        salida = io.StringIO()
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('cerrar_sesion', nombre='Día 2', stdout=salida)
+        self.assertIn('3 escaneos archivados', salida.getvalue())
+        escrituras = [q['sql'].split()[:3] for q in consultas
+                      if q['sql'].lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual(escrituras, [['UPDATE', 'sesion', 'SET'], ['INSERT', 'INTO', 'sesion']])
+
+        cerrada.refresh_from_db()
+        self.assertIsNotNone(cerrada.fin)
+        self.assertEqual(RegistroEscaneo.objects.filter(sesion=cerrada).count(), 3)
+        self.assertEqual(Asistencia.objects.filter(ESTADOS['sin_llegar']).count(), 2)
+        self.assertEqual(analitica.totales()['entradas'], 0)
+
+        # Nueva jornada: el mismo pase vuelve a registrar entrada
+        ventana.limpiar()
+        self.assertEqual(self.escanear('h1', 90000), 'entrada')
+        nueva = Sesion.objects.get(fin__isnull=True)
+        self.assertEqual(nueva.nombre, 'Día 2')
+        self.assertEqual(RegistroEscaneo.objects.get(sesion=nueva).ts, 90000)
+
+    def test_sin_sesion_abierta_se_abre_una(self):
+        Sesion.objects.update(fin=1)
+        self.assertEqual(self.escanear('h1', 1000), 'entrada')
+        self.assertEqual(Sesion.objects.filter(fin__isnull=True).count(), 1)
+
+
+class VentanaDuplicadosTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+
+    def escanear(self, hash_id):
+        return self.client.post('/api/procesar-qr/', json.dumps({'hash_id': hash_id}), content_type='application/json').json()
+
+    def test_repetido_dentro_de_la_ventana_no_toca_la_bd(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            primera = self.escanear(H1)
+        self.assertEqual(primera['type'], 'entrada')
+
+        # El lector envía el mismo QR en varios cuadros seguidos: no debe registrarse la salida
+        with self.assertNumQueries(0):
+            segunda = self.escanear(H1)
+        self.assertEqual(segunda, primera)
+        self.assertFalse(RegistroEscaneo.objects.filter(id_hash=H1, tipo=escaneo.SALIDA).exists())
+
+    def test_expira_y_se_acota(self):
+        v = VentanaDuplicados(segundos=5, max_entradas=3)
+        v.guardar('h1', 'r1', ahora=100)
+        self.assertEqual(v.consultar('h1', ahora=104), 'r1')
+        self.assertIsNone(v.consultar('h1', ahora=105))
+
+        for n in range(10):
+            v.guardar(f'h{n}', n, ahora=200)
+        self.assertEqual(len(v._datos), 3)
+        self.assertEqual(v.consultar('h9', ahora=201), 9)
+
+        self.assertIsNone(VentanaDuplicados(segundos=0).consultar('h1'))
+
+    def test_scanned_at_del_cliente_no_altera_la_ventana(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.escanear(H1)['type'], 'entrada')
+
+        # Un lote con la hora adelantada de otra puerta y uno histórico (reenvío tras un corte)
+        Asistencia.objects.create(id_hash=DESCONOCIDO, nombre='Luis')
+        ahora = int(time.time())
+        for scan_id, scanned_at in (('futuro', ahora + 10 ** 6), ('viejo', ahora - 10 ** 6)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/procesar-qr/batch/', json.dumps({'scans': [
+                    {'hash_id': DESCONOCIDO, 'scan_id': scan_id, 'scanned_at': scanned_at},
+                ]}), content_type='application/json')
+
+        # El repetido en vivo sigue dentro de la ventana: no se convierte en salida
+        self.assertEqual(self.escanear(H1)['type'], 'entrada')
+        self.assertEqual(RegistroEscaneo.objects.filter(id_hash=H1).count(), 1)
+        # Los dos escaneos de Luis se registraron con su propia hora (entrada y salida)
+        self.assertEqual(RegistroEscaneo.objects.filter(id_hash=DESCONOCIDO).count(), 2)
+
+
+class ImportarPadronTests(TestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = carpeta.name
+        self.csv = os.path.join(self.carpeta, 'padron.csv')
+        with open(self.csv, 'w', encoding='utf-8') as f:
+            f.write('Nombre,Apellido,Documento\n')
+            f.write('Ana,Pérez,12345678\n')
+            f.write('Luis,Soto,87654321\n')
+            f.write('Ana,Pérez,12345678\n')   # repetida
+            f.write('Sin,Documento,\n')
+
+    def importar(self):
+        salida = tempfile.SpooledTemporaryFile(mode='w+')
+        call_command('importar_padron', self.csv, procesos=2, lote=2,
+                     qr_dir=os.path.join(self.carpeta, 'qr'), stdout=salida, stderr=salida)
+
+    def test_reimportar_no_duplica_ni_borra_asistencia(self):
+        self.importar()
+        hash_ana = generar_hash('Ana', 'Pérez', '12345678')
+        self.assertEqual(Asistencia.objects.count(), 2)
+        self.assertTrue(os.path.exists(qr.ruta_png(os.path.join(self.carpeta, 'qr'), hash_ana)))
+
+        registrar([(hash_ana, 100, 0)])
+        self.importar()
+        self.assertEqual(Asistencia.objects.count(), 2)
+        self.assertEqual(Asistencia.objects.get(id_hash=hash_ana).nombre, 'Ana')
+        self.assertEqual(horas(hash_ana), (100, 0))
+
+
+class QrPngTests(TestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajuste = override_settings(QR_DIR=carpeta.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.hash_id = generar_hash('Ana', 'Pérez', '12345678')
+
+    def test_registro_usa_la_cache_y_no_incrusta_base64(self):
+        datos = {'nombre': 'Ana', 'apellido': 'Pérez', 'documento': '12345678'}
+        with mock.patch('core.qr.renderizar_png', wraps=qr.renderizar_png) as renderizar:
+            primera = self.client.post('/', datos)
+            self.client.post('/', datos)
+        self.assertEqual(renderizar.call_count, 1)
+        self.assertNotContains(primera, 'base64')
+        self.assertContains(primera, f'/qr/{self.hash_id}.png')
+
+    def test_etag_y_get_condicional(self):
+        Asistencia.objects.create(id_hash=self.hash_id, nombre='Ana')
+        url = f'/qr/{self.hash_id}.png'
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/png')
+        self.assertIn('max-age', respuesta['Cache-Control'])
+        self.assertTrue(b''.join(respuesta.streaming_content).startswith(b'\x89PNG'))
+
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_hash_no_registrado_no_llena_la_cache(self):
+        self.assertEqual(self.client.get(f'/qr/{self.hash_id}.png').status_code, 404)
+        self.assertEqual(self.client.get('/qr/no-es-un-hash.png').status_code, 404)
+
+
+class PaseFirmadoTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+        self.hash_id = generar_hash('Ana', 'Pérez', '12345678')
+        Asistencia.objects.create(id_hash=self.hash_id, nombre='Ana')
+        self.pase = qr.contenido_compacto(self.hash_id)
+
+    def escanear(self, texto, ruta='/api/procesar-qr/'):
+        return self.client.post(ruta, json.dumps({'hash_id': texto}), content_type='application/json')
+
+    def test_contenido_compacto_y_verificacion(self):
+        self.assertEqual(qr.contenido(self.hash_id), self.pase)
+        self.assertEqual(len(self.pase), qr.LARGO_COMPACTO)
+        self.assertEqual(qr.leer_contenido(self.pase), self.hash_id[:2 * qr.BYTES_PREFIJO])
+        self.assertIsNone(qr.leer_contenido(self.pase, clave=b'otra clave'))
+        self.assertEqual(qr.leer_contenido(self.hash_id), self.hash_id)
+        self.assertIsNone(qr.leer_contenido(self.hash_id, legado=False))
+
+    def test_pase_compacto_registra_con_el_hash_completo(self):
+        respuesta = self.escanear(self.pase)
+        self.assertEqual(respuesta.json()['type'], 'entrada')
+        self.assertEqual(RegistroEscaneo.objects.get().id_hash, self.hash_id)
+
+        lote = self.client.post('/api/procesar-qr/batch/', json.dumps({'scans': [
+            {'hash_id': self.pase, 'scan_id': 's1', 'scanned_at': int(time.time()) + 60},
+        ]}), content_type='application/json')
+        self.assertEqual(lote.json()['results'][0]['type'], 'salida')
+
+    def test_codigos_ajenos_o_falsificados_no_consultan_la_bd(self):
+        alterado = self.pase[:-1] + ('A' if self.pase[-1] != 'A' else 'B')
+        for texto in (alterado, 'https://example.com/promo', self.hash_id.upper()):
+            with self.assertNumQueries(0):
+                respuesta = self.escanear(texto)
+            self.assertEqual((respuesta.status_code, respuesta.json()['message']), (404, 'Código QR no válido'))
+
+        with self.settings(QR_LEGADO=False):
+            self.assertEqual(self.escanear(self.hash_id).json()['message'], 'Código QR no válido')
+            self.assertEqual(self.escanear(self.pase).json()['type'], 'entrada')
+
+
+class ClaveQrProduccionTests(SimpleTestCase):
+    """Sin QR_CLAVE y con DJANGO_DEBUG=False no arrancan ni el servidor ni el escáner."""
+
+    def correr(self, argumentos, **entorno):
+        variables = {k: v for k, v in os.environ.items() if k not in ('QR_CLAVE', 'DJANGO_DEBUG')}
+        variables.update(DJANGO_SETTINGS_MODULE='asistencia_qr.settings', **entorno)
+        return subprocess.run([sys.executable, *argumentos], cwd=settings.BASE_DIR, env=variables,
+                              capture_output=True, text=True, timeout=60)
+
+    def test_servidor(self):
+        arranque = ['-c', 'import django; django.setup()']
+        fallo = self.correr(arranque, DJANGO_DEBUG='False')
+        self.assertNotEqual(fallo.returncode, 0)
+        self.assertIn('QR_CLAVE', fallo.stderr)
+        self.assertEqual(self.correr(arranque, DJANGO_DEBUG='False', QR_CLAVE='secreta').returncode, 0)
+        self.assertEqual(self.correr(arranque).returncode, 0)   # desarrollo: clave de desarrollo
+
+    @skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+    def test_escaner_de_escritorio(self):
+        fallo = self.correr(['main.py', '--headless'], DJANGO_DEBUG='False')
+        self.assertEqual(fallo.returncode, 2)
+        self.assertIn('QR_CLAVE', fallo.stderr)
+
+
+class ClaveBinariaTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+        self.hash_id = generar_hash('Ana', 'Pérez', '12345678')
+        Asistencia.objects.create(id_hash=self.hash_id, nombre='Ana')
+        self.convertir(True)
+        self.addCleanup(self.convertir, False)
+
+    def convertir(self, binario):
+        with connection.cursor() as cursor:
+            connection.hash_binario = almacenamiento.convertir_hash(cursor, binario)
+
+    def consultar(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def test_conversion_en_el_lugar(self):
+        self.assertEqual(self.consultar("SELECT typeof(id_hash), length(id_hash) FROM data"), [('blob', 32)])
+        self.assertIn('WITHOUT ROWID', self.consultar("SELECT sql FROM sqlite_master WHERE name = 'data'")[0][0])
+        self.assertEqual(list(Asistencia.objects.values_list('id_hash', flat=True)), [self.hash_id])
+
+        self.convertir(False)
+        self.assertEqual(self.consultar("SELECT id_hash, nombre FROM data"), [(self.hash_id, 'Ana')])
+        self.assertNotIn('WITHOUT ROWID', self.consultar("SELECT sql FROM sqlite_master WHERE name = 'data'")[0][0])
+
+    def test_escaneos_con_la_clave_binaria(self):
+        respuesta = self.client.post('/api/procesar-qr/', json.dumps({'hash_id': qr.contenido_compacto(self.hash_id)}),
+                                     content_type='application/json')
+        self.assertEqual(respuesta.json()['type'], 'entrada')
+        self.assertEqual(RegistroEscaneo.objects.get().id_hash, self.hash_id)
+        self.assertGreater(horas(self.hash_id)[0], 0)
+        self.assertEqual(list(Asistencia.objects.filter(ESTADOS['presente']).values_list('pk', flat=True)), [self.hash_id])
+        self.assertEqual(analitica.totales()['ocupacion'], 1)
+
+        with connection.cursor() as cursor:
+            self.assertEqual(escaneo.registrar_escaneo(cursor, self.hash_id)[0], escaneo.SALIDA)
+            self.assertEqual(escaneo.registrar_escaneo(cursor, DESCONOCIDO)[0], escaneo.NO_ENCONTRADO)
+            self.assertEqual(escaneo.registrar_escaneo(cursor, 'no-es-hex')[0], escaneo.NO_ENCONTRADO)
+            self.assertIsNone(escaneo.resolver_prefijo(cursor, 'f' * 20))
+
+
+class ExportarCredencialesTests(TestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = carpeta.name
+
+    def filas(self, cantidad):
+        return ((f'{n:064x}', f'N{n}', f'A{n}', f'{10000000 + n}') for n in range(cantidad))
+
+    def test_zip_por_partes(self):
+        trozos = list(exportar_zip(self.filas(120), 'png', procesos=2, directorio_qr=self.carpeta))
+        self.assertGreater(len(trozos), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(trozos))) as archivo:
+            nombres = archivo.namelist()
+            self.assertEqual(len(nombres), 120)
+            self.assertTrue(archivo.read(nombres[0]).startswith(b'\x89PNG'))
+
+        hojas = b''.join(exportar_zip(self.filas(13), 'hojas', procesos=2, directorio_qr=self.carpeta))
+        with zipfile.ZipFile(io.BytesIO(hojas)) as archivo:
+            self.assertEqual(archivo.namelist(), ['hoja-00001.png', 'hoja-00002.png'])
+
+    def test_accion_del_admin(self):
+        from django.contrib.auth.models import User
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.login(username='admin', password='clave')
+        Asistencia.objects.create(id_hash='a' * 64, nombre='Ana', apellido='Pérez', documento='12345678')
+
+        with override_settings(QR_DIR=self.carpeta, CREDENCIALES_PROCESOS=1):
+            respuesta = self.client.post('/admin/core/asistencia/', {
+                'action': 'exportar_pases_png', '_selected_action': ['a' * 64],
+            })
+            contenido = b''.join(respuesta.streaming_content)
+        self.assertEqual(respuesta['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(contenido)) as archivo:
+            self.assertEqual(archivo.namelist(), ['Perez_Ana_aaaaaaaa.png'])
+
+
+class AdminChangelistTests(TestCase):
+    """
+    Lista del admin con 100k asistentes: número de consultas acotado, sin COUNT(*)
+    de la tabla completa y filtros resueltos con los índices del registro.
+    """
+
+    FILAS = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        base = 1_700_000_000
+        Asistencia.objects.bulk_create(
+            (
+                Asistencia(id_hash=f'{n:064x}', nombre=f'N{n}', apellido=f'A{n}', documento=f'{10000000 + n}')
+                for n in range(cls.FILAS)
+            ),
+            batch_size=5000,
+        )
+        registrar(
+            (f'{n:064x}', base + n if n % 3 else 0, base + n + 3600 if n % 3 == 2 else 0)
+            for n in range(cls.FILAS)
+        )
+
+    def setUp(self):
+        self.client.login(username='admin', password='clave')
+
+    def cargar(self, consulta=''):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            respuesta = self.client.get(f'/admin/core/asistencia/{consulta}')
+            transcurrido = time.perf_counter() - inicio
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, [q['sql'] for q in consultas.captured_queries], transcurrido
+
+    def test_lista_sin_filtros(self):
+        respuesta, consultas, transcurrido = self.cargar()
+        self.assertLessEqual(len(consultas), 6)
+        self.assertFalse([sql for sql in consultas if 'COUNT(' in sql.upper()])
+        self.assertLess(transcurrido, 2.0)
+        self.assertContains(respuesta, '1h 0m 0s')
+
+    def test_filtros_por_estado_y_dia(self):
+        for consulta in ('?estado=presente', '?estado=sin_llegar', '?dia_entrada=7dias&estado=salio'):
+            _, consultas, transcurrido = self.cargar(consulta)
+            self.assertLessEqual(len(consultas), 7, consulta)
+            self.assertLess(transcurrido, 2.0, consulta)
+
+        plan = Asistencia.objects.filter(entrada_entre(1, 2)).explain()
+        self.assertIn('registro_sesion_tipo_ts_idx', plan)
+
+    def test_orden_por_duracion_en_sql(self):
+        respuesta, consultas, _ = self.cargar('?o=5')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(any('"ts" - (SELECT' in sql for sql in consultas))
+
+
+class ExportarAsistenciaTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.login(username='admin', password='clave')
+        # 2024-01-01 10:00 en Lima (UTC-5)
+        Asistencia.objects.create(id_hash='h1', nombre='Ana')
+        Asistencia.objects.create(id_hash='h2', nombre='Luis')
+        Asistencia.objects.create(id_hash='h3', nombre='Eva')
+        registrar([('h1', 1704121200, 1704124800), ('h2', 1704121300, 0)])
+
+    def descargar(self, consulta):
+        respuesta = self.client.get(f'/api/asistencia/exportar/{consulta}')
+        self.assertEqual(respuesta.status_code, 200)
+        return b''.join(respuesta.streaming_content).decode()
+
+    def test_csv_y_jsonl_con_filtros(self):
+        lineas = self.descargar('?estado=salio').splitlines()
+        self.assertEqual(lineas[0].split(',')[-3:], ['entrada', 'salida', 'duracion_segundos'])
+        self.assertEqual(lineas[1], 'h1,Ana,,,1704121200,1704124800,2024-01-01T10:00:00-05:00,2024-01-01T11:00:00-05:00,3600')
+        self.assertEqual(len(lineas), 2)
+
+        filas = [json.loads(l) for l in self.descargar('?formato=jsonl&desde=2024-01-01&hasta=1704121250').splitlines()]
+        self.assertEqual([f['id_hash'] for f in filas], ['h1'])
+
+    def test_parametros_invalidos_y_permisos(self):
+        for consulta in ('?formato=xml', '?estado=todos', '?desde=ayer'):
+            self.assertEqual(self.client.get(f'/api/asistencia/exportar/{consulta}').status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/asistencia/exportar/').status_code, 302)
+
+    def test_hora_local_igual_a_pytz(self):
+        import pytz
+        from datetime import datetime
+        tz = pytz.timezone('America/New_York')
+        hora = HoraLocal(tz)
+        # Cruza el cambio de horario de marzo de 2024
+        for ts in range(1710050000, 1710080000, 1234):
+            self.assertEqual(hora(ts), datetime.fromtimestamp(ts, tz).isoformat())
+
+
+class AnaliticaTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.login(username='admin', password='clave')
+        roster.limpiar()
+        ventana.limpiar()
+
+    def test_totales_siguen_cualquier_escritura(self):
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+        Asistencia.objects.create(id_hash='h2', nombre='Luis')
+        Asistencia.objects.create(id_hash='h3', nombre='Eva')
+        registrar([('h2', 100, 0), ('h3', 100, 200)])
+        self.client.post('/api/procesar-qr/', json.dumps({'hash_id': H1}), content_type='application/json')
+        self.assertEqual(analitica.totales(), {
+            'asistentes': 3, 'entradas': 3, 'salidas': 1, 'ocupacion': 2, 'sin_llegar': 0,
+        })
+
+        # bulk_create y borrado no pasan por señales, los triggers sí los ven
+        Asistencia.objects.bulk_create([Asistencia(id_hash='h4', nombre='Eva')])
+        Asistencia.objects.filter(id_hash='h2').delete()
+        self.assertEqual(analitica.totales(), {
+            'asistentes': 3, 'entradas': 2, 'salidas': 1, 'ocupacion': 1, 'sin_llegar': 1,
+        })
+
+        # 'contadores' y un conteo sobre el índice de 'registro'
+        with self.assertNumQueries(2):
+            analitica.totales()
+
+    def test_endpoint_intervalos_y_percentiles(self):
+        base = 1_700_001_000   # múltiplo de 1800
+        Asistencia.objects.bulk_create(Asistencia(id_hash=f'h{n}') for n in range(20))
+        registrar((f'h{n}', base + n * 60, base + n * 60 + 600 * (n + 1) if n < 10 else 0) for n in range(20))
+        respuesta = self.client.get(f'/api/analitica/?desde={base}&hasta={base + 7200}&intervalo=1800')
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos['ocupacion'], 10)
+        self.assertEqual([i['llegadas'] for i in datos['por_intervalo']], [20, 0, 0, 0])
+        self.assertEqual(sum(i['salidas'] for i in datos['por_intervalo']), 10)
+        self.assertEqual(datos['permanencia'], {'salidas': 10, 'p50': 3000, 'p90': 5400, 'p99': 6000})
+
+        self.assertEqual(self.client.get('/api/analitica/?intervalo=1').status_code, 400)
+
+
+class DifusorTests(TestCase):
+
+    def test_buffer_acotado_y_reconexion(self):
+        difusor = eventos.Difusor(buffer=3, historial=10)
+        lento = difusor.suscribir()
+        for n in range(5):
+            difusor.publicar({'n': n})
+        lista, perdidos = lento.esperar(0)
+        self.assertEqual(([e['n'] for e in lista], perdidos), ([2, 3, 4], 2))
+
+        # Last-Event-ID: recibe lo posterior que sigue en el historial
+        otra = difusor.suscribir(ultimo_id=3)
+        self.assertEqual([e['id'] for e in otra.esperar(0)[0]], [4, 5])
+
+
+class MetricasTests(TestCase):
+
+    def setUp(self):
+        roster.limpiar()
+        ventana.limpiar()
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+
+    def escanear(self, hash_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/procesar-qr/', json.dumps({'hash_id': hash_id}), content_type='application/json')
+
+    def test_histograma_acumulado(self):
+        histograma = metricas.Histograma('prueba_segundos', 'Prueba.', ('etapa',), limites=(0.1, 1.0), registro=None)
+        for valor in (0.05, 0.1, 0.5, 3.0):
+            histograma.observar(valor, etapa='a')
+        self.assertEqual(histograma.muestras(), [
+            'prueba_segundos_bucket{etapa="a",le="0.1"} 2',
+            'prueba_segundos_bucket{etapa="a",le="1.0"} 3',
+            'prueba_segundos_bucket{etapa="a",le="+Inf"} 4',
+            'prueba_segundos_sum{etapa="a"} 3.65',
+            'prueba_segundos_count{etapa="a"} 4',
+        ])
+        self.assertEqual(histograma.cuantil(0.5, histograma.instantanea(etapa='b'), histograma.instantanea(etapa='a')), 0.1)
+        with self.assertRaises(ValueError):
+            histograma.observar(1, otra='a')
+
+    def test_endpoint_con_escaneos_y_latencias(self):
+        antes = {r: views.ESCANEOS.valor(result=r) for r in ('entrada', 'repetido', 'not_found', 'rechazado')}
+        self.escanear(H1)
+        self.escanear(H1)
+        self.escanear(DESCONOCIDO)
+        self.escanear('basura')
+
+        respuesta = self.client.get('/metrics')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain; version=0.0.4'))
+        for resultado in antes:
+            self.assertEqual(views.ESCANEOS.valor(result=resultado), antes[resultado] + 1)
+        texto = respuesta.content.decode()
+        self.assertIn('# TYPE asistencia_http_request_duration_seconds histogram', texto)
+        self.assertIn('asistencia_http_request_duration_seconds_count{view="procesar_qr",method="POST",status="200"}', texto)
+        self.assertIn('asistencia_db_query_duration_seconds_bucket{view="procesar_qr",le="+Inf"}', texto)
+        self.assertIn('asistencia_roster_cache{stat="negativos"} 1', texto)
+        self.assertIn(f'asistencia_scans_total{{result="not_found"}} {antes["not_found"] + 1}', texto)
+
+    async def test_consultas_de_vista_sincrona_con_asgi(self):
+        # Con ASGI la vista síncrona corre en otro hilo (sync_to_async), con su propia conexión
+        def vista(request):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.close()
+            return HttpResponse()
+
+        async def get_response(request):
+            return await sync_to_async(vista, thread_sensitive=False)(request)
+
+        antes = CONSULTAS.instantanea(view='sin_ruta')[2]
+        respuesta = await MetricasMiddleware(get_response)(RequestFactory().get('/'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(CONSULTAS.instantanea(view='sin_ruta')[2] - antes, 1)
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+        respuesta = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(respuesta.status_code, 200)
+
+
+class EventosSseTests(LiveServerTestCase):
+    """
+    Cientos de clientes SSE reales contra el servidor de pruebas: cada uno recibe
+    todos los escaneos (web y escritorio por UDP), y al desconectarse se da de baja.
+    """
+
+    CLIENTES = 200
+
+    def setUp(self):
+        import socket
+        from django.contrib.auth.models import User
+        roster.limpiar()
+        ventana.limpiar()
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        Asistencia.objects.create(id_hash='a' * 64, nombre='Ana')
+        cliente = Client()
+        cliente.login(username='admin', password='clave')
+        self.cookie = f"sessionid={cliente.cookies['sessionid'].value}"
+
+        libre = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        libre.bind(('127.0.0.1', 0))
+        self.puerto_udp = libre.getsockname()[1]
+        libre.close()
+        for parche in (
+            override_settings(EVENTOS_UDP=('127.0.0.1', self.puerto_udp)),
+            mock.patch.object(views, 'EVENTOS_PING', 1),
+            mock.patch.object(views, '_receptor', None),
+            mock.patch.object(views, 'difusor', eventos.Difusor()),
+        ):
+            parche.enable() if hasattr(parche, 'enable') else parche.start()
+            self.addCleanup(parche.disable if hasattr(parche, 'disable') else parche.stop)
+
+    def conectar(self):
+        import http.client
+        conexion = http.client.HTTPConnection(self.server_thread.host, self.server_thread.port, timeout=10)
+        conexion.request('GET', '/api/eventos/', headers={'Cookie': self.cookie})
+        respuesta = conexion.getresponse()
+        self.assertEqual(respuesta.status, 200)
+        self.assertEqual(respuesta.readline(), b'retry: 3000\n')
+        return conexion, respuesta
+
+    def leer_eventos(self, respuesta, cantidad):
+        recibidos = []
+        while len(recibidos) < cantidad:
+            linea = respuesta.readline()
+            if linea.startswith(b'data: {'):
+                recibidos.append(json.loads(linea[6:]))
+        return recibidos
+
+    def test_cientos_de_clientes(self):
+        clientes = [self.conectar() for _ in range(self.CLIENTES)]
+        self.assertEqual(views.difusor.estadisticas()['suscriptores'], self.CLIENTES)
+
+        for _ in range(2):
+            ventana.limpiar()
+            Client().post('/api/procesar-qr/', json.dumps({'hash_id': 'a' * 64}), content_type='application/json')
+        eventos.EmisorUDP(('127.0.0.1', self.puerto_udp)).enviar('b' * 64, 'entrada', 1700000000)
+
+        for conexion, respuesta in clientes:
+            recibidos = self.leer_eventos(respuesta, 3)
+            self.assertEqual([e['tipo'] for e in recibidos], ['entrada', 'salida', 'entrada'])
+            self.assertEqual(recibidos[0]['nombre'], 'Ana')
+            self.assertEqual(recibidos[0]['hash'], 'a' * 8)
+            self.assertEqual(recibidos[2]['origen'], 'escritorio')
+            respuesta.close()
+            conexion.close()
+
+        # Los hilos del servidor notan la desconexión en el siguiente ping
+        limite = time.monotonic() + 10
+        while views.difusor.estadisticas()['suscriptores'] and time.monotonic() < limite:
+            time.sleep(0.2)
+        self.assertEqual(views.difusor.estadisticas()['suscriptores'], 0)
+
+
+@override_settings(EVENTOS_UDP=None)
+class EventosAsgiTests(TestCase):
+    """Bajo ASGI el flujo SSE es async: entrega cada evento sin ocupar un hilo por cliente."""
+
+    async def test_flujo_asincrono(self):
+        from asgiref.sync import sync_to_async
+        from django.contrib.auth.models import User
+        usuario = await sync_to_async(User.objects.create_superuser)('admin', 'admin@example.com', 'clave')
+        await self.async_client.aforce_login(usuario)
+        difusor = eventos.Difusor()
+        with mock.patch.object(views, 'difusor', difusor), mock.patch.object(views, 'EVENTOS_PING', 0.05):
+            respuesta = await self.async_client.get('/api/eventos/')
+            self.assertTrue(respuesta.is_async)
+            contenido = aiter(respuesta.streaming_content)
+            self.assertEqual(await anext(contenido), b'retry: 3000\n\n')
+            self.assertEqual(await anext(contenido), b': ping\n\n')
+
+            # Publicado desde otro hilo, como on_commit o el receptor UDP
+            espera = asyncio.ensure_future(anext(contenido))
+            await asyncio.to_thread(difusor.publicar, eventos.evento_escaneo('a' * 64, 'entrada', 1700000000, 'Ana'))
+            self.assertIn(b'"nombre": "Ana"', await asyncio.wait_for(espera, 5))
+
+            # El servidor ASGI cancela la tarea al desconectarse el cliente: se da de baja
+            espera = asyncio.ensure_future(anext(contenido))
+            await asyncio.sleep(0)
+            espera.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await espera
+            self.assertEqual(difusor.estadisticas()['suscriptores'], 0)
+
+
+@skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+class DecodeGateTests(SimpleTestCase):
+    """gating.DecodeGate con un decodificador falso que anota el tamaño de cada imagen."""
+
+    def setUp(self):
+        self.formas = []
+
+        def decodificador(imagen):
+            self.formas.append(imagen.shape)
+            return [decoders.Decoded(b'x', (100, 100, 40, 40))]
+
+        self.gate = DecodeGate(decodificador, max_skip=3, settle=2)
+        self.quieto = np.zeros((240, 320), np.uint8)
+        self.movido = np.full((240, 320), 255, np.uint8)
+
+    def test_cuadros_sin_cambios_se_omiten_hasta_max_skip(self):
+        resultados = [self.gate.process(self.quieto) for _ in range(5)]
+        self.assertEqual([r is None for r in resultados], [False, True, True, True, False])
+        # El cuadro forzado por max_skip se decodifica completo aunque haya ROI
+        self.assertEqual(self.formas, [(240, 320), (240, 320)])
+        self.assertEqual(self.gate.skipped, 3)
+
+    def test_roi_alrededor_del_codigo_y_asentamiento(self):
+        self.gate.process(self.quieto)
+        # Con movimiento se decodifica solo la región (margen 0.5) y el rect vuelve al cuadro
+        codigos = self.gate.process(self.movido)
+        self.assertEqual(self.formas[1], (80, 80))
+        self.assertEqual(codigos, [('x', (180, 180, 40, 40))])
+        # Los `settle` cuadros siguientes se decodifican aunque no cambien
+        resultados = [self.gate.process(self.movido) for _ in range(3)]
+        self.assertEqual([r is None for r in resultados], [False, False, True])
+
+
+@skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+class DecodersTests(SimpleTestCase):
+    """decoders.py: backends reales sobre pases sintéticos y la calibración con backends falsos."""
+
+    def falso(self, nombre, lee, ms=0.0, falsas=()):
+        # Backend que "lee" los cuadros cuyo texto esperado está en `lee`, tardando `ms`
+        esperados = self.esperados
+
+        class Falso:
+            name = nombre
+
+            def __call__(self, imagen):
+                time.sleep(ms / 1000)
+                texto = esperados.get(id(imagen))
+                leidos = [texto] if texto in lee else []
+                return [decoders.Decoded(t.encode(), (0, 0, 1, 1)) for t in leidos + list(falsas)]
+
+        return Falso
+
+    def setUp(self):
+        self.codigos = [qr.contenido(generar_hash('Dec', str(n), str(n))) for n in range(4)]
+        self.muestras = decoders.sample_frames(self.codigos, count=4, rotation=0, blur=0, noise=0)
+        self.esperados = {id(cuadro): texto for cuadro, texto in self.muestras}
+
+    def test_backends_disponibles_leen_un_pase(self):
+        cuadro, esperado = self.muestras[0]
+        self.assertEqual(cuadro.ndim, 2)
+        disponibles = decoders.available()
+        self.assertIn('opencv', disponibles)
+        for nombre in disponibles:
+            with self.subTest(nombre):
+                resultados = decoders.create(nombre)(cuadro)
+                self.assertEqual([r.data for r in resultados], [esperado.encode()])
+                x, y, w, h = resultados[0].rect
+                self.assertTrue(w > 0 and h > 0 and 0 <= x < cuadro.shape[1] and 0 <= y < cuadro.shape[0])
+
+    def test_create(self):
+        self.assertIsInstance(decoders.create('opencv'), decoders.OpenCVDecoder)
+        cadena = decoders.create('opencv+opencv')
+        self.assertIsInstance(cadena, decoders.FallbackDecoder)
+        self.assertEqual(cadena.name, 'opencv+opencv')
+        with self.assertRaises(ValueError):
+            decoders.create('opencv+nada')
+
+    def test_fallback_solo_si_el_primero_no_lee(self):
+        cadena = decoders.FallbackDecoder([self.falso('a', lee=set(self.codigos[:2]))(),
+                                           self.falso('b', lee=set(self.codigos))()])
+        self.assertEqual(cadena.name, 'a+b')
+        leidos = [cadena(cuadro)[0].data.decode() for cuadro, _ in self.muestras]
+        self.assertEqual(leidos, self.codigos)
+        self.assertEqual(cadena.fallbacks, 2)
+
+    def test_calibracion_elige_el_mas_rapido_que_lee_bien(self):
+        todos = set(self.codigos)
+        backends = {
+            'lento': self.falso('lento', lee=todos, ms=5),
+            'rapido': self.falso('rapido', lee=set(self.codigos[:3]), ms=0),     # 75 %: no llega
+            'medio': self.falso('medio', lee=set(self.codigos[1:]), ms=1),     # 75 %
+            'mentiroso': self.falso('mentiroso', lee=todos, falsas=['otro']),     # lecturas falsas
+        }
+        with mock.patch.object(decoders, 'BACKENDS', backends), mock.patch.object(decoders, 'MIN_SUCCESS', 0.8):
+            ranking = decoders.calibrate(list(backends), self.muestras)
+            self.assertEqual(ranking[0].name, 'lento')
+            self.assertEqual((ranking[0].success, ranking[0].false_reads), (1.0, 0))
+            self.assertEqual(next(r for r in ranking if r.name == 'mentiroso').false_reads, 4)
+
+            # Sin ninguno bueno gana el que más lee; el fallback solo si lee lo que el primero no
+            spec, _ = decoders.choose(self.muestras, names=['rapido', 'medio'])
+            self.assertEqual(spec, 'rapido+medio')
+            spec, _ = decoders.choose(self.muestras, names=['lento', 'rapido'])
+            self.assertEqual(spec, 'lento')
+            spec, _ = decoders.choose(self.muestras, names=['rapido', 'medio'], fallback=False)
+            self.assertEqual(spec, 'rapido')
+
+
+@skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+class SyntheticSourceTests(SimpleTestCase):
+    """sources.SyntheticSource: la credencial rotada entra entera en el cuadro."""
+
+    def test_credencial_grande_se_achica_hasta_entrar(self):
+        codigo = 'x' * 40
+        fuente = sources.SyntheticSource([codigo], size=(160, 120), fps=0, badge_px=(400, 500),
+                                         rotation=0, blur=0, noise=0)
+        ok, cuadro = fuente.read()
+        self.assertTrue(ok)
+        self.assertEqual(cuadro.shape, (120, 160, 3))
+        self.assertEqual(cv2.QRCodeDetector().detectAndDecode(cuadro)[0], codigo)
+
+    def test_cuadro_sin_lugar_para_la_credencial(self):
+        fuente = sources.SyntheticSource(['x' * 40], size=(40, 40), fps=0)
+        with self.assertRaises(ValueError):
+            fuente.read()
+
+
+@skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+class MultiCamaraTests(SimpleTestCase):
+    """main.py con varias fuentes: un proceso por cámara y un único escritor compartido."""
+
+    def test_cada_camara_en_su_proceso_escribe_en_la_cola_compartida(self):
+        # Al ritmo de una cámara: sin pausa la captura adelanta a la decodificación y descarta cuadros
+        codigos = [[qr.contenido(generar_hash('Puerta', str(n), str(k))) for k in range(3)] for n in range(2)]
+        escaneos, avisos = multiprocessing.Queue(), multiprocessing.Queue()
+        parar = multiprocessing.Event()
+        procesos = [
+            multiprocessing.Process(target=main.stream_worker, daemon=True, args=(
+                n, 'synthetic', {'codes': codigos[n], 'fps': 30, 'hold': 10, 'gap': 5, 'seed': n, 'rotation': 0, 'blur': 0, 'noise': 0},
+                functools.partial(decoders.create, 'opencv'), escaneos, avisos, parar, (160, 120),
+            ))
+            for n in range(2)
+        ]
+        for proceso in procesos:
+            proceso.start()
+        self.addCleanup(parar.set)
+
+        # Cada proceso avisa su fin (con la miniatura y sus estadísticas) al agotar la fuente
+        vistas = [main.StreamView(str(n)) for n in range(2)]
+        while not all(vista.ended for vista in vistas):
+            indice, miniatura, _, estado = avisos.get(timeout=30)
+            vistas[indice].ended = estado['ended']
+            if miniatura is not None:
+                self.assertEqual(miniatura.shape, (120, 160, 3))
+        for proceso in procesos:
+            proceso.join(timeout=10)
+            self.assertEqual(proceso.exitcode, 0)
+
+        recibidos = []
+        while True:
+            try:
+                recibidos.append(escaneos.get(timeout=1))
+            except queue.Empty:
+                break
+        self.assertCountEqual(recibidos, codigos[0] + codigos[1])
+
+    def test_escritor_compartido_deduplica_entre_camaras(self):
+        registrados = []
+
+        class Diario:
+            def resolve(self, hashed):
+                return hashed
+
+            def record(self, hashed, payload=None):
+                registrados.append(hashed)
+                return (escaneo.ENTRADA, 1000)
+
+        escaneos = queue.Queue()
+        for codigo in (H1, H1, DESCONOCIDO):     # H1 visto por dos cámaras a la vez
+            escaneos.put(codigo)
+        latest, parar = main.Latest(), threading.Event()
+        parar.set()     # el escritor vacía la cola antes de terminar
+        main.db_stage(escaneos, latest, parar, main.StageStats(), Diario(), VentanaDuplicados(5), None)
+        self.assertEqual(registrados, [H1, DESCONOCIDO])
+        self.assertEqual(latest.results[H1], (escaneo.ENTRADA, 1000))
+
+    def test_mosaico_de_miniaturas(self):
+        vistas = [main.StreamView(f'{n} synthetic') for n in range(3)]
+        for n, vista in enumerate(vistas[:2]):
+            vista.frame = np.full((120, 160, 3), 50 * (n + 1), np.uint8)
+            vista.status = {'capture': 30.0, 'decode': 30.0, 'dropped': 0, 'gate': '', 'ended': False}
+        mosaico = main.tile_views(vistas, {}, 2, (160, 120))
+        self.assertEqual(mosaico.shape, (240, 320, 3))
+        # La tercera aún no mandó miniatura: su lugar queda negro
+        self.assertFalse(mosaico[120:, :160].any())
+        self.assertEqual(mosaico[60, 80, 0], 50)
+        self.assertEqual(mosaico[60, 240, 0], 100)
+
+
+@skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+class JournalTests(TransactionTestCase):
+    """journal.Journal del escáner de escritorio contra la base de datos de prueba."""
+
+    def setUp(self):
+        roster.limpiar()
+        Asistencia.objects.create(id_hash=H1, nombre='Ana')
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.ruta = os.path.join(carpeta.name, 'scans.journal')
+
+    def abrir(self, resultados=None):
+        conexion = almacenamiento.conectar(connection.settings_dict['NAME'], check_same_thread=False)
+        self.addCleanup(conexion.close)
+        al_resultado = None if resultados is None else (lambda hash_id, r: resultados.append(r[0]))
+        return journal.Journal(conexion, path=self.ruta, device_id='prueba', on_result=al_resultado)
+
+    def test_reinicio_reaplica_lo_pendiente_y_el_ack_lo_descarta(self):
+        diario = self.abrir()
+        self.assertEqual(diario.record(H1)[0], escaneo.ENTRADA)
+        self.assertEqual(diario.record(H1)[0], escaneo.SALIDA)
+        self.assertEqual(RegistroEscaneo.objects.count(), 0)
+
+        # "Caída" antes de volcar: el siguiente arranque los encuentra pendientes
+        resultados = []
+        diario = self.abrir(resultados)
+        self.assertEqual(len(diario.pending), 2)
+        self.assertEqual(diario.record(H1)[0], escaneo.COMPLETADO)
+        diario.drain()
+        self.assertEqual(resultados, [escaneo.ENTRADA, escaneo.SALIDA])
+        self.assertEqual(RegistroEscaneo.objects.count(), 2)
+        self.assertEqual(os.path.getsize(self.ruta), 0)
+        self.assertEqual(self.abrir().pending, [])
+
+    def test_ack_perdido_no_aplica_dos_veces(self):
+        resultados = []
+        diario = self.abrir(resultados)
+        diario.record(H1)
+        with mock.patch.object(journal.Journal, '_write_ack', side_effect=OSError('disco lleno')):
+            with self.assertRaises(OSError):
+                diario.drain()
+        # Ya estaba en la base de datos: el resultado se informó antes del ack
+        self.assertEqual(resultados, [escaneo.ENTRADA])
+
+        # Sin ack, el reinicio lo reenvía; escaneo_procesado devuelve el resultado guardado
+        resultados = []
+        diario = self.abrir(resultados)
+        self.assertEqual(len(diario.pending), 1)
+        diario.drain()
+        self.assertEqual(resultados, [escaneo.ENTRADA])
+        self.assertEqual(RegistroEscaneo.objects.count(), 1)
+
+    def test_error_inesperado_no_detiene_el_volcado(self):
+        resultados = []
+        listo = threading.Event()
+        diario = self.abrir(resultados)
+        diario.on_result = lambda hash_id, r: (resultados.append(r[0]), listo.set())
+        original = diario._apply_db
+        fallas = [ValueError('inesperado')]
+
+        def aplicar(entrada):
+            if fallas:
+                raise fallas.pop()
+            return original(entrada)
+
+        diario._apply_db = aplicar
+        errores = io.StringIO()
+        with mock.patch.object(journal, 'RETRY_MIN', 0.01), mock.patch('sys.stderr', errores):
+            diario.start()
+            diario.record(H1)
+            self.assertTrue(listo.wait(5))
+            diario.stop()
+        self.assertEqual(resultados, [escaneo.ENTRADA])
+        self.assertEqual(diario.retries, 1)
+        self.assertIsNone(diario.error)
+        self.assertIn('inesperado', errores.getvalue())
+
+
+@skipIf(SIN_ESCRITORIO, "sin OpenCV / numpy (escáner de escritorio)")
+class ClientJournalTests(SimpleTestCase):
+    """client.ClientJournal (main.py --server) contra standin_server.py en un puerto libre."""
+
+    def setUp(self):
+        self.servidor, self.standin = standin_server.serve(port=0)
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.ruta = os.path.join(carpeta.name, 'scans.journal')
+        self.resultados = []
+
+    def abrir(self, ruta='', **opciones):
+        diario = client.ClientJournal(f'http://127.0.0.1:{self.servidor.server_port}{ruta}', path=self.ruta,
+                                      device_id='prueba', on_result=lambda h, r: self.resultados.append(r[0]),
+                                      **opciones)
+        self.addCleanup(diario.stop)
+        return diario
+
+    def escanear(self, diario, cantidad):
+        for n in range(cantidad):
+            hash_id = generar_hash('Cliente', str(n), str(n))
+            self.assertEqual(diario.record(hash_id, payload=qr.contenido_compacto(hash_id))[0], journal.PENDING)
+
+    def test_lotes_de_batch_max(self):
+        diario = self.abrir(batch_max=3)
+        self.escanear(diario, 7)
+        diario.drain()
+        self.assertEqual((diario.batches, self.standin.requests), (3, 3))
+        self.assertEqual(self.resultados, [escaneo.ENTRADA] * 7)
+        self.assertEqual(diario.pending, [])
+        self.assertEqual(os.path.getsize(self.ruta), 0)
+
+    def test_409_se_reintenta(self):
+        diario = self.abrir()
+        self.escanear(diario, 2)
+        self.standin.busy = 1.0
+        with self.assertRaises(client.ServerError) as error:
+            diario.drain()
+        self.assertTrue(diario.transient(error.exception))
+        self.assertEqual(len(diario.pending), 2)
+
+        self.standin.busy = 0.0
+        diario.drain()
+        self.assertEqual(self.resultados, [escaneo.ENTRADA] * 2)
+        self.assertEqual(self.standin.applied, 2)
+
+    def test_respuesta_perdida_se_reenvia_sin_aplicar_dos_veces(self):
+        diario = self.abrir()
+        self.escanear(diario, 2)
+        enviar = diario.session.post_json
+
+        def perder_respuesta(ruta, cuerpo):
+            enviar(ruta, cuerpo)
+            raise ConnectionResetError('respuesta perdida')
+
+        with mock.patch.object(diario.session, 'post_json', side_effect=perder_respuesta):
+            with self.assertRaises(ConnectionResetError):
+                diario.drain()
+        self.assertEqual((len(diario.pending), self.resultados), (2, []))
+
+        # El reenvío lleva los mismos scan_id: el servidor devuelve lo que ya aplicó
+        diario.drain()
+        self.assertEqual(self.resultados, [escaneo.ENTRADA] * 2)
+        self.assertEqual((self.standin.requests, self.standin.applied), (2, 2))
+
+    def test_lote_rechazado_se_aparta(self):
+        diario = self.abrir(batch_max=3)
+        self.escanear(diario, 4)
+        with mock.patch.object(standin_server, 'MAX_BATCH', 2), mock.patch('sys.stderr', io.StringIO()):
+            diario.drain()      # 400 para el lote de 3; el de 1 pasa
+        self.assertEqual(self.resultados, [journal.REJECTED] * 3 + [escaneo.ENTRADA])
+        self.assertEqual((diario.rejected, diario.pending), (3, []))
+        with open(diario.rejected_path, encoding='utf-8') as f:
+            apartados = [json.loads(linea) for linea in f]
+        self.assertEqual(len(apartados), 3)
+        self.assertIn('HTTP 400', apartados[0]['error'])
+        # Ya no están pendientes: un reinicio no los reenvía
+        self.assertEqual(self.abrir().pending, [])
+
+    def test_error_permanente_detiene_el_volcado(self):
+        diario = self.abrir(ruta='/otra')     # 404 en cada lote
+        self.escanear(diario, 2)
+        errores = io.StringIO()
+        with mock.patch.object(journal, 'RETRY_MIN', 0.01), mock.patch('sys.stderr', errores):
+            diario.start()
+            diario._thread.join(5)
+        self.assertFalse(diario._thread.is_alive())
+        self.assertEqual(self.standin.requests, 1)
+        self.assertIn('draining stopped', diario.error)
+        self.assertIn('HTTP 404', errores.getvalue())
+        # Quedan en el diario para la próxima ejecución
+        self.assertEqual(len(diario.pending), 2)
+        self.assertEqual(len(self.abrir().pending), 2)
@@ -1,13 +1,37 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     # Ruta raíz: Muestra el formulario de registro
     path('', views.registro_view, name='registro'),
     
+    # Imagen QR de un asistente (caché en disco con ETag)
+    re_path(r'^qr/(?P<hash_id>[0-9a-f]{64})\.png$', views.qr_png, name='qr_png'),
+
     # Ruta del lector: Muestra la interfaz de la cámara
     path('lector/', views.lector_view, name='lector'),
     
     # API: Procesa la petición asíncrona del escáner
     path('api/procesar-qr/', views.procesar_qr, name='procesar_qr'),
+
+    # API: Misma API en versión asíncrona, para servir con ASGI (asistencia_qr/asgi.py)
+    path('api/procesar-qr/async/', views.procesar_qr_async, name='procesar_qr_async'),
+
+    # API: Procesa ráfagas de escaneos en un solo lote (idempotente por scan_id)
+    path('api/procesar-qr/batch/', views.procesar_qr_lote, name='procesar_qr_lote'),
+
+    # API: Exportación de la asistencia en CSV/JSONL (solo staff)
+    path('api/asistencia/exportar/', views.exportar_asistencia, name='exportar_asistencia'),
+
+    # API: Ocupación, llegadas por intervalo y permanencia (solo staff)
+    path('api/analitica/', views.analitica_view, name='analitica'),
+
+    # API: Resultados de escaneo en vivo, Server-Sent Events (solo staff)
+    path('api/eventos/', views.eventos_view, name='eventos'),
+
+    # API: Estadísticas de la caché del padrón (solo staff)
+    path('api/roster-cache/', views.estado_cache_roster, name='estado_cache_roster'),
+
+    # Métricas en formato Prometheus (token opcional: METRICAS_TOKEN)
+    path('metrics', views.metricas_view, name='metricas'),
 ]
\ No newline at end of file
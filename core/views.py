@@ -1,33 +1,39 @@
-import hashlib
-import qrcode
-import io
-import base64
+import asyncio
+import hmac
+import os
+import threading
 import time
 import json
+import math
 import pytz # type: ignore
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from django.db import close_old_connections, connection, transaction, IntegrityError, OperationalError
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_safe
+from django.contrib.admin.views.decorators import staff_member_required
 
 # Importaciones locales
 from .forms import RegistroPersonaForm
-from .models import Asistencia
+from .models import Asistencia, EscaneoProcesado
+from .roster import roster, NO_EXISTE
+from . import escaneo
+from . import qr
+from . import exportacion
+from . import analitica
+from . import eventos
+from . import metricas
+from .qr import generar_hash
 
 # -------------------------------------------------------------------------
 # Funciones Auxiliares
 # -------------------------------------------------------------------------
 
-def generar_hash(nombre, apellido, documento):
-    """
-    Genera un hash SHA256 único basado en los datos del usuario.
-    """
-    to_hash = f"{nombre}{apellido}{documento}"
-    hashed = hashlib.sha256(to_hash.encode()).hexdigest()
-    return hashed
-
 def obtener_hora_local(timestamp):
     """
     Convierte un timestamp Unix a la zona horaria configurada en settings.
@@ -36,6 +42,136 @@ def obtener_hora_local(timestamp):
     tz_local = pytz.timezone(settings.TIME_ZONE)
     return dt_utc.astimezone(tz_local).strftime("%Y-%m-%d %H:%M:%S")
 
+# Escaneos repetidos del mismo QR dentro de DEDUPE_SEGUNDOS devuelven el resultado anterior
+ventana = escaneo.VentanaDuplicados(getattr(settings, 'DEDUPE_SEGUNDOS', 5))
+
+# Fan-out en memoria de los resultados de escaneo para /api/eventos/ (core/eventos.py)
+difusor = eventos.Difusor(getattr(settings, 'EVENTOS_BUFFER', eventos.BUFFER))
+
+# Resultado de cada escaneo recibido por las APIs (expuesto en /metrics)
+ESCANEOS = metricas.Contador(
+    'asistencia_scans_total',
+    'Escaneos recibidos por resultado (entrada, salida, completado, not_found, repetido, rechazado, error).',
+    ('result',),
+)
+RESULTADOS = {
+    escaneo.NO_ENCONTRADO: 'not_found',
+    escaneo.COMPLETADO: 'completado',
+    escaneo.ENTRADA: 'entrada',
+    escaneo.SALIDA: 'salida',
+}
+
+def contar_escaneo(resultado):
+    ESCANEOS.inc(result=resultado)
+
+def publicar_escaneo(hash_id, codigo, ts, nombre, origen):
+    transaction.on_commit(lambda: difusor.publicar(
+        eventos.evento_escaneo(hash_id, escaneo.TIPOS[codigo], ts, nombre, origen)
+    ))
+
+def aplicar_escaneo(hash_id, ahora=None, origen='web'):
+    """
+    Aplica un escaneo pasando primero por la ventana de duplicados y la caché
+    negativa del padrón (core/roster.py). Los repetidos dentro de la ventana y los
+    hashes ya sabidos inexistentes se responden sin tocar SQLite; la transición de
+    los asistentes siempre se decide en la base de datos.
+    Cada resultado (salvo los repetidos) se publica en /api/eventos/ al confirmarse
+    y se cuenta en asistencia_scans_total.
+
+    `ahora` (el scanned_at de un lote) solo fija la hora de la fila del registro:
+    viene del reloj de cada puerta y puede ser histórico (un reenvío tras un corte),
+    así que la ventana usa siempre el reloj del servidor, y un escaneo cuya hora
+    no cae dentro de la ventana no se compara con los escaneos en vivo.
+    Retorna la misma tupla que escaneo.registrar_escaneo.
+    """
+    reloj = time.time()
+    en_vivo = ahora is None or abs(reloj - ahora) < ventana.segundos
+    previo = ventana.consultar(hash_id, reloj) if en_vivo else None
+    if previo is not None:
+        contar_escaneo('repetido')
+        return previo
+
+    if roster.obtener(hash_id) is NO_EXISTE:
+        contar_escaneo('not_found')
+        publicar_escaneo(hash_id, escaneo.NO_ENCONTRADO, ahora, None, origen)
+        return (escaneo.NO_ENCONTRADO, 0, None)
+
+    with connection.cursor() as cursor:
+        codigo, ts, nombre = escaneo.registrar_escaneo(cursor, hash_id, ahora)
+    resultado = (codigo, ts, nombre)
+
+    # Se aplica al confirmar la transacción (inmediato en autocommit)
+    def al_confirmar():
+        if codigo == escaneo.NO_ENCONTRADO:
+            roster.guardar_inexistente(hash_id)
+        if en_vivo:
+            ventana.guardar(hash_id, resultado, reloj)
+
+    transaction.on_commit(al_confirmar)
+    transaction.on_commit(lambda: contar_escaneo(RESULTADOS[codigo]))
+    publicar_escaneo(hash_id, codigo, ts or ahora, nombre, origen)
+    return resultado
+
+# Respuesta para códigos ajenos o falsificados: el lector los trata como no encontrados
+RECHAZO = {'status': 'not_found', 'message': 'Código QR no válido'}
+
+def leer_codigo(texto):
+    """
+    Verifica sin la base de datos el texto leído del QR (core/qr.py).
+    Retorna el hash de un pase legado, el prefijo de un pase compacto con firma
+    válida, o None si se debe rechazar (QR ajeno, falsificado, o pase legado
+    con settings.QR_LEGADO = False).
+    """
+    return qr.leer_contenido(texto, legado=getattr(settings, 'QR_LEGADO', True))
+
+def resolver_hash(identificador):
+    """
+    Hash completo de un identificador de leer_codigo: solo los pases compactos
+    consultan la base de datos (un rango sobre la clave primaria). Un prefijo
+    sin asistente se devuelve tal cual y el escaneo responde 'not_found'.
+    """
+    if not qr.es_prefijo(identificador):
+        return identificador
+    with connection.cursor() as cursor:
+        return escaneo.resolver_prefijo(cursor, identificador) or identificador
+
+def aplicar_codigo(identificador, ahora=None, origen='web'):
+    return aplicar_escaneo(resolver_hash(identificador), ahora, origen)
+
+def construir_respuesta(codigo, ts, nombre):
+    """
+    Traduce el resultado de escaneo.registrar_escaneo al JSON que espera el lector.
+    Retorna (diccionario, status HTTP).
+    """
+    if codigo == escaneo.NO_ENCONTRADO:
+        return {'status': 'not_found', 'message': 'Usuario no encontrado en base de datos'}, 404
+
+    # MEJORA: Usar nombre real si está disponible
+    nombre_usuario = nombre if nombre else "Usuario"
+
+    # Caso A: No tenía entrada registrada -> Entrada registrada
+    if codigo == escaneo.ENTRADA:
+        return {
+            'status': 'success', 
+            'type': 'entrada', 
+            'message': f'¡Bienvenido/a, {nombre_usuario}!\nEntrada: {obtener_hora_local(ts)}'
+        }, 200
+    
+    # Caso B: Ya tenía entrada, pero no salida -> Salida registrada
+    elif codigo == escaneo.SALIDA:
+        return {
+            'status': 'success', 
+            'type': 'salida', 
+            'message': f'¡Hasta luego, {nombre_usuario}!\nSalida: {obtener_hora_local(ts)}'
+        }, 200
+    
+    # Caso C: Ya tiene ambas -> Informar que ya completó
+    return {
+        'status': 'info', 
+        'type': 'completado', 
+        'message': f'{nombre_usuario}, tu ciclo de asistencia ya fue completado hoy.'
+    }, 200
+
 # -------------------------------------------------------------------------
 # Vistas (Views)
 # -------------------------------------------------------------------------
@@ -46,9 +182,8 @@ def registro_view(request):
     1. Recibe datos (Nombre, Apellido, DNI).
     2. Genera el hash.
     3. Guarda datos legibles y hash en BD.
-    4. Genera el código QR visual.
+    4. Genera el código QR visual (caché en disco, servido por qr_png).
     """
-    qr_image_base64 = None
     hash_generado = None
     nombre_completo = None
 
@@ -67,8 +202,6 @@ def registro_view(request):
             obj, created = Asistencia.objects.get_or_create(
                 id_hash=hash_id,
                 defaults={
-                    'time_entry': 0, 
-                    'time_exit': 0,
                     'nombre': nombre,
                     'apellido': apellido,
                     'documento': documento
@@ -85,23 +218,11 @@ def registro_view(request):
             if created:
                 messages.success(request, 'Usuario registrado exitosamente en la base de datos.')
             else:
-                messages.info(request, 'El usuario ya existía. Se ha regenerado su código QR visual.')
-
-            # 3. Generar QR (usando librería qrcode)
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L, # type: ignore
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(hash_id)
-            qr.make(fit=True)
+                messages.info(request, 'El usuario ya existía. Se muestra su mismo código QR.')
 
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            buffer = io.BytesIO()
-            img.save(buffer, format="PNG") # type: ignore
-            qr_image_base64 = base64.b64encode(buffer.getvalue()).decode()
+            # 3. Generar QR: solo se dibuja si no está ya en la caché (QR_DIR)
+            os.makedirs(settings.QR_DIR, exist_ok=True)
+            qr.guardar_png(settings.QR_DIR, hash_id)
             
             hash_generado = hash_id
             nombre_completo = f"{nombre} {apellido}"
@@ -111,11 +232,35 @@ def registro_view(request):
 
     return render(request, 'core/registro.html', {
         'form': form,
-        'qr_image': qr_image_base64,
         'hash_id': hash_generado,
         'nombre': nombre_completo
     })
 
+# Los PNG no cambian mientras no cambien core.qr.PARAMETROS (el ETag lo refleja)
+QR_CACHE_CONTROL = 'public, max-age=86400'
+
+def _etag_qr(request, hash_id):
+    return qr.etag(hash_id)
+
+@require_safe
+@condition(etag_func=_etag_qr)
+def qr_png(request, hash_id):
+    """
+    Sirve el PNG del QR de un asistente desde la caché en disco (QR_DIR).
+    Un If-None-Match con el mismo ETag responde 304 sin leer el archivo; si el
+    PNG no está en caché se dibuja una vez, solo para hashes registrados.
+    """
+    ruta = qr.ruta_png(settings.QR_DIR, hash_id)
+    if not os.path.exists(ruta):
+        if not Asistencia.objects.filter(id_hash=hash_id).exists():
+            raise Http404("QR no encontrado")
+        os.makedirs(settings.QR_DIR, exist_ok=True)
+        qr.guardar_png(settings.QR_DIR, hash_id)
+
+    respuesta = FileResponse(open(ruta, 'rb'), content_type='image/png')
+    respuesta['Cache-Control'] = QR_CACHE_CONTROL
+    return respuesta
+
 def lector_view(request):
     return render(request, 'core/lector.html')
 
@@ -123,6 +268,25 @@ def lector_view(request):
 # API Endpoints (Lógica del Escáner)
 # -------------------------------------------------------------------------
 
+def leer_hash_id(cuerpo):
+    """
+    Valida el cuerpo {'hash_id': '...'} de las APIs de escaneo.
+    Retorna (hash_id, None) o (None, JsonResponse de error).
+    """
+    try:
+        data = json.loads(cuerpo)
+    except json.JSONDecodeError:
+        return None, JsonResponse({'status': 'error', 'message': 'JSON inválido'}, status=400)
+
+    if not isinstance(data, dict):
+        return None, JsonResponse({'status': 'error', 'message': 'Se esperaba un objeto JSON'}, status=400)
+
+    hashed = data.get('hash_id')
+
+    if not hashed or not isinstance(hashed, str):
+        return None, JsonResponse({'status': 'error', 'message': 'Hash no proporcionado'}, status=400)
+    return hashed, None
+
 @csrf_exempt
 def procesar_qr(request):
     """
@@ -131,60 +295,387 @@ def procesar_qr(request):
     if request.method == 'POST':
         try:
             # 1. Parsear datos
-            try:
-                data = json.loads(request.body)
-            except json.JSONDecodeError:
-                return JsonResponse({'status': 'error', 'message': 'JSON inválido'}, status=400)
-                
-            hashed = data.get('hash_id')
-            
-            if not hashed:
-                return JsonResponse({'status': 'error', 'message': 'Hash no proporcionado'}, status=400)
+            hashed, error = leer_hash_id(request.body)
+            if error is not None:
+                return error
 
-            # 2. Buscar usuario
-            try:
-                registro = Asistencia.objects.get(id_hash=hashed)
-            except Asistencia.DoesNotExist:
-                return JsonResponse({'status': 'not_found', 'message': 'Usuario no encontrado en base de datos'}, status=404)
-
-            # MEJORA: Usar nombre real si está disponible
-            nombre_usuario = registro.nombre if registro.nombre else "Usuario"
+            # 2. Firma del pase: los QR ajenos se rechazan sin tocar la base de datos
+            identificador = leer_codigo(hashed)
+            if identificador is None:
+                contar_escaneo('rechazado')
+                return JsonResponse(RECHAZO, status=404)
 
             # 3. Lógica de Negocio (Entrada vs Salida)
-            ts_ahora = int(time.time()) # Timestamp Unix actual
-            
-            # Formatear hora usando la Timezone configurada
-            hora_legible = obtener_hora_local(ts_ahora)
-
-            # Caso A: No tiene entrada registrada -> Registrar Entrada
-            if registro.time_entry == 0:
-                registro.time_entry = ts_ahora
-                registro.save()
-                return JsonResponse({
-                    'status': 'success', 
-                    'type': 'entrada', 
-                    'message': f'¡Bienvenido/a, {nombre_usuario}!\nEntrada: {hora_legible}'
-                })
-            
-            # Caso B: Ya tiene entrada, pero no salida -> Registrar Salida
-            elif registro.time_exit == 0:
-                registro.time_exit = ts_ahora
-                registro.save()
-                return JsonResponse({
-                    'status': 'success', 
-                    'type': 'salida', 
-                    'message': f'¡Hasta luego, {nombre_usuario}!\nSalida: {hora_legible}'
-                })
-            
-            # Caso C: Ya tiene ambas -> Informar que ya completó
-            else:
-                return JsonResponse({
-                    'status': 'info', 
-                    'type': 'completado', 
-                    'message': f'{nombre_usuario}, tu ciclo de asistencia ya fue completado hoy.'
-                })
+            # MEJORA: Un único INSERT condicional por escaneo (ver core/escaneo.py).
+            # Evita el SELECT + save() y que dos lectores registren dos entradas.
+            codigo, ts, nombre = aplicar_codigo(identificador)
+
+            respuesta, status = construir_respuesta(codigo, ts, nombre)
+            return JsonResponse(respuesta, status=status)
 
         except Exception as e:
+            contar_escaneo('error')
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
     
-    return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
\ No newline at end of file
+    return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+
+# Un solo hilo con su propia conexión aplica los escaneos de procesar_qr_async:
+# SQLite admite un escritor a la vez, así que más hilos solo esperarían el lock.
+_escritor_bd = ThreadPoolExecutor(max_workers=1, thread_name_prefix='escaneos-bd')
+
+@csrf_exempt
+async def procesar_qr_async(request):
+    """
+    Versión asíncrona de procesar_qr (mismo JSON de entrada y de salida) para
+    servir con ASGI (asistencia_qr/asgi.py). Los escaneos en espera no ocupan un
+    hilo cada uno: los QR rechazados, los repetidos dentro de la ventana y los
+    hashes desconocidos se responden en el event loop, y el resto (incluida la
+    resolución de los pases compactos) se encola en un único hilo escritor
+    (_escritor_bd).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    hashed, error = leer_hash_id(request.body)
+    if error is not None:
+        return error
+
+    identificador = leer_codigo(hashed)
+    if identificador is None:
+        contar_escaneo('rechazado')
+        return JsonResponse(RECHAZO, status=404)
+
+    try:
+        resultado = None
+        # Un pase compacto recién se conoce por su hash en el hilo escritor
+        if not qr.es_prefijo(identificador):
+            resultado = ventana.consultar(identificador)
+            if resultado is not None:
+                contar_escaneo('repetido')
+            elif roster.obtener(identificador) is NO_EXISTE:
+                # Sin transacción abierta: se publica directamente (no hace falta on_commit)
+                contar_escaneo('not_found')
+                difusor.publicar(eventos.evento_escaneo(identificador, escaneo.TIPOS[escaneo.NO_ENCONTRADO], 0))
+                resultado = (escaneo.NO_ENCONTRADO, 0, None)
+        if resultado is None:
+            resultado = await asyncio.wrap_future(_escritor_bd.submit(aplicar_codigo, identificador))
+    except Exception as e:
+        contar_escaneo('error')
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    respuesta, status = construir_respuesta(*resultado)
+    return JsonResponse(respuesta, status=status)
+
+
+# Máximo de escaneos aceptados en un solo lote
+MAX_LOTE = 500
+
+# Mayor 'scanned_at' aceptado: 9999-12-31 (el límite de datetime al formatear la hora)
+MAX_SCANNED_AT = 253402300799
+
+def es_texto(valor, max_length=64):
+    return isinstance(valor, str) and 0 < len(valor) <= max_length
+
+def es_timestamp(valor):
+    # json.loads acepta NaN e Infinity: int() fallaría con ValueError / OverflowError
+    return (isinstance(valor, (int, float)) and not isinstance(valor, bool)
+            and math.isfinite(valor) and 0 < valor <= MAX_SCANNED_AT)
+
+@csrf_exempt
+def procesar_qr_lote(request):
+    """
+    API por lotes para ráfagas de escaneos. Recibe un POST con el JSON:
+    {'scans': [{'hash_id': '...', 'scanned_at': 1700000000, 'device_id': '...', 'scan_id': '...'}, ...]}
+
+    - Todos los escaneos se aplican en una sola transacción, ordenados por 'scanned_at'.
+    - 'scan_id' es la clave de idempotencia: reenviar un lote ya procesado devuelve
+      los resultados guardados sin registrar nuevamente entradas ni salidas.
+    - La respuesta contiene un resultado por escaneo, en el mismo orden recibido.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido'}, status=400)
+
+    scans = data.get('scans') if isinstance(data, dict) else None
+    if not isinstance(scans, list) or not scans:
+        return JsonResponse({'status': 'error', 'message': 'Lista de escaneos no proporcionada'}, status=400)
+    if len(scans) > MAX_LOTE:
+        return JsonResponse({'status': 'error', 'message': f'Máximo {MAX_LOTE} escaneos por lote'}, status=400)
+
+    # 1. Validar cada escaneo (los inválidos se informan sin abortar el lote)
+    resultados = [None] * len(scans)
+    validos = []
+    for pos, item in enumerate(scans):
+        if not isinstance(item, dict) or not es_texto(item.get('hash_id')) or not es_texto(item.get('scan_id')):
+            resultados[pos] = {'status': 'error', 'message': 'Se requieren hash_id y scan_id (texto, máx. 64 caracteres)'}
+            continue
+        if item.get('device_id') is not None and not es_texto(item['device_id']):
+            resultados[pos] = {'status': 'error', 'message': 'device_id debe ser texto (máx. 64 caracteres)'}
+            continue
+        identificador = leer_codigo(item['hash_id'])
+        if identificador is None:
+            contar_escaneo('rechazado')
+            resultados[pos] = dict(RECHAZO)
+            continue
+        scanned_at = item.get('scanned_at')
+        if scanned_at is None:
+            scanned_at = int(time.time())
+        elif not es_timestamp(scanned_at):
+            resultados[pos] = {'status': 'error', 'message': 'scanned_at debe ser un timestamp Unix'}
+            continue
+        validos.append((int(scanned_at), pos, dict(item, hash_id=identificador)))
+
+    # 2. Aplicar en orden cronológico dentro de una única transacción
+    validos.sort(key=lambda v: (v[0], v[1]))
+    try:
+        with transaction.atomic():
+            scan_ids = {item['scan_id'] for _, _, item in validos}
+            previos = {
+                e.scan_id: e.resultado
+                for e in EscaneoProcesado.objects.filter(scan_id__in=scan_ids)
+            }
+            nuevos = []
+            for scanned_at, pos, item in validos:
+                scan_id = item['scan_id']
+
+                # Reintento: devolver el resultado original
+                if scan_id in previos:
+                    resultados[pos] = dict(previos[scan_id], duplicado=True)
+                    continue
+
+                hash_id = resolver_hash(item['hash_id'])
+                codigo, ts, nombre = aplicar_escaneo(hash_id, scanned_at, origen=item.get('device_id') or 'lote')
+                respuesta, _ = construir_respuesta(codigo, ts, nombre)
+                previos[scan_id] = respuesta
+                nuevos.append(EscaneoProcesado(
+                    scan_id=scan_id,
+                    device_id=item.get('device_id') or '',
+                    id_hash=hash_id,
+                    scanned_at=scanned_at,
+                    resultado=respuesta,
+                ))
+                resultados[pos] = dict(respuesta, duplicado=False)
+
+            EscaneoProcesado.objects.bulk_create(nuevos)
+    except IntegrityError:
+        # Otro envío del mismo lote se procesó en paralelo: se revierte todo
+        # y el cliente puede reintentar para obtener los resultados guardados.
+        return JsonResponse({'status': 'error', 'message': 'Lote en proceso por otra petición, reintente'}, status=409)
+    except OperationalError as e:
+        # SQLite ocupado por otro escritor (otro lote, el escáner de escritorio):
+        # nada se aplicó, el cliente puede reenviar el lote completo.
+        contar_escaneo('error')
+        if 'locked' in str(e) or 'busy' in str(e):
+            return JsonResponse({'status': 'error', 'message': 'Base de datos ocupada, reintente'}, status=409)
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    except Exception as e:
+        contar_escaneo('error')
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    for pos, item in enumerate(scans):
+        if isinstance(item, dict) and es_texto(item.get('scan_id')):
+            resultados[pos] = dict(resultados[pos], scan_id=item['scan_id'])
+
+    return JsonResponse({'status': 'success', 'results': resultados})
+
+
+@staff_member_required
+def estado_cache_roster(request):
+    """
+    Contadores de la caché negativa del padrón (aciertos/fallos/expulsiones) para dimensionarla.
+    """
+    return JsonResponse(roster.estadisticas())
+
+
+# Estado de la caché del padrón y de /api/eventos/ al momento de cada /metrics
+metricas.Medidor(
+    'asistencia_roster_cache', 'Caché del padrón (core/roster.py): tamaños y contadores acumulados.',
+    lambda: {(clave,): valor for clave, valor in roster.estadisticas().items()}, ('stat',),
+)
+metricas.Medidor(
+    'asistencia_eventos_suscriptores', 'Clientes conectados a /api/eventos/.',
+    lambda: difusor.estadisticas()['suscriptores'],
+)
+
+@require_safe
+def metricas_view(request):
+    """
+    Métricas del proceso en el formato de texto de Prometheus (core/metricas.py).
+    Si settings.METRICAS_TOKEN está definido se exige 'Authorization: Bearer <token>'.
+    """
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    recibido = request.headers.get('Authorization', '').encode()
+    if token and not hmac.compare_digest(recibido, f'Bearer {token}'.encode()):
+        return HttpResponse('Token inválido\n', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(metricas.REGISTRO.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_safe
+@staff_member_required
+def exportar_asistencia(request):
+    """
+    Descarga la asistencia en CSV o JSONL, generada mientras se envía.
+    Parámetros GET opcionales:
+      formato=csv|jsonl, estado=presente|salio|sin_llegar,
+      desde / hasta (timestamp Unix o fecha ISO, hora local) sobre la hora de entrada.
+    """
+    formato = request.GET.get('formato', 'csv')
+    estado = request.GET.get('estado') or None
+    if formato not in exportacion.FORMATOS:
+        return JsonResponse({'status': 'error', 'message': f'formato debe ser uno de {exportacion.FORMATOS}'}, status=400)
+    if estado is not None and estado not in exportacion.ESTADOS:
+        return JsonResponse({'status': 'error', 'message': f'estado debe ser uno de {tuple(exportacion.ESTADOS)}'}, status=400)
+
+    tz_local = pytz.timezone(settings.TIME_ZONE)
+    rango = {}
+    for campo in ('desde', 'hasta'):
+        if request.GET.get(campo):
+            try:
+                rango[campo] = exportacion.parsear_instante(request.GET[campo], tz_local)
+            except ValueError:
+                return JsonResponse({'status': 'error', 'message': f'{campo} inválido'}, status=400)
+
+    queryset = exportacion.filtrar(Asistencia.objects.all(), estado, **rango)
+    tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    respuesta = StreamingHttpResponse(
+        exportacion.exportar(queryset, formato, tz_local),
+        content_type=f'{tipo}; charset=utf-8',
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="asistencia.{formato}"'
+    return respuesta
+
+
+# Ventana por defecto de /api/analitica/ y límites de la serie
+ANALITICA_VENTANA = 24 * 3600
+ANALITICA_INTERVALO = 900
+ANALITICA_MAX_INTERVALOS = 2000
+# Las llegadas por minuto se promedian sobre los últimos RITMO_SEGUNDOS
+RITMO_SEGUNDOS = 900
+
+@require_safe
+@staff_member_required
+def analitica_view(request):
+    """
+    Ocupación actual (conteos de la sesión abierta en 'registro'), ritmo de llegadas reciente,
+    llegadas/salidas por intervalo y percentiles de permanencia.
+    Parámetros GET opcionales: desde / hasta (timestamp Unix o fecha ISO, hora local;
+    por defecto las últimas 24 h) e intervalo (segundos, por defecto 900).
+    """
+    ahora = int(time.time())
+    tz_local = pytz.timezone(settings.TIME_ZONE)
+    try:
+        hasta = exportacion.parsear_instante(request.GET['hasta'], tz_local) if request.GET.get('hasta') else ahora + 1
+        desde = exportacion.parsear_instante(request.GET['desde'], tz_local) if request.GET.get('desde') else hasta - ANALITICA_VENTANA
+        intervalo = int(request.GET.get('intervalo', ANALITICA_INTERVALO))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'desde, hasta o intervalo inválidos'}, status=400)
+    if intervalo < 60 or desde >= hasta or (hasta - desde) / intervalo > ANALITICA_MAX_INTERVALOS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'intervalo >= 60 s, desde < hasta y como mucho {ANALITICA_MAX_INTERVALOS} intervalos',
+        }, status=400)
+
+    llegadas_recientes = analitica.contar(escaneo.ENTRADA, ahora - RITMO_SEGUNDOS, ahora + 1)
+    return JsonResponse({
+        'status': 'success',
+        'generado': ahora,
+        **analitica.totales(),
+        'llegadas_por_minuto': round(llegadas_recientes * 60 / RITMO_SEGUNDOS, 2),
+        'desde': desde,
+        'hasta': hasta,
+        'intervalo': intervalo,
+        'por_intervalo': analitica.por_intervalo(desde, hasta, intervalo),
+        'permanencia': analitica.permanencia(desde, hasta),
+    })
+
+
+# Segundos sin eventos tras los que se envía un comentario (mantiene viva la conexión)
+EVENTOS_PING = 15
+
+_receptor = None
+_receptor_lock = threading.Lock()
+
+def _nombre_asistente(hash_id):
+    # Una búsqueda por clave primaria por evento del escritorio (ritmo humano). Corre en el
+    # hilo del receptor, fuera de toda petición: su conexión respeta CONN_MAX_AGE como la de una vista
+    try:
+        return Asistencia.objects.filter(id_hash=hash_id).values_list('nombre', flat=True).first()
+    except Exception:
+        return None
+    finally:
+        close_old_connections()
+
+def iniciar_receptor_udp():
+    """
+    Arranca (una vez por proceso) el hilo que publica los resultados que envía
+    el escáner de escritorio a EVENTOS_UDP. Si otro proceso ya usa el puerto,
+    este proceso solo difunde sus propios escaneos.
+    """
+    global _receptor
+    direccion = getattr(settings, 'EVENTOS_UDP', None)
+    with _receptor_lock:
+        if _receptor is not None or direccion is None:
+            return
+        try:
+            _receptor = eventos.ReceptorUDP(difusor, direccion, completar=_nombre_asistente)
+        except OSError:
+            _receptor = False
+            return
+        _receptor.start()
+
+@require_safe
+@staff_member_required
+def eventos_view(request):
+    """
+    Server-Sent Events con cada resultado de escaneo (web, lotes y escritorio).
+    Un cliente que se reconecta con Last-Event-ID recibe los eventos recientes que se perdió;
+    si su buffer se llena recibe un evento 'perdidos' y debe refrescar su vista.
+    Bajo ASGI el flujo es un generador async: cada cliente espera en el event loop,
+    no en un hilo.
+    """
+    iniciar_receptor_udp()
+    try:
+        ultimo_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        ultimo_id = None
+
+    def trozos(lista, perdidos):
+        if perdidos:
+            yield f"event: perdidos\ndata: {perdidos}\n\n"
+        if lista:
+            yield ''.join(eventos.formatear_sse(e) for e in lista)
+        elif not perdidos:
+            yield ": ping\n\n"
+
+    def flujo():
+        # WSGI: el flujo ocupa el hilo del servidor mientras el cliente esté conectado
+        sus = difusor.suscribir(ultimo_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                yield from trozos(*sus.esperar(EVENTOS_PING))
+        finally:
+            difusor.cancelar(sus)
+
+    async def flujo_async():
+        # ASGI: Django consume los iteradores síncronos con sync_to_async(list), que con
+        # un flujo infinito nunca entregaría nada; este espera en el event loop
+        sus = difusor.suscribir(ultimo_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                for trozo in trozos(*await sus.esperar_async(EVENTOS_PING)):
+                    yield trozo
+        finally:
+            difusor.cancelar(sus)
+
+    contenido = flujo_async() if isinstance(request, ASGIRequest) else flujo()
+    respuesta = StreamingHttpResponse(contenido, content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
@@ -1,8 +1,9 @@
-import sqlite3
 import qr_generator
-import time
+from core import escaneo, almacenamiento
 
-connection = sqlite3.connect("data.sqlite")
+# same pragmas / busy timeout as the django server (core/almacenamiento.py)
+# check_same_thread=False: main.py runs the queries from its db writer thread
+connection = almacenamiento.conectar("data.sqlite", check_same_thread=False)
 
 cursor = connection.cursor()
 
@@ -12,38 +13,16 @@ def register(name : str , lastName : str, docIC : str) -> bool:
     
     if hashed == "NULL":
         return False
-    cursor.execute("INSERT INTO data (id_hash, time_entry, time_exit) VALUES (?, ?, ?)",
-            (hashed, 0, 0))
+    cursor.execute("INSERT INTO data (id_hash) VALUES (clave_hash(?))", (hashed,))
     connection.commit()
     return True
 
 def entryAction(hashed:str)->tuple:
-    
-    r = cursor.execute("SELECT * FROM data WHERE id_hash = ?", (hashed,))
-    
-    r = r.fetchall()
-    
-    if len(r) == 0:
-        return (-1,0)
-    
-    else:
-        if r[0][1] == 0:
-            t = int(time.time())
-            cursor.execute("UPDATE data SET time_entry = ? WHERE id_hash = ?",
-            (t,hashed))
-            connection.commit()
-            return (1,t)
-        
-        elif r[0][2] == 0:
-            t = int(time.time())
-            cursor.execute("UPDATE data SET time_exit = ? WHERE id_hash = ?",
-            (t,hashed))
-            
-            connection.commit()
-            return (2,t)
-        
-        else:
-            return (0,0)
+    # single INSERT into the append-only log (registro), same state machine as the web API.
+    # needs the schema from `python manage.py migrate` (sesion / registro tables)
+    code, t, _ = escaneo.registrar_escaneo(cursor, hashed)
+    connection.commit()
+    return (code, t)
 
 if __name__ == "__main__":
     print(register("Valentina","Pajares","99999999"))
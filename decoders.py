@@ -0,0 +1,187 @@
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+import sources
+
+# qr decoder backends for the scanner. each one is a callable image -> [result] where
+# every result has the shape of pyzbar's (data bytes, rect x, y, w, h), the only
+# thing gating.DecodeGate reads, so any of them can be plugged into the pipeline.
+# backends whose library is missing are simply not available (see available())
+
+Decoded = namedtuple("Decoded", "data rect")
+
+CALIBRATION_FRAMES = 24     # synthetic frames timed per backend at startup
+MIN_SUCCESS = 0.8           # fraction of calibration frames a backend must read to be picked
+
+
+def _rect(points):
+    return cv2.boundingRect(np.asarray(points, dtype=np.float32).reshape(-1, 2).astype(np.int32))
+
+
+class PyzbarDecoder:
+    # libzbar through pyzbar, limited to qr codes
+    name = "pyzbar"
+
+    def __init__(self):
+        from pyzbar.pyzbar import ZBarSymbol, decode
+        self.decode = decode
+        self.symbols = [ZBarSymbol.QRCODE]
+
+    def __call__(self, image):
+        return self.decode(image, symbols=self.symbols)
+
+
+class OpenCVDecoder:
+    # cv2.QRCodeDetector, no extra dependency
+    name = "opencv"
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetector()
+
+    def __call__(self, image):
+        ok, texts, points, _ = self.detector.detectAndDecodeMulti(image)
+        if not ok:
+            return []
+        return [Decoded(text.encode("utf-8"), _rect(corners)) for text, corners in zip(texts, points) if text]
+
+
+class ArucoDecoder(OpenCVDecoder):
+    # cv2.QRCodeDetectorAruco (opencv >= 4.8): finder patterns located with the aruco detector
+    name = "aruco"
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetectorAruco()
+
+
+class WeChatDecoder:
+    # cv2.wechat_qrcode_WeChatQRCode from the opencv contrib builds (opencv-contrib-python)
+    name = "wechat"
+
+    def __init__(self):
+        self.detector = cv2.wechat_qrcode_WeChatQRCode()
+
+    def __call__(self, image):
+        texts, points = self.detector.detectAndDecode(image)
+        return [Decoded(text.encode("utf-8"), _rect(corners)) for text, corners in zip(texts, points) if text]
+
+
+class ZXingDecoder:
+    # zxing-cpp (pip install zxing-cpp)
+    name = "zxing"
+
+    def __init__(self):
+        import zxingcpp
+        self.read = zxingcpp.read_barcodes
+        self.formats = zxingcpp.BarcodeFormat.QRCode
+
+    def __call__(self, image):
+        results = []
+        for code in self.read(np.ascontiguousarray(image), formats=self.formats):
+            p = code.position
+            corners = [(p.top_left.x, p.top_left.y), (p.top_right.x, p.top_right.y),
+                       (p.bottom_right.x, p.bottom_right.y), (p.bottom_left.x, p.bottom_left.y)]
+            results.append(Decoded(code.bytes, _rect(corners)))
+        return results
+
+
+BACKENDS = {cls.name: cls for cls in (PyzbarDecoder, OpenCVDecoder, ArucoDecoder, WeChatDecoder, ZXingDecoder)}
+
+
+class FallbackDecoder:
+    # asks the next backend only when the previous one found nothing; the gate skips
+    # unchanged frames, so an empty scene does not pay for every backend on each frame
+    def __init__(self, decoders):
+        self.decoders = decoders
+        self.name = "+".join(d.name for d in decoders)
+        self.fallbacks = 0      # frames read by a backend other than the first
+
+    def __call__(self, image):
+        for n, decoder in enumerate(self.decoders):
+            results = decoder(image)
+            if results:
+                self.fallbacks += n > 0
+                return results
+        return []
+
+
+def available():
+    # names of the backends that can be created here
+    names = []
+    for name, cls in BACKENDS.items():
+        try:
+            cls()
+        except (ImportError, AttributeError, OSError, cv2.error):
+            continue
+        names.append(name)
+    return names
+
+
+def create(spec):
+    # "opencv" -> that backend; "zxing+opencv" -> zxing with opencv as fallback
+    names = spec.split("+")
+    for name in names:
+        if name not in BACKENDS:
+            raise ValueError(f"unknown decoder {name!r} (known: {', '.join(BACKENDS)})")
+    decoders = [BACKENDS[name]() for name in names]
+    return decoders[0] if len(decoders) == 1 else FallbackDecoder(decoders)
+
+
+def sample_frames(codes, count=CALIBRATION_FRAMES, size=(640, 480), seed=0, **distortion):
+    # (frame, expected text) pairs: one synthetic badge per frame, with the distortions
+    # of sources.SyntheticSource (rotation, blur, sensor noise)
+    source = sources.SyntheticSource(codes, count=count, size=size, fps=0, hold=1, gap=0, seed=seed, **distortion)
+    frames = []
+    while True:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))   # what DecodeGate passes to the decoder
+    return list(zip(frames, source.shown))
+
+
+Calibration = namedtuple("Calibration", "name ms success false_reads read")
+
+
+def calibrate(names, samples):
+    # times every backend on the samples; returns the results sorted by preference:
+    # the fastest of those reading at least MIN_SUCCESS of the frames, then the rest
+    # by success rate (when none is good enough the one reading the most still wins)
+    results = []
+    for name in names:
+        decoder = create(name)
+        decoder(samples[0][0])      # warm up (lazy model / table loading)
+        read = set()
+        false_reads = 0
+        start = time.perf_counter()
+        for n, (frame, expected) in enumerate(samples):
+            texts = {r.data.decode("utf-8", "replace") for r in decoder(frame)}
+            if expected in texts:
+                read.add(n)
+            false_reads += len(texts - {expected})
+        elapsed = time.perf_counter() - start
+        results.append(Calibration(name, 1000 * elapsed / len(samples), len(read) / len(samples), false_reads,
+                                   frozenset(read)))
+    good = sorted((r for r in results if r.success >= MIN_SUCCESS and not r.false_reads), key=lambda r: r.ms)
+    rest = sorted((r for r in results if r not in good), key=lambda r: (-r.success, r.ms))
+    return good + rest
+
+
+def choose(samples, names=None, fallback=True):
+    # decoder spec for create(): the backend ranked first by calibrate() among the available
+    # ones and, as fallback, the next one reading frames the first missed (none when the
+    # first read them all: every empty frame would pay for both); plus the full ranking
+    ranking = calibrate(names or available(), samples)
+    spec = [ranking[0].name]
+    if fallback:
+        second = next((r for r in ranking[1:] if r.read - ranking[0].read and not r.false_reads), None)
+        if second is not None:
+            spec.append(second.name)
+    return "+".join(spec), ranking
+
+
+def report(ranking):
+    return [f"{r.name:8s} {r.ms:6.1f} ms/frame  read {100 * r.success:5.1f}%  false reads {r.false_reads}"
+            for r in ranking]
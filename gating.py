@@ -0,0 +1,118 @@
+import cv2
+import time
+
+# defaults for the decode gate (see DecodeGate)
+MOTION_SCALE = 0.25         # downscale factor used only for the motion check
+MOTION_THRESHOLD = 4.0      # mean abs diff (0-255) below which a frame counts as unchanged
+MAX_SKIP = 15               # always decode at least every N frames, even if static
+FULL_EVERY = 15             # decode the full frame at least every N decodes, even with a roi
+SETTLE = 8                  # after motion keep decoding the next N frames (the code may still be blurred)
+ROI_MARGIN = 0.5            # roi grows by this fraction of the code size on each side
+
+
+class DecodeGate:
+    # decides if and where a frame is decoded:
+    #  1. grayscale + downscaled copy to detect motion against the last decoded frame
+    #  2. unchanged frames are skipped (the previous codes are still valid), except for
+    #     the `settle` frames right after motion, while a badge is still being held up
+    #  3. once a code is found, only a region of interest around it is decoded;
+    #     if the code is not there anymore the same frame is decoded in full
+    #  4. every full_every decodes (and on every decode forced by max_skip) the full
+    #     frame is decoded anyway, so a second code outside the roi is not missed
+    def __init__(self, decoder, motion_scale=MOTION_SCALE, motion_threshold=MOTION_THRESHOLD,
+                 max_skip=MAX_SKIP, roi_margin=ROI_MARGIN, full_every=FULL_EVERY, settle=SETTLE,
+                 enabled=True):
+        self.decoder = decoder
+        self.motion_scale = motion_scale
+        self.motion_threshold = motion_threshold
+        self.max_skip = max_skip
+        self.roi_margin = roi_margin
+        self.full_every = full_every
+        self.settle = settle
+        self.enabled = enabled
+
+        self._last_small = None
+        self._skipped = 0
+        self._roi = None
+        self._since_full = 0
+        self._settling = 0
+
+        # counters to measure the gate
+        self.frames = 0
+        self.skipped = 0
+        self.roi_decodes = 0
+        self.full_decodes = 0
+        self.decode_time = 0.0
+
+    def process(self, frame):
+        # returns [(data, rect)] or None when the frame was skipped
+        self.frames += 1
+        if not self.enabled:
+            return self._decode(frame, None)
+
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=self.motion_scale, fy=self.motion_scale,
+                           interpolation=cv2.INTER_AREA)
+
+        forced = False
+        if self._last_small is not None and self._last_small.shape == small.shape:
+            diff = cv2.absdiff(small, self._last_small).mean()
+            if diff >= self.motion_threshold:
+                self._settling = self.settle
+            elif self._settling > 0:
+                self._settling -= 1
+            elif self._skipped < self.max_skip:
+                self._skipped += 1
+                self.skipped += 1
+                return None
+            else:
+                forced = True
+
+        self._last_small = small
+        self._skipped = 0
+
+        codes = []
+        if self._roi is not None and not forced and self._since_full < self.full_every:
+            codes = self._decode(gray, self._roi)
+
+        if not codes:
+            codes = self._decode(gray, None)
+
+        self._roi = self._roi_around(codes, gray.shape) if codes else None
+        return codes
+
+    def _decode(self, image, roi):
+        start = time.perf_counter()
+        if roi is None:
+            ox, oy = 0, 0
+            self.full_decodes += 1
+            self._since_full = 0
+        else:
+            ox, oy, x2, y2 = roi
+            image = image[oy:y2, ox:x2]
+            self.roi_decodes += 1
+            self._since_full += 1
+
+        codes = []
+        for i in self.decoder(image):
+            x, y, w, h = i.rect
+            codes.append((i.data.decode("utf-8"), (x + ox, y + oy, w, h)))
+
+        self.decode_time += time.perf_counter() - start
+        return codes
+
+    def _roi_around(self, codes, shape):
+        height, width = shape[:2]
+        x1 = min(x for _, (x, _, _, _) in codes)
+        y1 = min(y for _, (_, y, _, _) in codes)
+        x2 = max(x + w for _, (x, _, w, _) in codes)
+        y2 = max(y + h for _, (_, y, _, h) in codes)
+
+        mx = int((x2 - x1) * self.roi_margin)
+        my = int((y2 - y1) * self.roi_margin)
+        return (max(0, x1 - mx), max(0, y1 - my), min(width, x2 + mx), min(height, y2 + my))
+
+    def summary(self):
+        decoded = self.roi_decodes + self.full_decodes
+        return (f"gate skip {self.skipped}/{self.frames}  roi {self.roi_decodes}/{decoded}  "
+                f"{1000 * self.decode_time / decoded if decoded else 0:.1f} ms/decode")
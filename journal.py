@@ -0,0 +1,324 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from bisect import bisect_left
+
+from core import almacenamiento, escaneo, qr
+
+JOURNAL_PATH = "scans.journal"
+RETRY_MIN = 0.2             # seconds before retrying a locked database
+RETRY_MAX = 5.0
+REFRESH_EVERY = 30.0        # seconds between reloads of the local roster copy
+
+# provisional answer for hashes missing from the local copy (e.g. registered a
+# moment ago): the drain decides and reports the real result through on_result
+PENDING = 3
+# answer for scans the target refused for good (client.py): parked in the .rejected file, never applied
+REJECTED = 4
+
+TYPES = {escaneo.ENTRADA: "entrada", escaneo.SALIDA: "salida", escaneo.COMPLETADO: "completado"}
+
+
+class Journal:
+    # append-only scan journal for the desktop scanner:
+    #  - record() appends the scan to the journal file (fsync) and answers right away
+    #    from a local copy of the roster, so the gate never waits on the database
+    #  - a background thread drains the journal into the database with retry
+    #  - on restart the entries not yet acknowledged are replayed
+    #
+    # each entry carries a scan_id that is stored in escaneo_procesado in the same
+    # transaction as the entry/exit update, so a replay after a crash is not applied twice
+    # (the table is created by `python manage.py migrate`)
+
+    # expected errors, reported in one line (client.py drains over http instead); any
+    # other exception is reported with its traceback. both keep the entries for a retry
+    RETRY_ERRORS = (sqlite3.Error, RuntimeError)
+
+    def __init__(self, connection, path=JOURNAL_PATH, device_id="desktop", on_result=None):
+        self.connection = connection
+        self.path = path
+        self.ack_path = path + ".ack"
+        self.rejected_path = path + ".rejected"
+        self.device_id = device_id
+        self.target = "the database"    # where the entries are drained, for the error messages
+        self.on_result = on_result      # called as on_result(hash, (code, t)) after each drain
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.state = {}         # hash -> [entry, exit] times of the open session (0 = none)
+        self.hashes = []        # sorted hashes of the local copy, to resolve compact badges
+        self.pending = []       # entries not yet in the database
+        self.applied = 0
+        self.retries = 0
+        self.rejected = 0       # entries moved to the .rejected file, shown by main.py
+        self.error = None       # last non-lock database error, shown by main.py
+        self._last_refresh = 0.0
+
+        self._seq = self._read_ack()
+        self._load()
+
+    # -- local state ------------------------------------------------------
+
+    def _load(self):
+        # journal entries after the last ack are still pending
+        acked = self._seq
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break   # torn write at the end of the file
+                    self._seq = max(self._seq, entry["seq"])
+                    if entry["seq"] > acked:
+                        self.pending.append(entry)
+
+        # nothing pending: start a fresh journal file
+        if not self.pending and os.path.exists(self.path):
+            os.remove(self.path)
+
+        # the local copy is needed before the first scan: wait for the database if it is locked
+        delay = RETRY_MIN
+        while not self.refresh():
+            self.retries += 1
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX)
+
+        # pending entries are not in the database yet, apply them on the local copy
+        for entry in self.pending:
+            self._apply_local(entry["hash"], entry["t"])
+
+    def refresh(self):
+        # reload the roster copy from the database (scans from other gates, new attendees)
+        try:
+            # state of the open session from registro, ordered by the primary key index:
+            # the sorted list for resolve() comes for free
+            rows = self.connection.execute(escaneo.SQL_ESTADO + " ORDER BY d.id_hash").fetchall()
+            self.connection.execute("SELECT 1 FROM escaneo_procesado LIMIT 1").fetchall()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                # missing tables are not going to fix themselves: fail loudly
+                raise RuntimeError(f"{e} - run 'python manage.py migrate' on data.sqlite first") from e
+            return False
+
+        with self._lock:
+            # binary-keyed data (core/almacenamiento.py) returns the digest: keep the hex
+            rows = [(almacenamiento.a_texto(h), entry, exit_) for h, entry, exit_ in rows]
+            state = {h: [entry, exit_] for h, entry, exit_ in rows}
+            for entry in self.pending:
+                if entry["hash"] in state:
+                    self._transition(state[entry["hash"]], entry["t"])
+            self.state = state
+            self.hashes = [row[0] for row in rows]
+            self._last_refresh = time.monotonic()
+        return True
+
+    @staticmethod
+    def _transition(row, t):
+        # same state machine as core/escaneo.py, applied in memory
+        if row[0] == 0:
+            row[0] = t
+            return escaneo.ENTRADA
+        if row[1] == 0:
+            row[1] = t
+            return escaneo.SALIDA
+        return escaneo.COMPLETADO
+
+    def _apply_local(self, hashed, t):
+        row = self.state.get(hashed)
+        if row is None:
+            return escaneo.NO_ENCONTRADO
+        return self._transition(row, t)
+
+    def resolve(self, key):
+        # full hash for the prefix of a compact badge (core/qr.py) from the local copy;
+        # an unknown prefix is returned as is, record() journals it and the drain resolves it
+        if not qr.es_prefijo(key):
+            return key
+        with self._lock:
+            i = bisect_left(self.hashes, key)
+            if i < len(self.hashes) and self.hashes[i].startswith(key):
+                return self.hashes[i]
+        return key
+
+    # -- recording --------------------------------------------------------
+
+    def record(self, hashed, payload=None):
+        # same contract as database.entryAction: (code, t)
+        # hashes missing from the local copy are journaled as well and answered with
+        # PENDING; the drain checks them against the database and reports back.
+        # payload is the scanned text, journaled when it is not the hash itself (the
+        # http client sends it to the server, which verifies it again)
+        t = int(time.time())
+        with self._lock:
+            code = self._apply_local(hashed, t)
+            if code == escaneo.COMPLETADO:
+                return (code, 0)
+            if code == escaneo.NO_ENCONTRADO:
+                code = PENDING
+
+            self._seq += 1
+            entry = {"seq": self._seq, "scan_id": uuid.uuid4().hex, "hash": hashed, "t": t}
+            if payload is not None and payload != hashed:
+                entry["payload"] = payload
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.append(entry)
+
+        self._wakeup.set()
+        return (code, t)
+
+    # -- draining ---------------------------------------------------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._drain_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _drain_loop(self):
+        delay = RETRY_MIN
+        while True:
+            try:
+                self.drain()
+                if time.monotonic() - self._last_refresh > REFRESH_EVERY:
+                    self.refresh()
+                delay = RETRY_MIN
+                self.error = None
+            except Exception as e:
+                if self.permanent(e):
+                    # retrying cannot help (e.g. the server refuses this gate): stop draining,
+                    # the entries stay in the journal for the next run
+                    self.error = f"{e} - draining stopped, {len(self.pending)} scans kept in {self.path}"
+                    print(f"journal: {self.target} refused the scans: {self.error}", file=sys.stderr)
+                    break
+                # database locked by the server: keep the entries and retry later;
+                # anything else (missing tables, a full disk for the ack file, a bug)
+                # is reported and retried too: the thread must not die silently
+                if not self.transient(e):
+                    self.error = str(e)
+                    print(f"journal: cannot write to {self.target}: {e}", file=sys.stderr)
+                    if not isinstance(e, self.RETRY_ERRORS):
+                        traceback.print_exc()
+                self.retries += 1
+                if self._stop.wait(delay):
+                    break   # the entries stay in the journal for the next run
+                delay = min(delay * 2, RETRY_MAX)
+                continue
+
+            if self._stop.is_set():
+                break
+
+            self._wakeup.wait(REFRESH_EVERY)
+            self._wakeup.clear()
+
+    def drain(self):
+        # apply every pending entry, one transaction each, oldest first
+        while True:
+            with self._lock:
+                if not self.pending:
+                    break
+                entry = self.pending[0]
+
+            code, t, row, hashed = self._apply_db(entry)
+
+            with self._lock:
+                if row is not None:
+                    # keep the local copy in line with the database, pending entries included
+                    self.state[hashed] = list(row)
+                    for later in self.pending[1:]:
+                        if later["hash"] in (entry["hash"], hashed):
+                            self._transition(self.state[hashed], later["t"])
+                self.pending.pop(0)
+                self.applied += 1
+
+            if self.on_result is not None:
+                self.on_result(entry["hash"], (code, t))
+
+            # the entry is in the database: if the ack fails it is only replayed after a
+            # restart, and escaneo_procesado (scan_id) keeps it from being applied twice
+            with self._lock:
+                self._write_ack(entry["seq"])
+                if not self.pending:
+                    # everything is in the database: truncate the journal
+                    open(self.path, "w").close()
+
+    def transient(self, error):
+        # retried without reporting it
+        return is_locked(error)
+
+    def permanent(self, error):
+        # stops the drain thread instead of retrying
+        return False
+
+    def _apply_db(self, entry):
+        # returns (code, t, row, hash) where row is (entry, exit) of the open session or None if unknown
+        # and hash is the entry's hash, resolved if it was the prefix of a compact badge
+        cur = self.connection.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            hashed = entry["hash"]
+            if qr.es_prefijo(hashed):
+                hashed = escaneo.resolver_prefijo(cur, hashed) or hashed
+            done = cur.execute("SELECT resultado FROM escaneo_procesado WHERE scan_id = ?",
+                               (entry["scan_id"],)).fetchone()
+            if done is None:
+                code, t, _ = escaneo.registrar_escaneo(cur, hashed, entry["t"])
+                if code == escaneo.NO_ENCONTRADO:
+                    result = {"status": "not_found"}
+                else:
+                    result = {"status": "success" if t else "info", "type": TYPES[code]}
+                cur.execute(
+                    "INSERT INTO escaneo_procesado (scan_id, device_id, id_hash, scanned_at, resultado) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (entry["scan_id"], self.device_id, hashed, entry["t"], json.dumps(result)),
+                )
+            else:
+                # already applied before a crash: report what was stored
+                result = json.loads(done[0])
+                codes = {v: k for k, v in TYPES.items()}
+                code = codes.get(result.get("type"), escaneo.NO_ENCONTRADO)
+                t = entry["t"] if code in (escaneo.ENTRADA, escaneo.SALIDA) else 0
+
+            row = cur.execute(escaneo.SQL_ESTADO + " WHERE d.id_hash = clave_hash(?)", (hashed,)).fetchone()
+            row = row and row[1:]
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return code, t, row, hashed
+
+    # -- ack file ---------------------------------------------------------
+
+    def _read_ack(self):
+        try:
+            with open(self.ack_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_ack(self, seq):
+        tmp = self.ack_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(seq))
+        os.replace(tmp, self.ack_path)
+
+
+def is_locked(error):
+    # sqlite reports contention as "database is locked" / "database table is locked" / busy
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
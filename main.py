@@ -1,108 +1,598 @@
+import argparse
 import cv2
-from pyzbar.pyzbar import decode
-import database
+import decoders
+from gating import DecodeGate
+from client import ClientJournal
+from journal import Journal, PENDING, REJECTED
+from core.escaneo import VentanaDuplicados, TIPOS, NO_ENCONTRADO
+from core.eventos import EmisorUDP
+from core import almacenamiento, metricas, qr
 from datetime import datetime
+from collections import OrderedDict
+import functools
+import hashlib
+import math
+import multiprocessing
+import numpy as np
+import os
+import queue
+import signal
+import threading
+import time
+import sources
 
 # vars
-lastScan = ""
-r = (0,0)
+FRAME_QUEUE_SIZE = 2    # frames waiting for decode (older ones are dropped)
+SCAN_QUEUE_SIZE = 32    # decoded codes waiting for the db writer
+RESULTS_SIZE = 64       # db results kept for the overlay (most recent codes)
+RETRY_DELAY = 0.5       # seconds before retrying a scan that failed to record
+DEDUPE_SECONDS = 5      # repeats of a code within this window reuse the previous result (same as DEDUPE_SEGUNDOS)
+EVENTS_UDP = ("127.0.0.1", 8765)    # server's EVENTOS_UDP: results are pushed to /api/eventos/ (None = off)
+METRICS_LOG_SECONDS = 30    # period of the stage timings log line (0 = off)
+ACCEPT_LEGACY = True    # badges with the full 64-hex hash (server's QR_LEGADO); signed compact ones always
+DEVELOPMENT = os.environ.get("DJANGO_DEBUG", "True") == "True"    # same switch as the server's DEBUG: without it QR_CLAVE is required
+DECODER = "auto"        # qr backend (decoders.py); auto = the fastest that reads MIN_SUCCESS of the calibration frames
+DECODER_FALLBACK = True     # auto: a backend that read calibration frames the first missed retries its empty frames
 
-# main
-if __name__ == "__main__":
+# several sources: one process per stream (capture + decode) feeding the shared db writer
+PREVIEW_FPS = 15        # preview tiles sent to the ui per stream and second
+PREVIEW_WIDTH = 1280    # width of the tiled preview window
+
+# decode gate: skip unchanged frames and decode only around the last code found
+GATE = {
+    "enabled": True,
+    "motion_scale": 0.25,
+    "motion_threshold": 4.0,
+    "max_skip": 15,
+    "roi_margin": 0.5,
+    "full_every": 15,
+    "settle": 8,
+}
+
+
+# per-stage timings and scan outcomes (core/metricas.py), summarized by log_metrics
+STAGES = ("capture", "decode", "db")
+STAGE_SECONDS = metricas.Histograma(
+    "asistencia_scanner_stage_seconds",
+    "time per item of each scanner stage: camera read, decode (frames actually decoded), journal write",
+    ("stage",),
+)
+SCANS = metricas.Contador(
+    "asistencia_scanner_scans_total",
+    "scans handled by the desktop scanner by result",
+    ("result",),
+)
+
+
+class StageStats:
+    # counts items processed by a stage and reports a rolling fps
+    def __init__(self, window=1.0):
+        self.window = window
+        self.fps = 0.0
+        self.dropped = 0
+        self._count = 0
+        self._start = time.perf_counter()
+
+    def tick(self):
+        self._count += 1
+        now = time.perf_counter()
+        if now - self._start >= self.window:
+            self.fps = self._count / (now - self._start)
+            self._count = 0
+            self._start = now
+
+
+class Latest:
+    # latest frame / decode / db result shared with the ui thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+        self.codes = []         # [(data, rect)] from the last decoded frame
+        self.results = OrderedDict()    # data -> (code, t), only the last RESULTS_SIZE codes
+        self.error = None       # last error from the db writer
+        self.payloads = {}      # prefix of a compact badge journaled as pending -> scanned text
+
+    def set_result(self, dat, r):
+        # call with the lock held
+        self.results[dat] = r
+        self.results.move_to_end(dat)
+        while len(self.results) > RESULTS_SIZE:
+            self.results.popitem(last=False)
 
-    # vid cap
-    cap = cv2.VideoCapture(0)
 
+def put_latest(q, item, stats):
+    # bounded queue that keeps the newest items: drop the oldest when full
     while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+                stats.dropped += 1
+            except queue.Empty:
+                pass
 
-        # works
+
+def capture_stage(cap, frames, latest, stop, stats):
+    while not stop.is_set():
+        start = time.perf_counter()
         ret, frame = cap.read()
         if not ret:
+            stop.set()
+            break
+        STAGE_SECONDS.observar(time.perf_counter() - start, stage="capture")
+
+        with latest.lock:
+            latest.frame = frame
+
+        put_latest(frames, frame, stats)
+        stats.tick()
+
+
+def decode_stage(frames, scans, latest, stop, stats, gate):
+    inView = set()      # codes already sent while they stay in view
+
+    while not stop.is_set():
+        try:
+            frame = frames.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        # decode qr (None: frame unchanged, the previous codes still apply)
+        start = time.perf_counter()
+        codes = gate.process(frame)
+        stats.tick()
+        if codes is None:
+            continue
+        STAGE_SECONDS.observar(time.perf_counter() - start, stage="decode")
+
+        with latest.lock:
+            latest.codes = codes
+
+        # send a code once when it comes into view (a code dropped on a full queue is sent
+        # again next frame); a badge shown again later is sent again and the db writer's
+        # dedupe window decides if it is a repeat
+        current = set()
+        for dat, _ in codes:
+            if dat not in inView:
+                try:
+                    scans.put_nowait(dat)
+                except queue.Full:
+                    stats.dropped += 1
+                    continue
+            current.add(dat)
+        inView = current
+
+
+def db_stage(scans, latest, stop, stats, journal, window, events):
+    while not stop.is_set() or not scans.empty():
+        try:
+            dat = scans.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        # same code again within the window: show the previous result, nothing is journaled
+        r = window.consultar(dat)
+        if r is not None:
+            SCANS.inc(result="repetido")
+            with latest.lock:
+                latest.set_result(dat, r)
+            stats.tick()
+            continue
+
+        # signed badges are checked offline (core/qr.py, QR_CLAVE): foreign or forged codes
+        # are answered "not found" without touching the journal nor the database
+        hashed = qr.leer_contenido(dat, legado=ACCEPT_LEGACY)
+        if hashed is None:
+            SCANS.inc(result="rechazado")
+            r = (NO_ENCONTRADO, 0)
+            window.guardar(dat, r)
+            with latest.lock:
+                latest.set_result(dat, r)
+            stats.tick()
+            continue
+        hashed = journal.resolve(hashed)
+
+        # journal the scan and answer from the local state, the db write happens in the background
+        try:
+            with STAGE_SECONDS.medir(stage="db"):
+                r = journal.record(hashed, payload=dat)
+        except Exception as e:
+            SCANS.inc(result="error")
+            # keep the writer alive: show the error and try the scan again
+            with latest.lock:
+                latest.error = f"{type(e).__name__}: {e}"
+            if stop.wait(RETRY_DELAY):
+                break
+            try:
+                scans.put_nowait(dat)
+            except queue.Full:
+                stats.dropped += 1
+            continue
+
+        SCANS.inc(result="pendiente" if r[0] == PENDING else TIPOS[r[0]])
+
+        # a provisional answer is not remembered nor published, the drained result replaces it
+        if r[0] != PENDING:
+            window.guardar(dat, r)
+            if events is not None:
+                events.enviar(hashed, TIPOS[r[0]], r[1])
+
+        with latest.lock:
+            latest.error = None
+            latest.set_result(dat, r)
+            if r[0] == PENDING and hashed != dat:
+                latest.payloads[hashed] = dat
+
+        stats.tick()
+
+
+def draw_result(frame, r, x, y, h):
+    # draw response
+    if r[0] == 0:
+        text, color = "Salida ya registrada", (0, 0, 255)
+    elif r[0] == -1:
+        text, color = "Datos no encontrados", (255, 0, 0)
+    elif r[0] == 1:
+        dt = datetime.fromtimestamp(r[1])
+        text, color = f"Entrada registrada {dt.strftime('%Y-%m-%d %H:%M:%S')}", (0, 255, 0)
+    elif r[0] == 2:
+        dt = datetime.fromtimestamp(r[1])
+        text, color = f"Salida registrada  {dt.strftime('%Y-%m-%d %H:%M:%S')}", (0, 255, 0)
+    elif r[0] == PENDING:
+        text, color = "Verificando registro...", (0, 255, 255)
+    elif r[0] == REJECTED:
+        text, color = "Rechazado por el servidor", (0, 0, 255)
+    else:
+        return
+
+    cv2.putText(frame, text, (x - 15, y + h + 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)  # type: ignore
+
+
+def draw_overlay(frame, codes, results):
+    for dat, (x, y, w, h) in codes:
+        cv2.putText(frame, str(dat), (15, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)  # type: ignore
+
+        # highlight qr
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+
+        if dat in results:
+            draw_result(frame, results[dat], x, y, h)
+
+
+def draw_lines(frame, lines, color=(255, 255, 0)):
+    # text lines stacked from the bottom left corner
+    height = frame.shape[0]
+    for n, line in enumerate(lines):
+        y = height - 15 - 20 * (len(lines) - 1 - n)
+        cv2.putText(frame, line, (15, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)  # type: ignore
+
+
+def db_lines(stats, scans, journal, error):
+    lines = [
+        f"db      {stats['db'].fps:5.1f} /s   queue {scans.qsize()}/{SCAN_QUEUE_SIZE}",
+        f"journal {len(journal.pending)} pending  {journal.retries} retries",
+    ]
+    if journal.rejected:
+        lines.append(f"rejected {journal.rejected} scans: see {journal.rejected_path}")
+    if journal.error:
+        lines.append(f"db error: {journal.error}")
+    if error:
+        lines.append(f"scan error: {error}")
+    return lines
+
+
+def draw_stats(frame, stats, frames, scans, gate, journal, error):
+    draw_lines(frame, [
+        gate.summary(),
+        f"capture {stats['capture'].fps:5.1f} fps  drop {stats['capture'].dropped}",
+        f"decode  {stats['decode'].fps:5.1f} fps  queue {frames.qsize()}/{frames.maxsize}",
+    ] + db_lines(stats, scans, journal, error))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="QR attendance scanner")
+    parser.add_argument("--source", nargs="+", default=["0"],
+                        help="camera index, video file, folder of images or 'synthetic'; several sources "
+                             "run one process per stream, one gate each (default: camera 0)")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="pace files / images at this rate (default: the video's own rate, 30 for images; 0 = unpaced)")
+    parser.add_argument("--loop", action="store_true", help="restart the video / images at the end")
+    parser.add_argument("--server", default=None,
+                        help="client mode: send the scans to the scan api at this url (e.g. http://10.0.0.2:8000) "
+                             "instead of writing data.sqlite")
+    parser.add_argument("--device", default="desktop", help="device id sent with each scan (default: desktop)")
+    parser.add_argument("--decoder", default=DECODER,
+                        help="qr decoder: 'auto' times every available backend on synthetic badges at startup, "
+                             f"or one of {', '.join(decoders.BACKENDS)}, or a fallback chain like zxing+opencv "
+                             f"(default: {DECODER})")
+    parser.add_argument("--headless", action="store_true",
+                        help="no window: print the stage stats every second and stop at the end of the source")
+    args = parser.parse_args()
+    if not DEVELOPMENT and not qr.CLAVE_DEFINIDA:
+        # the development key is public: anyone could print badges this scanner accepts
+        parser.error("QR_CLAVE is not set (required when DJANGO_DEBUG is not True)")
+    return args
+
+
+def print_stats(stats, frames, scans, gate, journal, error):
+    line = (f"capture {stats['capture'].fps:5.1f} fps  decode {stats['decode'].fps:5.1f} fps  "
+            f"db {stats['db'].fps:5.1f}/s  drop {stats['capture'].dropped}  | {gate.summary()}  "
+            f"| journal {len(journal.pending)} pending")
+    if journal.error or error:
+        line += f"  | error: {journal.error or error}"
+    print(line, flush=True)
+
+
+def log_metrics(stop, interval, stages=STAGES, label="metrics"):
+    # every `interval` seconds: items, average and p95 (bucket bound) per stage since the last line
+    previous = {stage: STAGE_SECONDS.instantanea(stage=stage) for stage in stages}
+    while not stop.wait(interval):
+        parts = []
+        for stage in stages:
+            current = STAGE_SECONDS.instantanea(stage=stage)
+            count = current[2] - previous[stage][2]
+            if count:
+                average = (current[1] - previous[stage][1]) / count
+                p95 = STAGE_SECONDS.cuantil(0.95, previous[stage], current)
+                parts.append(f"{stage} {count} avg {1000 * average:.1f} ms p95 <={1000 * p95:.0f} ms")
+            else:
+                parts.append(f"{stage} 0")
+            previous[stage] = current
+        print(f"[{datetime.now():%H:%M:%S}] {label} {interval:g}s: " + "  ".join(parts), flush=True)
+
+
+def pick_decoder(spec):
+    # decoder spec for decoders.create; auto: calibration on synthetic badges (~1 s), once
+    # for every stream since they share the machine
+    if spec != "auto":
+        return spec
+    codes = [qr.contenido(hashlib.sha256(f"calibration:{n}".encode()).hexdigest())
+             for n in range(decoders.CALIBRATION_FRAMES)]
+    spec, ranking = decoders.choose(decoders.sample_frames(codes), fallback=DECODER_FALLBACK)
+    print("decoder calibration:\n  " + "\n  ".join(decoders.report(ranking)) + f"\ndecoder: {spec}", flush=True)
+    return spec
+
+
+# -- several sources ------------------------------------------------------
+
+class StreamView:
+    # what the ui knows about one stream, from the updates its process sends
+    def __init__(self, name):
+        self.name = name
+        self.frame = None       # preview tile, codes are scaled to it
+        self.codes = []
+        self.status = {}
+        self.ended = False
+
+
+def stream_worker(index, spec, source_options, decoder_factory, scans, updates, stop, tile):
+    # runs in its own process (its own GIL): capture + decode threads as in the single
+    # source mode; decoded codes go straight to the shared scan queue of the db writer,
+    # the ui gets a preview tile (None when headless) and the stage stats
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # the main process stops everyone
+    cap = sources.open_source(spec, **source_options)
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    latest = Latest()
+    ended = threading.Event()   # set by capture_stage at the end of the source
+    stats = {"capture": StageStats(), "decode": StageStats()}
+    gate = DecodeGate(decoder_factory(), **GATE)
+    workers = [
+        threading.Thread(target=capture_stage, args=(cap, frames, latest, ended, stats["capture"]), daemon=True),
+        threading.Thread(target=decode_stage, args=(frames, scans, latest, ended, stats["decode"], gate), daemon=True),
+    ]
+    if METRICS_LOG_SECONDS:
+        workers.append(threading.Thread(target=log_metrics, args=(ended, METRICS_LOG_SECONDS, ("capture", "decode"),
+                                                                  f"stream {index}"), daemon=True))
+    for t in workers:
+        t.start()
+
+    while not stop.is_set():
+        done = ended.wait(1.0 / PREVIEW_FPS if tile else 1.0)
+        with latest.lock:
+            frame = latest.frame
+            codes = list(latest.codes)
+        preview = None
+        if tile and frame is not None:
+            sx, sy = tile[0] / frame.shape[1], tile[1] / frame.shape[0]
+            preview = cv2.resize(frame, tile, interpolation=cv2.INTER_AREA)
+            codes = [(dat, (int(x * sx), int(y * sy), int(w * sx), int(h * sy))) for dat, (x, y, w, h) in codes]
+        status = {
+            "capture": stats["capture"].fps, "decode": stats["decode"].fps,
+            "dropped": stats["capture"].dropped, "gate": gate.summary(), "ended": done,
+        }
+        if done:
+            updates.put((index, preview, codes, status))    # the last one must arrive
             break
+        try:
+            updates.put_nowait((index, preview, codes, status))
+        except queue.Full:
+            pass    # the ui is behind: it gets the next one
+
+    ended.set()
+    for t in workers:
+        t.join(timeout=2)
+    cap.release()
+
+
+def poll_updates(updates, views):
+    # applies every pending update from the stream processes
+    while True:
+        try:
+            index, preview, codes, status = updates.get_nowait()
+        except queue.Empty:
+            return
+        view = views[index]
+        if preview is not None:
+            view.frame = preview
+        view.codes = codes
+        view.status = status
+        view.ended = status["ended"]
 
-        # decode qr
-        decoded = decode(frame)
-
-        # use the info decoded
-        for i in decoded:
-            dat = i.data.decode("utf-8")
-
-            cv2.putText(
-                frame,  # type: ignore
-                str(dat),
-                (15, 25),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (0, 0, 255),
-                2,
+
+def stream_line(view):
+    s = view.status
+    if not s:
+        return f"{view.name}: starting"
+    return (f"{view.name}: capture {s['capture']:5.1f} fps  decode {s['decode']:5.1f} fps  "
+            f"drop {s['dropped']}{'  ended' if view.ended else ''}")
+
+
+def tile_views(views, results, cols, tile):
+    # mosaic of the previews, each with its codes / results overlay and its stats
+    rows = math.ceil(len(views) / cols)
+    mosaic = np.zeros((rows * tile[1], cols * tile[0], 3), np.uint8)
+    for n, view in enumerate(views):
+        if view.frame is None:
+            continue
+        frame = view.frame.copy()
+        draw_overlay(frame, view.codes, results)
+        draw_lines(frame, [stream_line(view), view.status.get("gate", "")])
+        y, x = divmod(n, cols)
+        mosaic[y * tile[1]:(y + 1) * tile[1], x * tile[0]:(x + 1) * tile[0]] = frame
+    return mosaic
+
+
+# main
+if __name__ == "__main__":
+    args = parse_args()
+
+    # imported here so the pipeline stages above can be reused (bench_scanner.py)
+    # without data.sqlite; the client mode does not use it at all
+    database = None
+    if args.server is None:
+        import database
+
+    # vid cap: camera, video file, folder of images or synthetic badges of registered attendees
+    # (client mode: badges of random hashes, all of them known to standin_server.py)
+    synthetic = {}
+    if "synthetic" in args.source and database is None:
+        synthetic = {"codes": [qr.contenido(hashlib.sha256(f"synthetic:{n}".encode()).hexdigest()) for n in range(100)]}
+    elif "synthetic" in args.source:
+        rows = database.connection.execute("SELECT id_hash FROM data LIMIT 100").fetchall()
+        synthetic = {"codes": [qr.contenido(almacenamiento.a_texto(row[0])) for row in rows] or ["0" * 64]}
+    multi = len(args.source) > 1
+    decoder = pick_decoder(args.decoder)
+
+    # several sources: the decode processes put their codes on a process-safe queue
+    scans = multiprocessing.Queue(maxsize=SCAN_QUEUE_SIZE) if multi else queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    latest = Latest()
+    stop = threading.Event()
+    stats = {"capture": StageStats(), "decode": StageStats(), "db": StageStats()}
+    window = VentanaDuplicados(DEDUPE_SECONDS)
+    # client mode: the server publishes the scans it applies itself
+    events = EmisorUDP(EVENTS_UDP) if EVENTS_UDP and database is not None else None
+
+    # drained results replace the provisional answer shown for that code
+    def on_result(hashed, r):
+        with latest.lock:
+            dat = latest.payloads.pop(hashed, hashed)
+            previous = latest.results.get(dat)
+            latest.set_result(dat, r)
+        if events is not None and previous is not None and previous[0] == PENDING:
+            events.enviar(hashed, TIPOS[r[0]], r[1])
+
+    # replays scans left in the journal by a previous run, then keeps draining it
+    # (into data.sqlite, or in batches to the server's api in client mode)
+    if database is None:
+        journal = ClientJournal(args.server, device_id=args.device, on_result=on_result)
+    else:
+        journal = Journal(database.connection, device_id=args.device, on_result=on_result)
+    journal.start()
+
+    # one db writer for every stream: the journal, the dedupe window and the results are shared
+    workers = [
+        threading.Thread(target=db_stage, args=(scans, latest, stop, stats["db"], journal, window, events), daemon=True),
+    ]
+    if METRICS_LOG_SECONDS:
+        workers.append(threading.Thread(target=log_metrics, args=(stop, METRICS_LOG_SECONDS, STAGES if not multi else ("db",)),
+                                        daemon=True))
+
+    if not multi:
+        # capture -> decode -> db writer, each stage in its own thread
+        cap = sources.open_source(args.source[0], fps=args.fps, loop=args.loop, **synthetic)
+        frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        gate = DecodeGate(decoders.create(decoder), **GATE)
+        workers += [
+            threading.Thread(target=capture_stage, args=(cap, frames, latest, stop, stats["capture"]), daemon=True),
+            threading.Thread(target=decode_stage, args=(frames, scans, latest, stop, stats["decode"], gate), daemon=True),
+        ]
+    else:
+        # capture -> decode in one process per stream, previews tiled in a single window
+        cols = math.ceil(math.sqrt(len(args.source)))
+        tile = None if args.headless else (PREVIEW_WIDTH // cols, PREVIEW_WIDTH // cols * 3 // 4)
+        updates = multiprocessing.Queue(maxsize=4 * len(args.source))
+        stop_streams = multiprocessing.Event()
+        views = [StreamView(f"{n} {spec}") for n, spec in enumerate(args.source)]
+        streams = [
+            multiprocessing.Process(
+                target=stream_worker, daemon=True,
+                args=(n, spec, dict(synthetic, fps=args.fps, loop=args.loop, seed=n),
+                      functools.partial(decoders.create, decoder),
+                      scans, updates, stop_streams, tile),
             )
+            for n, spec in enumerate(args.source)
+        ]
+        for p in streams:
+            p.start()
+
+    for t in workers:
+        t.start()
 
+    # headless: stats on stdout until the sources end (or ctrl-c)
+    while args.headless and not stop.is_set():
+        try:
+            stop.wait(1.0)
+        except KeyboardInterrupt:
+            break
+        if not multi:
+            print_stats(stats, frames, scans, gate, journal, latest.error)
+            continue
+        poll_updates(updates, views)
+        for view in views:
+            print(stream_line(view) + "  | " + view.status.get("gate", ""), flush=True)
+        print("  ".join(db_lines(stats, scans, journal, latest.error)), flush=True)
+        if all(view.ended for view in views):
+            break
+
+    # ui: always render the newest frame with the newest decode/db overlay
+    while not args.headless and not stop.is_set():
+        with latest.lock:
+            frame = None if multi or latest.frame is None else latest.frame.copy()
+            codes = list(latest.codes)
+            results = dict(latest.results)
+            error = latest.error
+
+        if multi:
+            poll_updates(updates, views)
+            frame = tile_views(views, results, cols, tile)
+            draw_lines(frame, db_lines(stats, scans, journal, error), (0, 255, 255))
+            if all(view.ended for view in views):
+                break
+        elif frame is not None:
+            draw_overlay(frame, codes, results)
+            draw_stats(frame, stats, frames, scans, gate, journal, error)
 
-            # send only one signal
-            if lastScan != dat:
-                lastScan = dat
-                
-                # execute db query
-                r = database.entryAction(dat)
-
-                # highlight qr
-            (x, y, w, h) = i.rect
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-
-                # draw response
-            if r[0] == 0:
-                cv2.putText(
-                    frame,  # type: ignore
-                    str("Salida ya registrada"),
-                    (x- 15, y + h + 25),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (0, 0, 255),
-                    2,
-                )
-
-            elif r[0] == -1:
-                cv2.putText(
-                    frame,  # type: ignore
-                    str(f"Datos no encontrados"),
-                    (x- 15, y + h + 25),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (255, 0, 0),
-                    2,
-                )
-
-            elif r[0] == 1:
-                dt = datetime.fromtimestamp(r[1])
-                cv2.putText(
-                    frame,  # type: ignore
-                    str(f"Entrada registrada {dt.strftime("%Y-%m-%d %H:%M:%S")}"),
-                    (x- 15, y + h + 25),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (0, 255, 0),
-                    2,
-                )
-
-            elif r[0] == 2:
-                dt = datetime.fromtimestamp(r[1])
-                cv2.putText(
-                    frame,  # type: ignore
-                    str(f"Salida registrada  {dt.strftime("%Y-%m-%d %H:%M:%S")}"),
-                    (x- 15, y + h + 25),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (0, 255, 0),
-                    2,
-                )
         # cv2 show
-        cv2.imshow("Scanner", frame)
+        if frame is not None:
+            cv2.imshow("Scanner", frame)
 
         # quit
         if cv2.waitKey(1) & 0xFF == ord("q"):
             break
 
     # cleanup
-    cap.release()
-    cv2.destroyAllWindows()
+    if multi:
+        stop_streams.set()
+        for p in streams:
+            p.join(timeout=3)
+    # the db writer empties the scan queue before stopping
+    stop.set()
+    for t in workers:
+        t.join(timeout=2)
+    journal.stop()
+    if not multi:
+        cap.release()
+    if not args.headless:
+        cv2.destroyAllWindows()
@@ -1,14 +1,17 @@
-import qrcode
-import time
-import hashlib
+import os
+import shutil
+from core import qr
+
+# same on-disk cache as the django server (settings.QR_DIR): <hash>-<params>.png
+QR_DIR = "./qr"
 
 def generate(str1 :str, str2: str , str3:str ) -> str:
     try:
-        toHash = str1+str2+str3
-        hashed = hashlib.sha256(toHash.encode()).hexdigest() 
-        qrcode.make(hashed).save(f"./out/{time.time_ns()}.jpg") # pyright: ignore[reportArgumentType]
-        qrcode.make(hashed).save("latest.jpg") # pyright: ignore[reportArgumentType]
+        hashed = qr.generar_hash(str1, str2, str3)
+        # rendered once per hash, re-issuing a badge reuses the cached png
+        os.makedirs(QR_DIR, exist_ok=True)
+        qr.guardar_png(QR_DIR, hashed)
+        shutil.copyfile(qr.ruta_png(QR_DIR, hashed), "latest.png")
         return hashed
     except Exception:
         return "NULL"
-
@@ -0,0 +1,195 @@
+import glob
+import os
+import random
+import time
+
+import cv2
+import numpy as np
+import qrcode
+
+# frame sources for main.py: all of them follow the cv2.VideoCapture contract
+# used by capture_stage (read() -> (ok, frame), release()), so the pipeline runs
+# the same with a camera, a video file, a folder of images or synthetic frames
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+class Pacer:
+    # sleeps so frames come out at `fps` like a real camera (fps 0 = as fast as possible)
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self._next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self._next is None or now - self._next > self.interval:
+            self._next = now    # fell behind: do not burst to catch up
+        elif self._next > now:
+            time.sleep(self._next - now)
+        self._next += self.interval
+
+
+class VideoSource:
+    # video file (or camera index) read with cv2; a file is paced at `fps` (default: its own rate)
+    def __init__(self, path, fps=None, loop=False):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise OSError(f"cannot open video source {path!r}")
+        if fps is None and not isinstance(path, int):
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 0
+        self.pacer = Pacer(fps or 0)
+
+    def read(self):
+        ok, frame = self.cap.read()
+        if not ok and self.loop and not isinstance(self.path, int):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        self.pacer.wait()
+        return ok, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource:
+    # images of a folder in name order, each one repeated `repeat` times (a badge held in view)
+    def __init__(self, path, fps=30, repeat=1, loop=False):
+        self.files = sorted(f for f in glob.glob(os.path.join(path, "*"))
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise OSError(f"no images in {path!r}")
+        self.repeat = max(1, repeat)
+        self.loop = loop
+        self.pacer = Pacer(fps)
+        self._n = 0
+        self._current = None
+
+    def read(self):
+        index, shown = divmod(self._n, self.repeat)
+        if index >= len(self.files):
+            if not self.loop:
+                return False, None
+            self._n = index = shown = 0
+        if shown == 0 or self._current is None:
+            self._current = cv2.imread(self.files[index])
+        self._n += 1
+        self.pacer.wait()
+        return self._current is not None, self._current
+
+    def release(self):
+        pass
+
+
+class SyntheticSource:
+    # generated frames: badges (QR of `codes`) held in front of the camera for `hold` frames,
+    # separated by `gap` empty frames, with random position, rotation, blur and sensor noise.
+    # `shown` lists the codes in the order they appeared and `appeared` when (perf_counter),
+    # to measure the scan success rate and how long a badge waits to be read.
+    #
+    # each appearance is rendered once (rotation + blur) and every frame only adds one of
+    # NOISE_FIELDS precomputed noise patterns, so generating frames costs ~1 ms and the
+    # benchmark measures the scanner, not the generator.
+    NOISE_FIELDS = 8
+
+    def __init__(self, codes, count=None, size=(640, 480), fps=30, hold=15, gap=10,
+                 module_px=(3, 5), rotation=15.0, blur=1.0, noise=8.0, seed=0, badge_px=None):
+        self.codes = list(codes)
+        self.count = count if count is not None else len(self.codes)
+        self.width, self.height = size
+        self.hold = hold
+        self.gap = gap
+        self.module_px = module_px
+        self.badge_px = badge_px    # (min, max) side of the printed badge: overrides module_px
+        self.rotation = rotation
+        self.blur = blur
+        self.pacer = Pacer(fps)
+        self.random = random.Random(seed)
+        generator = np.random.default_rng(seed)
+
+        self.background = np.full((self.height, self.width, 3), 170, np.uint8)
+        self.background[:] += generator.integers(0, 40, (1, self.width, 1), dtype=np.uint8)
+        self.noise = [
+            generator.normal(0, noise, (self.height, self.width, 3)).astype(np.int16)
+            for _ in range(self.NOISE_FIELDS)
+        ] if noise else None
+
+        self.shown = []
+        self.appeared = []
+        self.frames = 0
+        self._clean = None
+
+    def _render(self, code):
+        # badge at a random spot, rotated and blurred, on the background
+        box = self.random.randint(*self.module_px)
+        qr = qrcode.QRCode(border=4, box_size=box)
+        qr.add_data(code)
+        qr.make(fit=True)
+        modules = qr.modules_count + 2 * qr.border
+        if self.badge_px:
+            # same badge size whatever the qr version: fewer modules -> bigger modules
+            qr.box_size = max(1, self.random.randint(*self.badge_px) // modules)
+        # the rotated badge needs 1.5x its side: shrink the modules so it fits the frame
+        # whole (a cropped qr is unreadable and would count as a scanner miss)
+        fits = int(min(self.width, self.height) / 1.5) // modules
+        if fits < 1:
+            raise ValueError(f"a {modules}-module badge does not fit a {self.width}x{self.height} frame")
+        qr.box_size = min(qr.box_size, fits)
+        badge = np.array(qr.make_image().get_image().convert("L"))
+
+        side = badge.shape[0]
+        angle = self.random.uniform(-self.rotation, self.rotation)
+        diagonal = int(side * 1.5)
+        canvas = np.full((diagonal, diagonal), 255, np.uint8)
+        offset = (diagonal - side) // 2
+        canvas[offset:offset + side, offset:offset + side] = badge
+        matrix = cv2.getRotationMatrix2D((diagonal / 2, diagonal / 2), angle, 1.0)
+        canvas = cv2.warpAffine(canvas, matrix, (diagonal, diagonal), borderValue=255)
+        if self.blur:
+            canvas = cv2.GaussianBlur(canvas, (0, 0), self.blur)
+
+        frame = self.background.copy()
+        x = self.random.randint(0, self.width - diagonal)
+        y = self.random.randint(0, self.height - diagonal)
+        frame[y:y + diagonal, x:x + diagonal] = cv2.cvtColor(canvas, cv2.COLOR_GRAY2BGR)
+        return frame
+
+    def read(self):
+        period = self.hold + self.gap
+        index, step = divmod(self.frames, period)
+        if index >= self.count:
+            return False, None
+
+        if step == 0:
+            code = self.codes[index % len(self.codes)]
+            self._clean = self._render(code)
+            self.shown.append(code)
+        clean = self._clean if step < self.hold else self.background
+        self.frames += 1
+
+        if self.noise is None:
+            frame = clean.copy()
+        else:
+            noise = self.noise[self.frames % self.NOISE_FIELDS]
+            frame = np.clip(clean.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        self.pacer.wait()
+        if step == 0:
+            self.appeared.append(time.perf_counter())
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def open_source(spec, fps=None, loop=False, **synthetic):
+    # "0", "1"... camera index; "synthetic" generated frames; a folder of images; else a video file
+    if spec.isdigit():
+        return VideoSource(int(spec))
+    if spec == "synthetic":
+        return SyntheticSource(fps=30 if fps is None else fps, **synthetic)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, fps=30 if fps is None else fps, loop=loop)
+    return VideoSource(spec, fps=fps, loop=loop)
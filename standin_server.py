@@ -0,0 +1,147 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import qr
+
+# stand-in for the django scan api, to try the client mode of the desktop scanner
+# (main.py --server, client.py) without the server nor data.sqlite. it answers
+# /api/procesar-qr/batch/ with the same json, verifies the codes offline like the
+# server (QR_CLAVE) and applies the same entry -> exit state machine in memory.
+# every valid code is a registered attendee unless --unknown says otherwise.
+# --delay and --busy simulate a slow server and "database is locked" answers (409)
+
+BATCH_PATH = "/api/procesar-qr/batch/"
+MAX_BATCH = 500     # same limit as the server (MAX_LOTE)
+
+
+class StandIn:
+    def __init__(self, delay=0.0, busy=0.0, unknown=0.0, seed=0):
+        self.delay = delay
+        self.busy = busy
+        self.unknown = unknown
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.scans = {}         # hash (or compact prefix) -> number of scans applied
+        self.done = {}          # scan_id -> result, like escaneo_procesado
+        self.requests = 0
+        self.connections = 0
+        self.applied = 0
+
+    def known(self, key):
+        # a fixed fraction of the codes is "not registered", always the same ones
+        return self.unknown <= 0 or random.Random(key).random() >= self.unknown
+
+    def apply(self, item):
+        key = qr.leer_contenido(item["hash_id"])
+        if key is None:
+            return {"status": "not_found", "message": "Código QR no válido"}
+        if not self.known(key):
+            return {"status": "not_found", "message": "Usuario no encontrado en base de datos"}
+        count = self.scans.get(key, 0)
+        if count >= 2:
+            return {"status": "info", "type": "completado", "message": "Ciclo completado"}
+        self.scans[key] = count + 1
+        self.applied += 1
+        tipo = "entrada" if count == 0 else "salida"
+        return {"status": "success", "type": tipo, "message": f"{tipo} {item.get('scanned_at')}"}
+
+    def batch(self, body):
+        # (status, json) for a POST to the batch api
+        scans = body.get("scans") if isinstance(body, dict) else None
+        if not isinstance(scans, list) or not scans or len(scans) > MAX_BATCH:
+            return 400, {"status": "error", "message": "Lista de escaneos no proporcionada"}
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            if self.random.random() < self.busy:
+                return 409, {"status": "error", "message": "Base de datos ocupada, reintente"}
+            # applied in scanned_at order, answered in the order received (like the server)
+            results = [None] * len(scans)
+            for n in sorted(range(len(scans)), key=lambda n: self.scanned_at(scans[n])):
+                item = scans[n]
+                if not isinstance(item, dict) or not item.get("hash_id") or not item.get("scan_id"):
+                    results[n] = {"status": "error", "message": "Se requieren hash_id y scan_id"}
+                    continue
+                if item["scan_id"] in self.done:
+                    results[n] = dict(self.done[item["scan_id"]], duplicado=True)
+                else:
+                    self.done[item["scan_id"]] = self.apply(item)
+                    results[n] = dict(self.done[item["scan_id"]], duplicado=False)
+                results[n]["scan_id"] = item["scan_id"]
+        return 200, {"status": "success", "results": results}
+
+    @staticmethod
+    def scanned_at(item):
+        value = item.get("scanned_at") if isinstance(item, dict) else None
+        return value if isinstance(value, (int, float)) else 0
+
+
+def make_handler(standin):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 with Content-Length: the connection stays open between requests;
+        # without nagle the body (a second write) does not wait for the client's delayed ack
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with standin.lock:
+                standin.connections += 1
+
+        def do_POST(self):
+            with standin.lock:
+                standin.requests += 1
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                status, answer = 400, {"status": "error", "message": "JSON inválido"}
+            else:
+                if self.path.rstrip("/") == BATCH_PATH.rstrip("/"):
+                    status, answer = standin.batch(body)
+                else:
+                    status, answer = 404, {"status": "error", "message": "not found"}
+            data = json.dumps(answer).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8001, **options):
+    # starts the stand-in in a background thread; returns (server, standin)
+    standin = StandIn(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(standin))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, standin
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stand-in for the scan batch api (client mode tests)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to each batch")
+    parser.add_argument("--busy", type=float, default=0.0, help="fraction of batches answered 409 (retry)")
+    parser.add_argument("--unknown", type=float, default=0.0, help="fraction of valid codes not registered")
+    args = parser.parse_args()
+
+    server, standin = serve(args.host, args.port, delay=args.delay, busy=args.busy, unknown=args.unknown)
+    print(f"stand-in scan api on http://{args.host}:{args.port}{BATCH_PATH} (ctrl-c to stop)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{standin.requests} requests, {standin.connections} connections, "
+                  f"{standin.applied} scans applied, {len(standin.done)} scan ids", flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()